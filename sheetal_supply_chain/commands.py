@@ -0,0 +1,81 @@
+import click
+from frappe.commands import pass_context
+from frappe.exceptions import SiteNotSpecifiedError
+
+
+# ! Regenerate the Milk Quality Snapshot table from the Milk Quality Ledger
+@click.command("rebuild-milk-quality-snapshot")
+@pass_context
+def rebuild_milk_quality_snapshot(context):
+	"""Rebuild the latest FAT/SNF snapshot per item, warehouse and batch"""
+	import frappe
+
+	from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+		rebuild_milk_quality_snapshots,
+	)
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			rebuild_milk_quality_snapshots()
+			frappe.db.commit()
+			click.echo(f"Milk Quality Snapshot rebuilt for {site}")
+		finally:
+			frappe.destroy()
+
+	if not context.sites:
+		raise SiteNotSpecifiedError
+
+
+# ! Replay the Milk Quality Ledger in posting order to recompute blended FAT/SNF on every entry
+@click.command("backfill-milk-quality-blend")
+@click.option("--item", "item_code", help="Only replay this item")
+@click.option("--warehouse", help="Only replay this warehouse")
+@pass_context
+def backfill_milk_quality_blend(context, item_code=None, warehouse=None):
+	"""Recompute weighted-average FAT/SNF after each Milk Quality Ledger Entry"""
+	import frappe
+
+	from sheetal_supply_chain.py.milk_blending import backfill_quality_blend
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			backfill_quality_blend(item_code=item_code, warehouse=warehouse)
+			frappe.db.commit()
+			click.echo(f"Milk quality blend backfilled for {site}")
+		finally:
+			frappe.destroy()
+
+	if not context.sites:
+		raise SiteNotSpecifiedError
+
+
+# ! Regenerate the Quality Inspection Fact table from submitted Quality Inspections
+@click.command("rebuild-quality-inspection-facts")
+@pass_context
+def rebuild_quality_inspection_facts(context):
+	"""Backfill one pre-pivoted reading row per submitted Quality Inspection"""
+	import frappe
+
+	from sheetal_supply_chain.sheetal_supply_chain.doctype.quality_inspection_fact.quality_inspection_fact import (
+		rebuild_quality_inspection_facts,
+	)
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			rebuild_quality_inspection_facts()
+			frappe.db.commit()
+			click.echo(f"Quality Inspection Fact rebuilt for {site}")
+		finally:
+			frappe.destroy()
+
+	if not context.sites:
+		raise SiteNotSpecifiedError
+
+
+commands = [rebuild_milk_quality_snapshot, backfill_milk_quality_blend, rebuild_quality_inspection_facts]
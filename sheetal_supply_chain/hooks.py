@@ -157,12 +157,19 @@ doctype_js = {
 doc_events = {
 	"Quality Inspection": {
 		"on_update": "sheetal_supply_chain.py.quality_inspection.qi_reading",
-		"on_submit": "sheetal_supply_chain.py.quality_inspection.create_mqle_on_qi_submit",
-		"on_cancel": "sheetal_supply_chain.py.quality_inspection.cancel_mqle_on_qi_cancel",
+		"on_submit": [
+			"sheetal_supply_chain.py.quality_inspection.create_mqle_on_qi_submit",
+			"sheetal_supply_chain.py.quality_inspection.sync_qi_fact",
+		],
+		"on_cancel": [
+			"sheetal_supply_chain.py.quality_inspection.cancel_mqle_on_qi_cancel",
+			"sheetal_supply_chain.py.quality_inspection.sync_qi_fact",
+		],
 	},
 	"Purchase Receipt": {
+		"onload": "sheetal_supply_chain.py.purchase_receipt.set_milk_rate_card_onload",
 		"before_save": "sheetal_supply_chain.py.purchase_receipt.validate_milk_type_with_supplier_profile",
-		"on_submit": "sheetal_supply_chain.py.purchase_receipt.create_mqle_on_pr_submit",
+		"on_submit": "sheetal_supply_chain.py.milk_quality_ledger.post_mqle_on_submit",
   		"on_cancel": "sheetal_supply_chain.py.purchase_receipt.cancel_mqle_on_pr_cancel",
       	"validate": [
            "sheetal_supply_chain.py.purchase_receipt.set_milk_pricing_on_items",
@@ -173,12 +180,11 @@ doc_events = {
 
 	"Stock Entry": {
 		"on_submit": [
-      					"sheetal_supply_chain.py.stock_entry.create_mqle_on_se_submit",
-						"sheetal_supply_chain.py.stock_entry.create_mqle_for_raw_materials",
-						"sheetal_supply_chain.py.stock_entry.create_mqle_for_raw_materials_issue",
+      					"sheetal_supply_chain.py.milk_quality_ledger.post_mqle_on_submit",
       					"sheetal_supply_chain.py.stock_entry.generate_production_order",
                 	 ],
     	"on_cancel": "sheetal_supply_chain.py.stock_entry.cancel_mqle_on_se_cancel",
+    	"validate": "sheetal_supply_chain.py.stock_entry.validate_only_one_item_warehouse",
     	"before_save": [
          "sheetal_supply_chain.py.stock_entry.fetch_bom_fat_snf_for_manufacture",
          "sheetal_supply_chain.py.stock_entry.set_stock_entry_totals",
@@ -206,6 +212,13 @@ doc_events = {
  
      "Item": {
     	"autoname": "sheetal_supply_chain.py.item.set_item_series",
+    	"on_update": "sheetal_supply_chain.py.uom_conversion.clear_uom_conversion_cache",
+    	"on_trash": "sheetal_supply_chain.py.uom_conversion.clear_uom_conversion_cache",
+    },
+
+    "Supplier": {
+    	"on_update": "sheetal_supply_chain.py.milk_pricing.clear_supplier_rate_cards",
+    	"on_trash": "sheetal_supply_chain.py.milk_pricing.clear_supplier_rate_cards",
     },
 
 }
@@ -231,6 +244,13 @@ doc_events = {
 # 	],
 # }
 
+scheduler_events = {
+	"hourly_long": [
+		"sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_repost.milk_quality_repost.process_milk_quality_reposts",
+		"sheetal_supply_chain.py.milk_quality_ledger.reconcile_missing_mqle",
+	],
+}
+
 # Testing
 # -------
 
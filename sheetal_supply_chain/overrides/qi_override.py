@@ -3,6 +3,19 @@ import json
 from frappe.utils import flt
 from frappe import _
 from erpnext.controllers.stock_controller import make_quality_inspections as erp_make_qi
+from frappe.utils import now_datetime
+from sheetal_supply_chain.py.naming import allocate_series_names
+
+# Template parameter fields copied onto Quality Inspection Reading rows
+TEMPLATE_READING_FIELDS = [
+    "specification",
+    "value",
+    "numeric",
+    "min_value",
+    "max_value",
+    "formula_based_criteria",
+    "acceptance_formula",
+]
 
 
 @frappe.whitelist()
@@ -22,7 +35,7 @@ def make_quality_inspections(doctype, docname, items, inspection_type):
 
         if isinstance(items, str):
             items = json.loads(items)
-            
+
                 # Fetch Stock Entry doc to read finished item warehouse
         se_doc = frappe.get_doc("Stock Entry", docname)
 
@@ -32,8 +45,8 @@ def make_quality_inspections(doctype, docname, items, inspection_type):
             if row.is_finished_item:
                 finished_item_warehouse = row.t_warehouse
                 break
-            
-            
+
+
         inspections = []
         for item in items:
 
@@ -52,11 +65,9 @@ def make_quality_inspections(doctype, docname, items, inspection_type):
                 "custom_warehouse": finished_item_warehouse,
             }
 
-            qi = frappe.get_doc(qi_doc)
-            qi.save()
-            inspections.append(qi.name)
+            inspections.append(qi_doc)
 
-        return inspections
+        return insert_quality_inspections(inspections)
 
     # -------------------------
     #  CASE 2: PURCHASE RECEIPT
@@ -68,6 +79,9 @@ def make_quality_inspections(doctype, docname, items, inspection_type):
         # get full PR doc
         pr_doc = frappe.get_doc("Purchase Receipt", docname)
 
+        # PR Item name → warehouse, built once for all requested items
+        warehouse_by_row = {pr_item.name: pr_item.warehouse for pr_item in pr_doc.items}
+
         inspections = []
         for item in items:
 
@@ -81,12 +95,7 @@ def make_quality_inspections(doctype, docname, items, inspection_type):
                 )
 
             # find warehouse using child_row_reference → PR Item name
-            warehouse = None
-            if item.get("child_row_reference"):
-                for pr_item in pr_doc.items:
-                    if pr_item.name == item.get("child_row_reference"):
-                        warehouse = pr_item.warehouse
-                        break
+            warehouse = warehouse_by_row.get(item.get("child_row_reference"))
 
             qi_doc = {
                 "doctype": "Quality Inspection",
@@ -100,18 +109,149 @@ def make_quality_inspections(doctype, docname, items, inspection_type):
                 "item_serial_no": item.get("serial_no").split("\n")[0] if item.get("serial_no") else None,
                 "batch_no": item.get("batch_no"),
                 "child_row_reference": item.get("child_row_reference"),
-                "custom_warehouse": warehouse,   
-                "custom_supplier_code": pr_doc.custom_supplier_code,  
+                "custom_warehouse": warehouse,
+                "custom_supplier_code": pr_doc.custom_supplier_code,
 
             }
 
-            qi = frappe.get_doc(qi_doc)
-            qi.save()
-            inspections.append(qi.name)
+            inspections.append(qi_doc)
 
-        return inspections
+        return insert_quality_inspections(inspections)
 
     # -------------------------
     #  CASE 3: ALL OTHER DOCTYPES → USE DEFAULT
     # -------------------------
     return erp_make_qi(doctype, docname, items, inspection_type)
+
+
+# ! Create draft Quality Inspections of one request with one insert per table
+def insert_quality_inspections(qi_docs):
+    """
+    Batched replacement for frappe.get_doc(qi_doc).save() per inspection.
+
+    Template readings of all items are loaded once and names come from one
+    naming series block. Each inspection goes through the checks of
+    insert() in memory (link checks, before_insert, validate hooks,
+    mandatory and length checks), all inspections and readings are written
+    with one multi-row insert each, and the after_insert and post-save
+    methods of insert() run last.
+    Returns the names in the order of `qi_docs`.
+    """
+    if not qi_docs:
+        return []
+
+    frappe.has_permission("Quality Inspection", "create", throw=True)
+
+    templates = get_item_inspection_templates([d.get("item_code") for d in qi_docs])
+    template_readings = get_template_readings(set(templates.values()))
+
+    inspections = []
+    for qi_doc in qi_docs:
+        qi = frappe.new_doc("Quality Inspection")
+        qi.update(qi_doc)
+
+        # Readings from the preloaded template, so validate() does not look them up again
+        qi.quality_inspection_template = templates.get(qi.item_code)
+        for reading in template_readings.get(qi.quality_inspection_template, []):
+            qi.append("readings", {**reading, "status": "Accepted"})
+
+        inspections.append(qi)
+
+    naming_series = inspections[0].naming_series or frappe.get_meta("Quality Inspection").get_field("naming_series").options.split("\n")[0]
+    names = allocate_series_names(naming_series, len(inspections))
+
+    user = frappe.session.user
+    now = now_datetime()
+
+    parent_rows, child_rows = [], []
+    for qi, name in zip(inspections, names, strict=True):
+        qi.name = name
+        qi.owner = qi.modified_by = user
+        qi.creation = qi.modified = now
+        qi.docstatus = 0
+
+        # Same steps, in the same order, as Document.insert() up to the write
+        # (create permission is checked once for the whole batch above)
+        qi.set("__islocal", True)
+        qi.check_if_latest()  # nothing to compare on a new doc, but sets _action = "save"
+        qi._validate_links()
+        qi.run_method("before_insert")
+        qi.set_parent_in_children()
+        qi.flags.in_insert = True
+        qi.run_before_save_methods()
+        qi._validate()
+        qi.flags.in_insert = False
+
+        parent_rows.append(qi.get_valid_dict(convert_dates_to_str=True))
+        for idx, reading in enumerate(qi.readings, start=1):
+            reading.update(
+                {
+                    "name": frappe.generate_hash(length=10),
+                    "parent": name,
+                    "parenttype": "Quality Inspection",
+                    "parentfield": "readings",
+                    "idx": idx,
+                    "owner": user,
+                    "modified_by": user,
+                    "creation": now,
+                    "modified": now,
+                    "docstatus": 0,
+                }
+            )
+            child_rows.append(reading.get_valid_dict(convert_dates_to_str=True))
+
+    bulk_insert_rows("Quality Inspection", parent_rows)
+    bulk_insert_rows("Quality Inspection Reading", child_rows)
+
+    # ... and the rest of Document.insert() after it: on_update (which links
+    # the reference row in "Warn" mode), on_change, version and notify_update
+    for qi in inspections:
+        qi.run_method("after_insert")
+        qi.flags.in_insert = True
+        qi.run_post_save_methods()
+        qi.flags.in_insert = False
+        qi.delete_key("__islocal")
+
+    return names
+
+
+# ! Return {item_code: quality_inspection_template} for the given items with one query
+def get_item_inspection_templates(item_codes):
+    item_codes = list({item_code for item_code in item_codes if item_code})
+    if not item_codes:
+        return {}
+
+    return {
+        item.name: item.quality_inspection_template
+        for item in frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes]},
+            fields=["name", "quality_inspection_template"],
+        )
+        if item.quality_inspection_template
+    }
+
+
+# ! Return {template: [reading values]} of Quality Inspection Templates with one query
+def get_template_readings(templates):
+    readings = {}
+    if not templates:
+        return readings
+
+    for parameter in frappe.get_all(
+        "Item Quality Inspection Parameter",
+        filters={"parenttype": "Quality Inspection Template", "parent": ["in", list(templates)]},
+        fields=["parent", *TEMPLATE_READING_FIELDS],
+        order_by="parent, idx",
+    ):
+        readings.setdefault(parameter.pop("parent"), []).append(parameter)
+
+    return readings
+
+
+def bulk_insert_rows(doctype, rows):
+    if not rows:
+        return
+
+    fields = list(rows[0])
+    frappe.db.bulk_insert(doctype, fields, [tuple(row.get(f) for f in fields) for row in rows])
@@ -0,0 +1,72 @@
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import now_datetime
+
+from sheetal_supply_chain.overrides.qi_override import insert_quality_inspections
+
+ITEM_CODE = "_Test QI Milk"
+RECEIPT = "_Test QI PR"
+RECEIPT_ROW = "_Test-QI-PRI-1"
+
+
+class TestInsertQualityInspections(IntegrationTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        if not frappe.db.exists("Item", ITEM_CODE):
+            frappe.get_doc(
+                {
+                    "doctype": "Item",
+                    "item_code": ITEM_CODE,
+                    "item_group": "All Item Groups",
+                    "stock_uom": "Nos",
+                    "is_stock_item": 1,
+                    "inspection_required_before_purchase": 1,
+                }
+            ).insert(ignore_permissions=True)
+
+    def setUp(self):
+        now = now_datetime()
+        frappe.db.bulk_insert(
+            "Purchase Receipt",
+            ["name", "creation", "modified", "owner", "modified_by", "docstatus", "posting_date"],
+            [(RECEIPT, now, now, "Administrator", "Administrator", 0, now.date())],
+        )
+        frappe.db.bulk_insert(
+            "Purchase Receipt Item",
+            ["name", "creation", "modified", "owner", "modified_by", "docstatus",
+             "parent", "parenttype", "parentfield", "idx", "item_code", "qty"],
+            [(RECEIPT_ROW, now, now, "Administrator", "Administrator", 0,
+              RECEIPT, "Purchase Receipt", "items", 1, ITEM_CODE, 100)],
+        )
+
+        setting = "action_if_quality_inspection_is_not_submitted"
+        self.addCleanup(
+            frappe.db.set_single_value, "Stock Settings", setting, frappe.db.get_single_value("Stock Settings", setting)
+        )
+        frappe.db.set_single_value("Stock Settings", setting, "Warn")
+
+    def tearDown(self):
+        frappe.db.delete("Quality Inspection", {"reference_name": RECEIPT})
+        frappe.db.delete("Purchase Receipt Item", {"parent": RECEIPT})
+        frappe.db.delete("Purchase Receipt", {"name": RECEIPT})
+
+    def test_reference_row_is_linked_in_warn_mode(self):
+        (name,) = insert_quality_inspections(
+            [
+                {
+                    "doctype": "Quality Inspection",
+                    "inspection_type": "Incoming",
+                    "inspected_by": frappe.session.user,
+                    "reference_type": "Purchase Receipt",
+                    "reference_name": RECEIPT,
+                    "item_code": ITEM_CODE,
+                    "sample_size": 1,
+                    "child_row_reference": RECEIPT_ROW,
+                }
+            ]
+        )
+
+        # Set by QualityInspection.on_update, as after a plain insert()
+        self.assertEqual(frappe.db.get_value("Purchase Receipt Item", RECEIPT_ROW, "quality_inspection"), name)
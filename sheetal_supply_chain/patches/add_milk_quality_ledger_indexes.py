@@ -0,0 +1,7 @@
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_ledger_entry.milk_quality_ledger_entry import (
+	on_doctype_update,
+)
+
+
+def execute():
+	on_doctype_update()
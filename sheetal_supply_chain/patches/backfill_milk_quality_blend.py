@@ -0,0 +1,5 @@
+from sheetal_supply_chain.py.milk_blending import backfill_quality_blend
+
+
+def execute():
+	backfill_quality_blend()
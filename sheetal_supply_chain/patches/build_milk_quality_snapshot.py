@@ -0,0 +1,7 @@
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+	rebuild_milk_quality_snapshots,
+)
+
+
+def execute():
+	rebuild_milk_quality_snapshots()
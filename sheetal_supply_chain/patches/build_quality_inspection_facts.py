@@ -0,0 +1,7 @@
+from sheetal_supply_chain.sheetal_supply_chain.doctype.quality_inspection_fact.quality_inspection_fact import (
+	rebuild_quality_inspection_facts,
+)
+
+
+def execute():
+	rebuild_quality_inspection_facts()
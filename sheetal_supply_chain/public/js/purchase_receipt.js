@@ -10,6 +10,26 @@ frappe.ui.form.on("Purchase Receipt", {
 
     },
 
+    //! Re-price milk rows in the browser when the net weight changes
+    custom_net_weight(frm) {
+        preview_milk_rates(frm);
+    },
+
+    //! Load the new supplier's rate card and re-price milk rows
+    supplier(frm) {
+        load_milk_rate_card(frm).then(() => preview_milk_rates(frm));
+    },
+
+    //! Rate card in force may differ on another posting date
+    posting_date(frm) {
+        preview_milk_rates(frm);
+    },
+
+    //! Send the checksum of the previewed rate card so the server can flag a stale preview
+    before_save(frm) {
+        frm.doc.__milk_rate_card_checksum = frm.milk_rate_card ? frm.milk_rate_card.checksum : null;
+    },
+
     //! Recalculate net weight when first weight changes and second weight exists
     custom_first_weight(frm) {
         let first = flt(frm.doc.custom_first_weight);
@@ -28,13 +48,11 @@ frappe.ui.form.on("Purchase Receipt", {
         // !? For UOM filter 
         setup_uom_filter(frm);
 
+        // Rate card for instant milk pricing previews
+        load_milk_rate_card(frm);
 
-        // Update all items with QI on form load
-        frm.doc.items.forEach(item => {
-            if (item.quality_inspection) {
-                fetch_fat_snf(frm, item.doctype, item.name);
-            }
-        });
+        // Update all items with QI on form load (one call for the whole form)
+        refresh_qi_readings(frm);
 
         if (frm.doc.docstatus === 1) {
             frm.add_custom_button("Milk Ledger", function () {
@@ -48,12 +66,7 @@ frappe.ui.form.on("Purchase Receipt", {
         // !? For UOM filter 
         setup_uom_filter(frm);
 
-        if (frm.doc.__islocal) return; // Skip for new documents
-        frm.doc.items.forEach(item => {
-            if (item.quality_inspection) {
-                fetch_fat_snf(frm, item.doctype, item.name);
-            }
-        });
+        // QI readings are refreshed once in refresh(), which always follows onload
     },
 
     before_items_remove: function(frm) {
@@ -68,9 +81,28 @@ frappe.ui.form.on("Purchase Receipt Item", {
     quality_inspection(frm, cdt, cdn) {
         fetch_fat_snf(frm, cdt, cdn);
     },
+
+    // Instant milk pricing preview (set_milk_pricing_on_items re-prices on save)
+    custom_fat(frm, cdt, cdn) {
+        preview_milk_rate(frm, cdt, cdn);
+    },
+    custom_snf(frm, cdt, cdn) {
+        preview_milk_rate(frm, cdt, cdn);
+    },
+    custom_lr(frm, cdt, cdn) {
+        preview_milk_rate(frm, cdt, cdn);
+    },
+    custom_milk_type(frm, cdt, cdn) {
+        preview_milk_rate(frm, cdt, cdn);
+    },
     form_render(frm, cdt, cdn) {
         let row = locals[cdt][cdn];
-        if (row.quality_inspection) {
+        let readings = frm.qi_readings && frm.qi_readings[row.quality_inspection];
+
+        // Already fetched for this form refresh: no server call
+        if (readings) {
+            set_qi_readings_on_row(frm, row, readings);
+        } else if (row.quality_inspection) {
             fetch_fat_snf(frm, cdt, cdn);
         }
     },
@@ -155,32 +187,60 @@ function fetch_fat_snf(frm, cdt, cdn) {
         return;
     }
 
-    frappe.call({
-        method: "sheetal_supply_chain.py.purchase_receipt.update_fat_snf_js",
+    refresh_qi_readings(frm, [row], true);
+}
+
+
+//! Fetch FAT/SNF/LR of the QIs of the given rows (default: all rows) in one call and set them on the rows
+function refresh_qi_readings(frm, rows, freeze) {
+    rows = (rows || frm.doc.items || []).filter(row => row.quality_inspection);
+    if (!rows.length) return Promise.resolve();
+
+    frm.qi_readings = frm.qi_readings || {};
+
+    // ETags: QI modified timestamps this form already has readings for
+    let known = {};
+    rows.forEach(row => {
+        let cached = frm.qi_readings[row.quality_inspection];
+        if (cached) known[row.quality_inspection] = cached.modified;
+    });
+
+    return frappe.call({
+        method: "sheetal_supply_chain.py.quality_inspection.get_qi_readings_bulk",
         args: {
-            qi: row.quality_inspection,
-            stock_qty: row.stock_qty
+            quality_inspections: rows.map(row => row.quality_inspection),
+            known: known
         },
-        freeze: true,
+        freeze: freeze,
         freeze_message: __("Fetching QI readings..."),
+    }).then(r => {
+        Object.entries(r.message || {}).forEach(([qi, readings]) => {
+            if (!readings.unchanged) frm.qi_readings[qi] = readings;
+        });
 
-        callback(r) {
-            if (!r.message) return;
-
-            // Fix rounding issues (VERY IMPORTANT)
-            let fat = flt(r.message.fat, 3);
-            let snf = flt(r.message.snf, 3);
-            let fat_kg = flt(r.message.fat_kg, 3);
-            let snf_kg = flt(r.message.snf_kg, 3);
-            let lr = flt(r.message.lr, 3);  
-            frappe.model.set_value(cdt, cdn, "custom_fat", fat);
-            frappe.model.set_value(cdt, cdn, "custom_snf", snf);
-            frappe.model.set_value(cdt, cdn, "custom_fat_kg", fat_kg);
-            frappe.model.set_value(cdt, cdn, "custom_snf_kg", snf_kg);
-            frappe.model.set_value(cdt, cdn, "custom_lr", lr);  
+        rows.forEach(row => {
+            let readings = frm.qi_readings[row.quality_inspection];
+            if (readings) set_qi_readings_on_row(frm, row, readings);
+        });
 
-            frm.refresh_field("items");
-        }
+        frm.refresh_field("items");
+    });
+}
+
+
+function set_qi_readings_on_row(frm, row, readings) {
+    // Fix rounding issues (VERY IMPORTANT)
+    let fat = flt(readings.fat, 3);
+    let snf = flt(readings.snf, 3);
+    let lr = flt(readings.lr, 3);
+    let stock_qty = flt(row.stock_qty);
+
+    frappe.model.set_value(row.doctype, row.name, {
+        custom_fat: fat,
+        custom_snf: snf,
+        custom_fat_kg: flt((fat / 100) * stock_qty, 3),
+        custom_snf_kg: flt((snf / 100) * stock_qty, 3),
+        custom_lr: lr
     });
 }
 
@@ -314,4 +374,212 @@ function validate_uom_selection(frm, cdt, cdn) {
             }
         }
     });
-}
\ No newline at end of file
+}
+
+
+
+//! Load the supplier's client rate card: published with the form, otherwise fetched (only if it changed)
+function load_milk_rate_card(frm) {
+    if (!frm.doc.supplier) {
+        frm.milk_rate_card = null;
+        return Promise.resolve(null);
+    }
+
+    let published = frm.doc.__onload && frm.doc.__onload.milk_rate_card;
+    if (published && published.supplier === frm.doc.supplier) {
+        frm.milk_rate_card = published;
+        return Promise.resolve(published);
+    }
+
+    let current = frm.milk_rate_card && frm.milk_rate_card.supplier === frm.doc.supplier
+        ? frm.milk_rate_card
+        : null;
+
+    return frappe.call({
+        method: "sheetal_supply_chain.py.milk_pricing.get_client_rate_card",
+        args: {
+            supplier: frm.doc.supplier,
+            checksum: current ? current.checksum : null
+        }
+    }).then(r => {
+        if (r.message && !r.message.unchanged) {
+            frm.milk_rate_card = r.message;
+        }
+        return frm.milk_rate_card;
+    });
+}
+
+
+//! Preview milk pricing of every milk row
+function preview_milk_rates(frm) {
+    (frm.doc.items || []).forEach(item => {
+        preview_milk_rate(frm, item.doctype, item.name);
+    });
+}
+
+
+//! Price one Purchase Receipt Item with the client rate card, the same way set_milk_pricing_on_items does
+function preview_milk_rate(frm, cdt, cdn) {
+    let rate_card = frm.milk_rate_card;
+    let row = locals[cdt][cdn];
+
+    if (frm.doc.docstatus !== 0 || !rate_card || rate_card.version !== 2) return;
+    if (rate_card.supplier !== frm.doc.supplier) return;
+    if (!row.custom_milk_type || !flt(row.custom_fat) || !flt(row.custom_snf)) return;
+
+    let weight_kg = flt(frm.doc.custom_net_weight) || flt(row.qty);
+    if (!weight_kg) return;
+
+    let card = get_milk_card_for(rate_card, row.custom_milk_type, frm.doc.posting_date);
+    if (!card) return;
+
+    let res = price_milk(rate_card, card, row.custom_fat, row.custom_snf, row.custom_lr, weight_kg);
+    if (!res) return;
+
+    frappe.model.set_value(cdt, cdn, {
+        conversion_factor: rate_card.kg_per_litre,
+        milk_rate_type: card.base_rate_type,
+        milk_base_rate: flt(res.base_rate, 3),
+        milk_fat_addition: flt(res.fat_addition, 3),
+        milk_fat_deduction: flt(res.fat_deduction, 3),
+        milk_snf_addition: flt(res.snf_addition, 3),
+        milk_snf_deduction: flt(res.snf_deduction, 3),
+        milk_final_rate: flt(res.final_rate, 3),
+        milk_final_amount: flt(res.amount, 2),
+        milk_payable_fat_kg: 0,
+        milk_rate_per_litre_display: flt(res.rate_per_litre_display, 3),
+        rate: flt(res.final_rate, 3)
+    });
+}
+
+
+//! Card in force on the posting date (MilkPriceIndex.card_for)
+function get_milk_card_for(rate_card, milk_type, posting_date) {
+    let index = rate_card.milk_types[milk_type];
+    if (!index) return null;
+
+    if (posting_date && index.effective_dates.length) {
+        let i = bisect_right(index.effective_dates, posting_date) - 1;
+        if (i >= 0) return index.cards[i];
+
+        // Before the first effective date a dated default is not in force yet
+        if (index.default_is_dated) return null;
+    }
+
+    return index.default_card;
+}
+
+
+//! Browser copy of MilkRateCard.price(); returns null when the server would reject the row
+function price_milk(rate_card, card, fat, snf, lr, weight) {
+    fat = flt(fat);
+    snf = flt(snf);
+    lr = flt(lr);
+    weight = flt(weight);
+
+    let kg_per_litre = rate_card.kg_per_litre;
+    let qty_litre = kg_per_litre ? weight / kg_per_litre : 0;
+
+    if (card.base_rate_type === "Rate Matrix") {
+        let matrix = rate_card.matrices[card.rate_matrix];
+        if (!matrix) return null;
+
+        let i = bisect_right(matrix.fat_breaks, fat) - 1;
+        let j = bisect_right(matrix.snf_breaks, snf) - 1;
+        let rate = i >= 0 && j >= 0 ? matrix.rates[i][j] : null;
+        if (rate === null || rate === undefined) return null;
+
+        return {
+            base_rate: rate,
+            final_rate: rate,
+            amount: rate * qty_litre,
+            rate_per_litre_display: rate,
+            fat_addition: 0,
+            fat_deduction: 0,
+            snf_addition: 0,
+            snf_deduction: 0
+        };
+    }
+
+    if (!card.base_rate) return null;
+
+    let fat_adj = [0, 0];
+    let snf_adj = [0, 0];
+    let lr_adj = [0, 0];
+
+    if (card.baseline_fat) {
+        fat_adj = milk_adjust(fat - card.baseline_fat,
+            card.fat_addition_enabled, card.fat_addition,
+            card.fat_deduction_enabled, card.fat_deduction);
+    }
+
+    if (card.baseline_snf) {
+        snf_adj = milk_adjust(snf - card.baseline_snf,
+            card.snf_addition_enabled, card.snf_addition,
+            card.snf_deduction_enabled, card.snf_deduction);
+    }
+
+    let final_rate, amount, rate_per_litre_display;
+
+    if (card.base_rate_type === "Per KG Fat") {
+        final_rate = (card.base_rate * fat) + snf_adj[0] + fat_adj[0] - snf_adj[1] - fat_adj[1];
+        amount = final_rate * qty_litre;
+        rate_per_litre_display = qty_litre ? amount / qty_litre : 0;
+
+    } else if (card.base_rate_type === "Per LR") {
+        if (card.baseline_lr) {
+            lr_adj = milk_adjust(lr - card.baseline_lr,
+                card.lr_addition_enabled, card.lr_addition,
+                card.lr_deduction_enabled, card.lr_deduction);
+        }
+
+        final_rate = card.base_rate + fat_adj[0] + snf_adj[0] + lr_adj[0] - fat_adj[1] - snf_adj[1] - lr_adj[1];
+        amount = final_rate * qty_litre;
+        rate_per_litre_display = final_rate;
+
+    } else if (card.base_rate_type === "Per Litre") {
+        final_rate = card.base_rate + fat_adj[0] + snf_adj[0] - fat_adj[1] - snf_adj[1];
+        amount = final_rate * qty_litre;
+        rate_per_litre_display = final_rate;
+
+    } else {
+        return null;
+    }
+
+    return {
+        base_rate: card.base_rate,
+        final_rate: final_rate,
+        amount: amount,
+        rate_per_litre_display: rate_per_litre_display,
+        fat_addition: fat_adj[0],
+        fat_deduction: fat_adj[1],
+        snf_addition: snf_adj[0],
+        snf_deduction: snf_adj[1]
+    };
+}
+
+
+//! [addition, deduction] for a reading that differs from its baseline by diff (_adjust in milk_pricing.py)
+function milk_adjust(diff, addition_enabled, addition_rate, deduction_enabled, deduction_rate) {
+    let addition = 0;
+    let deduction = 0;
+
+    if (addition_enabled && diff > 0) addition = diff * addition_rate;
+    if (deduction_enabled && diff < 0) deduction = Math.abs(diff) * deduction_rate;
+
+    return [addition, deduction];
+}
+
+
+function bisect_right(values, x) {
+    let lo = 0;
+    let hi = values.length;
+
+    while (lo < hi) {
+        let mid = (lo + hi) >> 1;
+        if (x < values[mid]) hi = mid;
+        else lo = mid + 1;
+    }
+
+    return lo;
+}
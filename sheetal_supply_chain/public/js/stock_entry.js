@@ -14,6 +14,7 @@ frappe.ui.form.on("Stock Entry Detail", {
         let row = locals[cdt][cdn];
 
         if (row.is_finished_item == 1 && row.quality_inspection) {
+            // Answered "unchanged" without readings when the form already has them
             fetch_fat_snf_stock_entry(frm, cdt, cdn);
         }
     },
@@ -45,11 +46,8 @@ frappe.ui.form.on("Stock Entry", {
     
     refresh(frm) {
         
-        frm.doc.items.forEach(item => {
-            if (item.is_finished_item == 1 && item.quality_inspection) {
-                fetch_fat_snf_stock_entry(frm, item.doctype, item.name);
-            }
-        });
+        // Finished items with QI: one call for the whole form
+        refresh_stock_entry_qi_readings(frm);
 
         
         if (frm.doc.docstatus === 1) {
@@ -78,13 +76,7 @@ frappe.ui.form.on("Stock Entry", {
         // };
 
 
-        if (frm.doc.__islocal) return;
-
-        frm.doc.items.forEach(item => {
-            if (item.is_finished_item == 1 && item.quality_inspection) {
-                fetch_fat_snf_stock_entry(frm, item.doctype, item.name);
-            }
-        });
+        // QI readings are refreshed once in refresh(), which always follows onload
     },
 
     items_add(frm) {
@@ -111,24 +103,61 @@ function fetch_fat_snf_stock_entry(frm, cdt, cdn) {
         return;
     }
     
-    frappe.call({
-        method: "sheetal_supply_chain.py.stock_entry.update_fat_snf_js",
+    refresh_stock_entry_qi_readings(frm, [row], true);
+}
+
+
+//! Fetch FAT/SNF of the QIs of the given finished rows (default: all) in one call and set them on the rows
+function refresh_stock_entry_qi_readings(frm, rows, freeze) {
+    // Rows already holding FAT/SNF are left as they are
+    rows = (rows || frm.doc.items || []).filter(row =>
+        row.is_finished_item == 1 && row.quality_inspection
+        && !flt(row.custom_fat) && !flt(row.custom_fat_kg) && !flt(row.custom_snf_kg)
+    );
+    if (!rows.length) return Promise.resolve();
+
+    frm.qi_readings = frm.qi_readings || {};
+
+    // ETags: QI modified timestamps this form already has readings for
+    let known = {};
+    rows.forEach(row => {
+        let cached = frm.qi_readings[row.quality_inspection];
+        if (cached) known[row.quality_inspection] = cached.modified;
+    });
+
+    return frappe.call({
+        method: "sheetal_supply_chain.py.quality_inspection.get_qi_readings_bulk",
         args: {
-            qi: row.quality_inspection,
-            qty: row.qty // IMPORTANT for Stock Entry
+            quality_inspections: rows.map(row => row.quality_inspection),
+            known: known
         },
-        freeze: true,
+        freeze: freeze,
         freeze_message: __("Fetching QI readings..."),
-        callback(r) {
-            if (!r.message) return;
+    }).then(r => {
+        Object.entries(r.message || {}).forEach(([qi, readings]) => {
+            if (!readings.unchanged) frm.qi_readings[qi] = readings;
+        });
 
-            frappe.model.set_value(cdt, cdn, "custom_fat", r.message.fat);
-            frappe.model.set_value(cdt, cdn, "custom_snf", r.message.snf);
-            frappe.model.set_value(cdt, cdn, "custom_fat_kg", r.message.fat_kg);
-            frappe.model.set_value(cdt, cdn, "custom_snf_kg", r.message.snf_kg);
+        rows.forEach(row => {
+            let readings = frm.qi_readings[row.quality_inspection];
+            if (readings) set_qi_readings_on_stock_entry_row(row, readings);
+        });
 
-            frm.refresh_field("items");
-        }
+        frm.refresh_field("items");
+    });
+}
+
+
+function set_qi_readings_on_stock_entry_row(row, readings) {
+    let fat = flt(readings.fat);
+    let snf = flt(readings.snf);
+    let qty = flt(row.qty); // IMPORTANT for Stock Entry
+
+    frappe.model.set_value(row.doctype, row.name, {
+        custom_fat: fat,
+        custom_snf: snf,
+        custom_fat_kg: (fat / 100) * qty,
+        custom_snf_kg: (snf / 100) * qty
     });
 }
 
@@ -1,30 +1,29 @@
 import frappe
 from frappe import _
 from frappe.utils import flt
+from sheetal_supply_chain.py.milk_blending import get_blended_quality
+from sheetal_supply_chain.py.uom_conversion import get_item_uom_conversions
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+    get_last_milk_quality,
+)
 
-# ! Fetch latest FAT/SNF percentages from the last submitted Milk Quality Ledger Entry and calculate FAT/SNF KG for given quantity
+# ! Fetch blended FAT/SNF percentages of the item in the warehouse from the Milk Quality Snapshot and calculate FAT/SNF KG for given quantity
 @frappe.whitelist()
 def get_last_mqle_values(item_code, warehouse,qty):
     """
-    Fetch last Milk Quality Ledger Entry values for this item.
+    Fetch the current (blended) milk quality of this item in the warehouse.
     Returns fat%, snf%, fat_kg, snf_kg
     """
 
-# get last MQLE for this item
-    last_mqle = frappe.db.get_value(
-        "Milk Quality Ledger Entry",
-        filters={"item_code":item_code, "warehouse": warehouse,"docstatus": 1},
-        fieldname=["fat_per", "snf_per", "fat", "snf"],
-        order_by="creation desc",
-        as_dict=True,
-    )
+# get last MQLE for this item (maintained snapshot, primary-key read)
+    last_mqle = get_last_milk_quality(item_code, warehouse)
 
 
     if not last_mqle:
         return {}
 
-    fat = flt(last_mqle.fat_per)
-    snf = flt(last_mqle.snf_per)
+    # Blended composition of the milk currently in the warehouse
+    fat, snf = get_blended_quality(last_mqle)
     qty = flt(qty)
 
     # Calculate kg values
@@ -164,26 +163,14 @@ def validate_item_uom(item_code, uom):
     if item.stock_uom == uom:
         return {'valid': True}
     
-    # Check if UOM exists in conversion table
-    uom_exists = frappe.db.exists('UOM Conversion Detail', {
-        'parent': item_code,
-        'parenttype': 'Item',
-        'uom': uom,
-        'docstatus': ['<', 2]
-    })
-    
-    if uom_exists:
+    # Check if UOM exists in conversion table (cached per item)
+    conversions = get_item_uom_conversions(item_code)
+
+    if uom in conversions:
         return {'valid': True}
     
     # Get list of allowed UOMs for error message
-    allowed_uoms = frappe.db.sql_list("""
-        SELECT DISTINCT uom
-        FROM `tabUOM Conversion Detail`
-        WHERE parent = %s
-        AND parenttype = 'Item'
-        AND docstatus < 2
-        ORDER BY uom
-    """, item_code)
+    allowed_uoms = sorted(conversions)
     
     # Add stock UOM to the list
     if item.stock_uom not in allowed_uoms:
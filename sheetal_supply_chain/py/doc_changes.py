@@ -0,0 +1,49 @@
+import datetime
+import numbers
+
+import frappe
+from frappe.utils import flt, getdate
+
+
+# ! Child rows whose inputs differ from the stored document (all rows when nothing can be compared against)
+def get_changed_rows(doc, table_field, row_fields, parent_fields=()):
+    """
+    Change detection for validate / before_save hooks.
+
+    Returns the rows of `doc.<table_field>` that are new or whose
+    `row_fields` differ from the version being overwritten. Every row is
+    returned for new documents, on submit / cancel (so the final check is
+    always complete) and when any of `parent_fields` changed.
+    """
+    rows = doc.get(table_field) or []
+
+    if doc.is_new() or doc.docstatus != 0:
+        return list(rows)
+
+    before = doc.get_doc_before_save()
+    if not before or before.docstatus != 0:
+        return list(rows)
+
+    if any(value_changed(doc.get(field), before.get(field)) for field in parent_fields):
+        return list(rows)
+
+    before_rows = {row.name: row for row in before.get(table_field) or []}
+
+    changed = []
+    for row in rows:
+        before_row = before_rows.get(row.name)
+        if before_row is None or any(value_changed(row.get(f), before_row.get(f)) for f in row_fields):
+            changed.append(row)
+
+    return changed
+
+
+# ! Compare a submitted value with its stored value by the stored value's type ("3.50" == 3.5, "2026-01-01" == date)
+def value_changed(value, stored):
+    if isinstance(stored, numbers.Number) and not isinstance(stored, bool):
+        return flt(value) != flt(stored)
+
+    if isinstance(stored, datetime.date) and not isinstance(stored, datetime.datetime):
+        return (getdate(value) if value else None) != stored
+
+    return (value or None) != (stored or None)
@@ -0,0 +1,349 @@
+import frappe
+from frappe.utils import flt, get_datetime
+
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+    get_last_milk_quality_map,
+    rebuild_milk_quality_snapshots,
+)
+
+MQLE_DOCTYPE = "Milk Quality Ledger Entry"
+
+# Fields written on every MQLE by the blending engine
+BLEND_FIELDS = (
+    "fat_per_after_transaction",
+    "snf_per_after_transaction",
+    "fat_after_transaction",
+    "snf_after_transaction",
+)
+
+
+# ! Running tank composition of an item in a warehouse: cumulative FAT kg, SNF kg and milk kg
+def get_blend_state(snapshot):
+    """Build the running state from a warehouse-level Milk Quality Snapshot (or None)."""
+    if not snapshot:
+        return None
+
+    return frappe._dict(
+        fat_per=flt(snapshot.get("fat_per_after_transaction")),
+        snf_per=flt(snapshot.get("snf_per_after_transaction")),
+        fat=flt(snapshot.get("fat_after_transaction")),
+        snf=flt(snapshot.get("snf_after_transaction")),
+        qty=flt(snapshot.get("qty_after_transaction_in_kg")),
+    )
+
+
+# ! Return blended FAT% / SNF% of the milk currently in a warehouse from its snapshot
+def get_blended_quality(snapshot):
+    state = get_blend_state(snapshot)
+    if not state:
+        return 0, 0
+
+    return state.fat_per, state.snf_per
+
+
+# ! Apply one ledger entry to the running composition in O(1) and stamp "quality after transaction" on it
+def blend_entry(state, entry, qty_after=None):
+    """
+    Weighted-average blending of FAT/SNF for one MQLE.
+
+    - Inward: the incoming FAT/SNF kg are mixed with the milk already in the
+      warehouse (qty after this entry minus this entry's qty).
+    - Outward: milk leaves at the current blended composition, so the
+      percentages stay the same and the kg scale down with the stock.
+    - Inspection: a lab reading of the whole tank replaces the composition.
+
+    The composition is always re-anchored on qty_after_transaction_in_kg so
+    stock moves that do not post to the milk ledger are absorbed
+    proportionally. `qty_after` is the stock right after this entry and
+    defaults to its qty_after_transaction_in_kg (see get_running_balances()
+    for vouchers with several rows of one key). Returns the new state.
+    """
+    qty_in = flt(entry.get("qty_in_kg"))
+    if qty_after is None:
+        qty_after = flt(entry.get("qty_after_transaction_in_kg"))
+    entry_fat_per = flt(entry.get("fat_per"))
+    entry_snf_per = flt(entry.get("snf_per"))
+
+    if state:
+        prev_fat_per, prev_snf_per = state.fat_per, state.snf_per
+    else:
+        # Nothing recorded yet: assume the existing stock matches this entry
+        prev_fat_per, prev_snf_per = entry_fat_per, entry_snf_per
+
+    entry_type = entry.get("entry_type")
+
+    if entry_type == "Inspection":
+        fat_per, snf_per = entry_fat_per, entry_snf_per
+
+    elif entry_type == "Inward":
+        base_qty = max(qty_after - qty_in, 0)
+        total_qty = base_qty + qty_in
+
+        fat_in = flt(entry.get("fat")) or qty_in * entry_fat_per / 100
+        snf_in = flt(entry.get("snf")) or qty_in * entry_snf_per / 100
+
+        if total_qty > 0:
+            fat_per = (base_qty * prev_fat_per / 100 + fat_in) / total_qty * 100
+            snf_per = (base_qty * prev_snf_per / 100 + snf_in) / total_qty * 100
+        else:
+            fat_per, snf_per = entry_fat_per, entry_snf_per
+
+    else:
+        fat_per, snf_per = prev_fat_per, prev_snf_per
+
+    # An empty tank keeps its last composition for reference, with zero kg
+    stock_qty = max(qty_after, 0)
+
+    entry.fat_per_after_transaction = fat_per
+    entry.snf_per_after_transaction = snf_per
+    entry.fat_after_transaction = stock_qty * fat_per / 100
+    entry.snf_after_transaction = stock_qty * snf_per / 100
+
+    return frappe._dict(
+        fat_per=fat_per,
+        snf_per=snf_per,
+        fat=entry.fat_after_transaction,
+        snf=entry.snf_after_transaction,
+        qty=stock_qty,
+    )
+
+
+# ! Stock right after each entry when rows of one group share a single closing balance
+def get_running_balances(entries, group_by):
+    """
+    qty_after_transaction_in_kg is the balance after the whole voucher (or
+    posting datetime), so two Inward rows of one key would both be blended
+    against it. Within each `group_by(entry)` group the stock after a row is
+    that balance minus the movements of the rows still to come.
+    Returns one quantity per entry, in order.
+    """
+    remaining = {}
+    for entry in entries:
+        group = group_by(entry)
+        remaining[group] = remaining.get(group, 0) + get_stock_movement(entry)
+
+    balances = []
+    for entry in entries:
+        group = group_by(entry)
+        remaining[group] -= get_stock_movement(entry)
+        balances.append(flt(entry.get("qty_after_transaction_in_kg")) - remaining[group])
+
+    return balances
+
+
+def get_stock_movement(entry):
+    """Signed stock change of an entry: milk in, milk out, or none for an inspection."""
+    entry_type = entry.get("entry_type")
+
+    if entry_type == "Inward":
+        return flt(entry.get("qty_in_kg"))
+    if entry_type == "Outward":
+        return -flt(entry.get("qty_in_kg"))
+    return 0
+
+
+# ! Blend a batch of new ledger entries in order, seeding each (item, warehouse) from the entry before it
+def apply_quality_blend(entries):
+    """
+    Keys are seeded from their Milk Quality Snapshot, unless the batch is
+    back-dated (the snapshot was posted after it): those keys are seeded
+    from the last entry before the batch's posting datetime instead, so the
+    stored values are right even if the follow-up repost never runs.
+    """
+    first_posting = {}
+    for entry in entries:
+        key = (entry.get("item_code"), entry.get("warehouse"))
+        first_posting.setdefault(key, get_posting_datetime(entry.get("posting_date"), entry.get("posting_time")))
+
+    snapshots = get_last_milk_quality_map(first_posting)
+
+    states = {}
+    for key, posting_datetime in first_posting.items():
+        snapshot = snapshots.get(key)
+
+        if snapshot and get_posting_datetime(snapshot.posting_date, snapshot.posting_time) > posting_datetime:
+            snapshot = get_previous_entry(*key, posting_datetime)
+
+        states[key] = get_blend_state(snapshot)
+
+    balances = get_running_balances(
+        entries,
+        lambda entry: (entry.get("item_code"), entry.get("warehouse"), entry.get("voucher_type"), entry.get("voucher_no")),
+    )
+
+    for entry, qty_after in zip(entries, balances, strict=True):
+        key = (entry.get("item_code"), entry.get("warehouse"))
+        states[key] = blend_entry(states.get(key), entry, qty_after)
+
+
+# ! Last submitted entry of an (item, warehouse) posted before a datetime
+def get_previous_entry(item_code, warehouse, from_datetime):
+    """Blend state source for a back-dated posting or a repost starting at `from_datetime`."""
+    entries = frappe.db.sql(
+        """
+        SELECT qty_after_transaction_in_kg, {blend_fields}
+        FROM `tabMilk Quality Ledger Entry`
+        WHERE docstatus = 1
+          AND item_code = %(item_code)s
+          AND warehouse = %(warehouse)s
+          AND TIMESTAMP(posting_date, posting_time) < %(from_datetime)s
+        ORDER BY posting_date DESC, posting_time DESC, creation DESC
+        LIMIT 1
+        """.format(blend_fields=", ".join(BLEND_FIELDS)),
+        {"item_code": item_code, "warehouse": warehouse, "from_datetime": from_datetime},
+        as_dict=True,
+    )
+
+    return entries[0] if entries else None
+
+
+def get_posting_datetime(posting_date, posting_time):
+    return get_datetime(f"{posting_date} {posting_time}")
+
+
+# ! Replay the whole Milk Quality Ledger in posting order and recompute "quality after transaction" on every entry
+def backfill_quality_blend(item_code=None, warehouse=None, chunk_size=1000):
+    """
+    Backfill mode of the blending engine.
+
+    Entries are replayed per (item, warehouse) in posting order, one page
+    of `chunk_size` entries at a time, the same way Milk Quality Repost does.
+    Older entries without an entry_type get one inferred from their voucher.
+    Snapshots are rebuilt at the end so the incremental engine continues
+    from the replayed state.
+    """
+    conditions = ["docstatus = 1"]
+    values = {}
+
+    if item_code:
+        conditions.append("item_code = %(item_code)s")
+        values["item_code"] = item_code
+    if warehouse:
+        conditions.append("warehouse = %(warehouse)s")
+        values["warehouse"] = warehouse
+
+    keys = frappe.db.sql(
+        f"""
+        SELECT DISTINCT item_code, warehouse
+        FROM `tabMilk Quality Ledger Entry`
+        WHERE {" AND ".join(conditions)}
+        """,
+        values,
+    )
+
+    for key_item_code, key_warehouse in keys:
+        state = None
+
+        for entries in iter_entry_pages(key_item_code, key_warehouse, page_length=chunk_size):
+            state = blend_entries(state, entries)
+
+            updates = {
+                entry.name: {
+                    "entry_type": entry.entry_type,
+                    **{field: entry.get(field) for field in BLEND_FIELDS},
+                }
+                for entry in entries
+            }
+            frappe.db.bulk_update(MQLE_DOCTYPE, updates, update_modified=False)
+
+    rebuild_milk_quality_snapshots()
+
+
+# ! Replay one page of ledger entries in posting order onto the running composition
+def blend_entries(state, entries):
+    """
+    Shared by the backfill and Milk Quality Repost. Rows posted at the same
+    datetime share one closing balance, so each is blended on its own share
+    of it (see get_running_balances()). Returns the new state.
+    """
+    balances = get_running_balances(entries, lambda entry: entry.posting_datetime)
+
+    for entry, qty_after in zip(entries, balances, strict=True):
+        state = blend_entry(state, entry, qty_after)
+
+    return state
+
+
+# ! Stream submitted entries of an (item, warehouse) in pages that never split a posting datetime
+def iter_entry_pages(item_code, warehouse, from_datetime=None, page_length=1000):
+    """
+    Yield lists of about `page_length` entries in posting order. A page that
+    ends inside a posting datetime is extended with the rest of its rows, so
+    blend_entries() always sees every row that shares a closing balance.
+    """
+    after = None
+
+    while True:
+        entries = get_entries_in_posting_order(
+            item_code, warehouse, from_datetime=from_datetime, after=after, limit=page_length
+        )
+        if not entries:
+            return
+
+        if len(entries) == page_length:
+            last = entries[-1]
+            entries += get_entries_in_posting_order(
+                item_code, warehouse, after=(last.posting_datetime, last.creation), to_datetime=last.posting_datetime
+            )
+
+        yield entries
+
+        after = (entries[-1].posting_datetime, entries[-1].creation)
+
+
+# ! Fetch submitted entries of an (item, warehouse) in posting order, inferring entry_type for older rows
+def get_entries_in_posting_order(item_code, warehouse, from_datetime=None, after=None, limit=None, to_datetime=None):
+    """
+    `from_datetime` and `to_datetime` restrict the result to entries posted
+    at or after, and at or before, them.
+    `after` is the (posting_datetime, creation) of the last row already read,
+    so callers can stream a long ledger in pages of `limit` rows.
+    """
+    conditions = []
+    values = {"item_code": item_code, "warehouse": warehouse}
+
+    if from_datetime:
+        conditions.append("AND TIMESTAMP(m.posting_date, m.posting_time) >= %(from_datetime)s")
+        values["from_datetime"] = from_datetime
+    if to_datetime:
+        conditions.append("AND TIMESTAMP(m.posting_date, m.posting_time) <= %(to_datetime)s")
+        values["to_datetime"] = to_datetime
+    if after:
+        conditions.append("AND (TIMESTAMP(m.posting_date, m.posting_time), m.creation) > (%(after_datetime)s, %(after_creation)s)")
+        values["after_datetime"], values["after_creation"] = after
+
+    return frappe.db.sql(
+        """
+        SELECT
+            m.name, m.item_code, m.warehouse, m.batch_no, m.posting_date, m.posting_time,
+            TIMESTAMP(m.posting_date, m.posting_time) AS posting_datetime, m.creation,
+            m.fat_per, m.snf_per, m.fat, m.snf,
+            m.qty_in_kg, m.qty_after_transaction_in_kg,
+            m.qty_in_liter, m.qty_after_transaction_in_liter,
+            CASE
+                WHEN IFNULL(m.entry_type, '') != '' THEN m.entry_type
+                WHEN m.voucher_type = 'Quality Inspection' THEN 'Inspection'
+                WHEN m.voucher_type = 'Purchase Receipt' THEN 'Inward'
+                WHEN EXISTS (
+                    SELECT 1 FROM `tabStock Entry Detail` sed
+                    WHERE sed.parent = m.voucher_no
+                      AND sed.item_code = m.item_code
+                      AND sed.t_warehouse = m.warehouse
+                      AND sed.is_finished_item = 1
+                ) THEN 'Inward'
+                ELSE 'Outward'
+            END AS entry_type
+        FROM `tabMilk Quality Ledger Entry` m
+        WHERE m.docstatus = 1
+          AND m.item_code = %(item_code)s
+          AND m.warehouse = %(warehouse)s
+          {conditions}
+        ORDER BY m.posting_date, m.posting_time, m.creation
+        {limit}
+        """.format(
+            conditions=" ".join(conditions),
+            limit=f"LIMIT {int(limit)}" if limit else "",
+        ),
+        values,
+        as_dict=True,
+    )
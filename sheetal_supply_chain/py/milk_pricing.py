@@ -0,0 +1,712 @@
+import hashlib
+import json
+from bisect import bisect_right
+from dataclasses import dataclass, fields
+
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate
+
+try:
+    import numpy as np
+except ImportError:  # optional: bulk pricing falls back to the scalar path
+    np = None
+
+
+RATE_CARD_CACHE_KEY = "sheetal_milk_rate_cards"
+
+# Bump when the layout of the client rate card (or the formula evaluated on it) changes
+CLIENT_RATE_CARD_VERSION = 2
+
+KG_PER_LITRE = 1.0339
+
+BASE_RATE_TYPES = ("Per Litre", "Per KG Fat", "Per LR", "Rate Matrix")
+
+# Milk Type fields a rate card is compiled from
+MILK_TYPE_FIELDS = [
+    "base_rate_type", "rate_matrix",
+    "fat_addition_enabled", "fat_addition", "fat_deduction_enabled", "fat_deduction",
+    "snf_addition_enabled", "snf_addition", "snf_deduction_enabled", "snf_deduction",
+    "lr_addition_enabled", "lr_addition", "lr_deduction_enabled", "lr_deduction",
+]
+
+
+# ! FAT x SNF slab chart compiled into sorted breakpoints: a price lookup is two binary searches
+@dataclass(frozen=True)
+class CompiledRateMatrix:
+    name: str
+    fat_breaks: tuple
+    snf_breaks: tuple
+    rates: tuple  # rates[fat slab][snf slab], None for an empty cell
+
+    @classmethod
+    def from_compiled(cls, name, compiled):
+        compiled = frappe.parse_json(compiled) if isinstance(compiled, str) else compiled
+        return cls(
+            name=name,
+            fat_breaks=tuple(compiled["fat_breaks"]),
+            snf_breaks=tuple(compiled["snf_breaks"]),
+            rates=tuple(tuple(row) for row in compiled["rates"]),
+        )
+
+    def rate_for(self, fat, snf):
+        """Rate of the slab containing (fat, snf), or None when the reading is off the chart."""
+        i = bisect_right(self.fat_breaks, fat) - 1
+        j = bisect_right(self.snf_breaks, snf) - 1
+        if i < 0 or j < 0:
+            return None
+
+        return self.rates[i][j]
+
+    def rate_for_many(self, fat, snf):
+        """Array variant of rate_for(); off-chart readings and empty cells give NaN."""
+        i = np.searchsorted(self.fat_breaks, fat, side="right") - 1
+        j = np.searchsorted(self.snf_breaks, snf, side="right") - 1
+
+        rates = np.array([[np.nan if rate is None else rate for rate in row] for row in self.rates], dtype=float)
+        on_chart = (i >= 0) & (j >= 0)
+
+        return np.where(on_chart, rates[np.maximum(i, 0), np.maximum(j, 0)], np.nan)
+
+
+# ! Compile Milk Rate Matrix slab rows into {"fat_breaks", "snf_breaks", "rates"} (stored on the matrix at save time)
+def compile_rate_matrix(slabs):
+    fat_breaks = sorted({flt(slab.fat_from) for slab in slabs})
+    snf_breaks = sorted({flt(slab.snf_from) for slab in slabs})
+
+    fat_index = {fat: i for i, fat in enumerate(fat_breaks)}
+    snf_index = {snf: j for j, snf in enumerate(snf_breaks)}
+
+    rates = [[None] * len(snf_breaks) for _fat in fat_breaks]
+
+    for slab in slabs:
+        i, j = fat_index[flt(slab.fat_from)], snf_index[flt(slab.snf_from)]
+        if rates[i][j] is not None:
+            frappe.throw(
+                _("Row {0}: slab FAT {1} / SNF {2} is defined more than once.").format(
+                    slab.idx, slab.fat_from, slab.snf_from
+                )
+            )
+
+        rates[i][j] = flt(slab.rate)
+
+    return {"fat_breaks": fat_breaks, "snf_breaks": snf_breaks, "rates": rates}
+
+
+# ! Immutable pricing rules of one (supplier, milk type, effective date), compiled from Milk Type + Supplier Milk Profile
+@dataclass(frozen=True)
+class MilkRateCard:
+    supplier: str
+    milk_type: str
+    base_rate_type: str
+    effective_from: object
+    base_rate: float
+
+    baseline_fat: float
+    baseline_snf: float
+    baseline_lr: float
+
+    fat_addition_enabled: bool
+    fat_addition: float
+    fat_deduction_enabled: bool
+    fat_deduction: float
+    snf_addition_enabled: bool
+    snf_addition: float
+    snf_deduction_enabled: bool
+    snf_deduction: float
+    lr_addition_enabled: bool
+    lr_addition: float
+    lr_deduction_enabled: bool
+    lr_deduction: float
+
+    rate_matrix: CompiledRateMatrix | None = None
+
+    def price(self, fat, snf, lr, weight):
+        """
+        Price one milk collection. Pure function of the card and the readings.
+
+        FAT / SNF adjustments apply only when the profile has a baseline for
+        them; LR adjustments only for "Per LR" cards. "Rate Matrix" cards
+        take the rate of the FAT x SNF slab instead. Returns the same
+        breakdown that Purchase Receipt items store.
+        """
+        fat, snf, lr, weight = flt(fat), flt(snf), flt(lr), flt(weight)
+
+        qty_litre = weight / KG_PER_LITRE if KG_PER_LITRE else 0
+
+        if self.base_rate_type == "Rate Matrix":
+            final_rate = self.rate_matrix.rate_for(fat, snf)
+            if final_rate is None:
+                frappe.throw(
+                    _("FAT {0} / SNF {1} is outside Rate Matrix {2}").format(fat, snf, self.rate_matrix.name)
+                )
+
+            return self._breakdown(snf, qty_litre, final_rate, final_rate * qty_litre, final_rate, base_rate=final_rate)
+
+        fat_addition = fat_deduction = 0.0
+        snf_addition = snf_deduction = 0.0
+        lr_addition = lr_deduction = 0.0
+
+        if self.baseline_fat:
+            fat_addition, fat_deduction = _adjust(
+                fat - self.baseline_fat,
+                self.fat_addition_enabled, self.fat_addition,
+                self.fat_deduction_enabled, self.fat_deduction,
+            )
+
+        if self.baseline_snf:
+            snf_addition, snf_deduction = _adjust(
+                snf - self.baseline_snf,
+                self.snf_addition_enabled, self.snf_addition,
+                self.snf_deduction_enabled, self.snf_deduction,
+            )
+
+        if self.base_rate_type == "Per KG Fat":
+            final_rate = (self.base_rate * fat) + snf_addition + fat_addition - snf_deduction - fat_deduction
+            amount = final_rate * qty_litre
+            rate_per_litre_display = amount / qty_litre if qty_litre else 0
+
+        elif self.base_rate_type == "Per LR":
+            if self.baseline_lr:
+                lr_addition, lr_deduction = _adjust(
+                    lr - self.baseline_lr,
+                    self.lr_addition_enabled, self.lr_addition,
+                    self.lr_deduction_enabled, self.lr_deduction,
+                )
+
+            final_rate = self.base_rate + fat_addition + snf_addition + lr_addition - fat_deduction - snf_deduction - lr_deduction
+            amount = final_rate * qty_litre
+            rate_per_litre_display = final_rate
+
+        else:
+            final_rate = self.base_rate + fat_addition + snf_addition - fat_deduction - snf_deduction
+            amount = final_rate * qty_litre
+            rate_per_litre_display = final_rate
+
+        return self._breakdown(
+            snf, qty_litre, final_rate, amount, rate_per_litre_display,
+            fat_addition, fat_deduction, snf_addition, snf_deduction,
+        )
+
+    def _breakdown(
+        self, snf, qty_litre, final_rate, amount, rate_per_litre_display,
+        fat_addition=0.0, fat_deduction=0.0, snf_addition=0.0, snf_deduction=0.0, base_rate=None,
+    ):
+        return {
+            "custom_snf": snf,
+            "qty_litre": qty_litre,
+            "kg_per_litre": KG_PER_LITRE,
+            "final_rate": final_rate,
+            "amount": amount,
+            "base_rate": self.base_rate if base_rate is None else base_rate,
+            "fat_addition": fat_addition,
+            "fat_deduction": fat_deduction,
+            "snf_addition": snf_addition,
+            "snf_deduction": snf_deduction,
+            "rate_type": self.base_rate_type,
+            "payable_fat_kg": 0,
+            "rate_per_litre_display": rate_per_litre_display,
+        }
+
+    def price_many(self, fat, snf, lr, weight):
+        """
+        Vectorised price() over NumPy arrays of readings.
+
+        Every array expression mirrors the scalar arithmetic term by term and
+        in the same order, so each element is bit-identical to price().
+        Returns a dict of arrays with the numeric keys of price().
+        """
+        fat, snf, lr, weight = (np.asarray(values, dtype=float) for values in (fat, snf, lr, weight))
+        zeros = np.zeros_like(weight)
+
+        qty_litre = weight / KG_PER_LITRE if KG_PER_LITRE else zeros
+
+        if self.base_rate_type == "Rate Matrix":
+            # Off-chart readings come back as NaN and are reported per row by the caller
+            final_rate = self.rate_matrix.rate_for_many(fat, snf)
+            return {
+                "custom_snf": snf,
+                "qty_litre": qty_litre,
+                "final_rate": final_rate,
+                "amount": final_rate * qty_litre,
+                "fat_addition": zeros,
+                "fat_deduction": zeros,
+                "snf_addition": zeros,
+                "snf_deduction": zeros,
+                "rate_per_litre_display": final_rate,
+                "base_rate": final_rate,
+            }
+
+        fat_addition = fat_deduction = snf_addition = snf_deduction = zeros
+        lr_addition = lr_deduction = zeros
+
+        if self.baseline_fat:
+            fat_addition, fat_deduction = _adjust_many(
+                fat - self.baseline_fat,
+                self.fat_addition_enabled, self.fat_addition,
+                self.fat_deduction_enabled, self.fat_deduction,
+            )
+
+        if self.baseline_snf:
+            snf_addition, snf_deduction = _adjust_many(
+                snf - self.baseline_snf,
+                self.snf_addition_enabled, self.snf_addition,
+                self.snf_deduction_enabled, self.snf_deduction,
+            )
+
+        if self.base_rate_type == "Per KG Fat":
+            final_rate = (self.base_rate * fat) + snf_addition + fat_addition - snf_deduction - fat_deduction
+            amount = final_rate * qty_litre
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rate_per_litre_display = np.where(qty_litre != 0, amount / qty_litre, 0.0)
+
+        elif self.base_rate_type == "Per LR":
+            if self.baseline_lr:
+                lr_addition, lr_deduction = _adjust_many(
+                    lr - self.baseline_lr,
+                    self.lr_addition_enabled, self.lr_addition,
+                    self.lr_deduction_enabled, self.lr_deduction,
+                )
+
+            final_rate = self.base_rate + fat_addition + snf_addition + lr_addition - fat_deduction - snf_deduction - lr_deduction
+            amount = final_rate * qty_litre
+            rate_per_litre_display = final_rate
+
+        else:
+            final_rate = self.base_rate + fat_addition + snf_addition - fat_deduction - snf_deduction
+            amount = final_rate * qty_litre
+            rate_per_litre_display = final_rate
+
+        return {
+            "custom_snf": snf,
+            "qty_litre": qty_litre,
+            "final_rate": final_rate,
+            "amount": amount,
+            "fat_addition": fat_addition,
+            "fat_deduction": fat_deduction,
+            "snf_addition": snf_addition,
+            "snf_deduction": snf_deduction,
+            "rate_per_litre_display": rate_per_litre_display,
+        }
+
+
+# ! Addition / deduction for a reading that differs from its baseline by `diff`
+def _adjust(diff, addition_enabled, addition_rate, deduction_enabled, deduction_rate):
+    addition = deduction = 0.0
+
+    if addition_enabled and diff > 0:
+        addition = diff * addition_rate
+
+    if deduction_enabled and diff < 0:
+        deduction = abs(diff) * deduction_rate
+
+    return addition, deduction
+
+
+# ! Array variant of _adjust()
+def _adjust_many(diff, addition_enabled, addition_rate, deduction_enabled, deduction_rate):
+    zeros = np.zeros_like(diff)
+
+    addition = np.where(diff > 0, diff * addition_rate, 0.0) if addition_enabled else zeros
+    deduction = np.where(diff < 0, np.abs(diff) * deduction_rate, 0.0) if deduction_enabled else zeros
+
+    return addition, deduction
+
+
+# ! Build the rate card of a Milk Type row + Supplier Milk Profile row
+def make_rate_card(supplier, mt, profile, matrices=None):
+    # A supplier profile can override the Milk Type's chart
+    matrix_name = profile.get("rate_matrix") or mt.get("rate_matrix")
+    rate_matrix = None
+
+    if mt.get("base_rate_type") == "Rate Matrix" and matrix_name:
+        if matrices is None:
+            matrices = get_rate_matrices([matrix_name])
+        rate_matrix = matrices.get(matrix_name)
+
+    return MilkRateCard(
+        supplier=supplier,
+        milk_type=mt.get("name"),
+        base_rate_type=mt.get("base_rate_type"),
+        effective_from=profile.get("effective_from"),
+        base_rate=flt(profile.get("base_rate") or 0),
+        baseline_fat=flt(profile.get("baseline_fat") or 0),
+        baseline_snf=flt(profile.get("baseline_snf") or 0),
+        baseline_lr=flt(profile.get("baseline_lr") or 0),
+        fat_addition_enabled=bool(mt.get("fat_addition_enabled")),
+        fat_addition=flt(mt.get("fat_addition")),
+        fat_deduction_enabled=bool(mt.get("fat_deduction_enabled")),
+        fat_deduction=flt(mt.get("fat_deduction")),
+        snf_addition_enabled=bool(mt.get("snf_addition_enabled")),
+        snf_addition=flt(mt.get("snf_addition")),
+        snf_deduction_enabled=bool(mt.get("snf_deduction_enabled")),
+        snf_deduction=flt(mt.get("snf_deduction")),
+        lr_addition_enabled=bool(mt.get("lr_addition_enabled")),
+        lr_addition=flt(mt.get("lr_addition")),
+        lr_deduction_enabled=bool(mt.get("lr_deduction_enabled")),
+        lr_deduction=flt(mt.get("lr_deduction")),
+        rate_matrix=rate_matrix,
+    )
+
+
+# ! Load compiled Milk Rate Matrices by name with one query
+def get_rate_matrices(names):
+    names = [name for name in set(names) if name]
+    if not names:
+        return {}
+
+    return {
+        matrix.name: CompiledRateMatrix.from_compiled(matrix.name, matrix.compiled_matrix)
+        for matrix in frappe.get_all(
+            "Milk Rate Matrix",
+            filters={"name": ["in", names]},
+            fields=["name", "compiled_matrix"],
+        )
+        if matrix.compiled_matrix
+    }
+
+
+# ! Effective-dated price history of one (supplier, milk type) pair
+@dataclass(frozen=True)
+class MilkPriceIndex:
+    effective_dates: tuple
+    cards: tuple
+    default_card: MilkRateCard | None  # None when no profile row is marked default
+
+    def card_for(self, posting_date=None):
+        """
+        Rate card in force on `posting_date`: the profile with the latest
+        effective_from on or before it, found by binary search. Without a
+        date, or before the first effective date, the default profile is
+        used, unless it is itself dated (then not yet in force): None.
+        """
+        if posting_date and self.effective_dates:
+            i = bisect_right(self.effective_dates, getdate(posting_date)) - 1
+            if i >= 0:
+                return self.cards[i]
+
+            if self.default_card and self.default_card.effective_from:
+                return None
+
+        return self.default_card
+
+
+# ! Build the price indexes of all milk types of a supplier with one query per table
+def build_price_index(supplier):
+    profiles = frappe.get_all(
+        "Supplier Milk Profile",
+        filters={"parent": supplier, "parenttype": "Supplier"},
+        fields=["milk_type", "effective_from", "is_default", "base_rate", "baseline_fat", "baseline_snf", "baseline_lr", "rate_matrix"],
+        order_by="idx asc",
+    )
+
+    milk_types = {
+        mt.name: mt
+        for mt in frappe.get_all(
+            "Milk Type",
+            filters={"name": ["in", list({p.milk_type for p in profiles if p.milk_type})]},
+            fields=["name", *MILK_TYPE_FIELDS],
+        )
+    } if profiles else {}
+
+    matrices = get_rate_matrices(
+        [p.rate_matrix for p in profiles] + [mt.rate_matrix for mt in milk_types.values()]
+    )
+
+    by_milk_type = {}
+    for profile in profiles:
+        if profile.milk_type in milk_types:
+            by_milk_type.setdefault(profile.milk_type, []).append(profile)
+
+    index = {}
+    for milk_type, rows in by_milk_type.items():
+        mt = milk_types[milk_type]
+
+        # The last default row wins, like the old is_default lookup
+        default = next((row for row in reversed(rows) if row.is_default), None)
+
+        # Dated rows sorted by date; on the same date a default row, then the later row, wins
+        dated = sorted(
+            ((getdate(row.effective_from), bool(row.is_default), i, row) for i, row in enumerate(rows) if row.effective_from),
+            key=lambda entry: entry[:3],
+        )
+        effective = {}
+        for effective_from, _is_default, _i, row in dated:
+            effective[effective_from] = row
+
+        index[milk_type] = MilkPriceIndex(
+            effective_dates=tuple(effective),
+            cards=tuple(make_rate_card(supplier, mt, row, matrices) for row in effective.values()),
+            default_card=make_rate_card(supplier, mt, default, matrices) if default else None,
+        )
+
+    return index
+
+
+# ! Return {milk_type: MilkPriceIndex} of a supplier from the cache, building it on first use
+def get_price_index(supplier):
+    """
+    The whole price history of a supplier is cached as one hash field, so a
+    Purchase Receipt is priced with a single cache read whatever its row
+    count or posting date. Cleared when the Supplier or any Milk Type is saved.
+    """
+    index = frappe.cache.hget(RATE_CARD_CACHE_KEY, supplier)
+    if index is None:
+        index = build_price_index(supplier)
+        frappe.cache.hset(RATE_CARD_CACHE_KEY, supplier, index)
+
+    return index
+
+
+# ! Milk types a supplier may deliver (those with a Supplier Milk Profile row), from the cached price index
+def get_allowed_milk_types(supplier):
+    """
+    Frozen set of the supplier's milk types. It is read from the same cache
+    entry as the rate cards, so validation and pricing share one cache read
+    and one invalidation (Supplier / Milk Type save).
+    """
+    return frozenset(get_price_index(supplier)) if supplier else frozenset()
+
+
+# ! Return the rate card of a (supplier, milk type) pair in force on a posting date
+def get_rate_card(supplier, milk_type, posting_date=None):
+    index = get_price_index(supplier).get(milk_type)
+    if index is None:
+        # A supplier is never priced without a profile, not even from a Milk Type rate matrix
+        frappe.throw(
+            _("No Supplier Milk Profile defined for Supplier {0} & Milk Type {1}").format(supplier, milk_type)
+        )
+
+    card = index.card_for(posting_date)
+    if card is None and posting_date:
+        frappe.throw(
+            _("No Supplier Milk Profile of Supplier {0} & Milk Type {1} is in force on {2}").format(
+                supplier, milk_type, frappe.format(posting_date, "Date")
+            )
+        )
+    if card is None:
+        frappe.throw(
+            _("No default Supplier Milk Profile defined for Supplier {0} & Milk Type {1}").format(supplier, milk_type)
+        )
+
+    return card
+
+
+# ! Serialise the price index of a supplier into the compact JSON rate card evaluated by the Purchase Receipt form
+def get_client_rate_card_payload(supplier):
+    """
+    Returns {"version", "supplier", "kg_per_litre", "milk_types", "matrices",
+    "checksum"}. Each milk type carries its effective dates, the cards in
+    force from those dates and the default card; rate matrices are listed
+    once and referenced by name. The checksum is a SHA-1 of the canonical
+    JSON, so the form (and set_milk_pricing_on_items) can tell a stale card.
+    """
+    index = get_price_index(supplier) if supplier else {}
+    matrices = {}
+
+    def client_card(card):
+        values = {
+            f.name: getattr(card, f.name)
+            for f in fields(card)
+            if f.name not in ("supplier", "milk_type", "effective_from", "rate_matrix")
+        }
+        values["rate_matrix"] = None
+
+        if card.rate_matrix:
+            matrix = card.rate_matrix
+            values["rate_matrix"] = matrix.name
+            matrices[matrix.name] = {
+                "fat_breaks": list(matrix.fat_breaks),
+                "snf_breaks": list(matrix.snf_breaks),
+                "rates": [list(row) for row in matrix.rates],
+            }
+
+        return values
+
+    payload = {
+        "version": CLIENT_RATE_CARD_VERSION,
+        "supplier": supplier,
+        "kg_per_litre": KG_PER_LITRE,
+        "milk_types": {
+            milk_type: {
+                "effective_dates": [str(date) for date in price_index.effective_dates],
+                "cards": [client_card(card) for card in price_index.cards],
+                "default_card": client_card(price_index.default_card) if price_index.default_card else None,
+                "default_is_dated": bool(price_index.default_card and price_index.default_card.effective_from),
+            }
+            for milk_type, price_index in index.items()
+        },
+        "matrices": matrices,
+    }
+
+    payload["checksum"] = hashlib.sha1(
+        json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    ).hexdigest()
+
+    return payload
+
+
+# ! Whitelisted: client rate card of a supplier; only the checksum comes back when the caller's card is current
+@frappe.whitelist()
+def get_client_rate_card(supplier, checksum=None):
+    frappe.has_permission("Supplier", "read", supplier, throw=True)
+
+    payload = get_client_rate_card_payload(supplier)
+    if checksum and checksum == payload["checksum"]:
+        return {"checksum": checksum, "unchanged": 1}
+
+    return payload
+
+
+# ! Validate a rate card before pricing with it
+def validate_rate_card(card):
+    if card.base_rate_type == "Rate Matrix":
+        if not card.rate_matrix:
+            frappe.throw(_("Rate Matrix not defined for Supplier {0} & Milk Type {1}").format(card.supplier, card.milk_type))
+        return
+
+    if not card.base_rate:
+        frappe.throw(_("Base Rate not defined for Supplier {0} & Milk Type {1}").format(card.supplier, card.milk_type))
+
+    if card.base_rate_type not in BASE_RATE_TYPES:
+        frappe.throw(_("Unsupported Base Rate Type {0} for Milk Type {1}").format(card.base_rate_type, card.milk_type))
+
+
+# ! Drop cached rate cards of a Supplier when it (and its Supplier Milk Profile rows) is saved or deleted
+def clear_supplier_rate_cards(doc, method=None):
+    frappe.cache.hdel(RATE_CARD_CACHE_KEY, doc.name)
+
+
+# ! Drop all cached rate cards (a Milk Type change affects every supplier)
+def clear_rate_cards(doc=None, method=None):
+    frappe.cache.delete_value(RATE_CARD_CACHE_KEY)
+
+
+# ! Validation messages of get_milk_rate_for_pr_item, in the order it checks them
+def get_pricing_input_error(supplier, milk_type, fat, snf, weight_kg):
+    if not supplier:
+        return _("Supplier is required to calculate milk rate.")
+    if not milk_type:
+        return _("Milk Type is required to calculate milk rate.")
+    if not flt(weight_kg):
+        return _("Weight (KG) is required to calculate milk rate.")
+    if not flt(fat):
+        return _("FAT % is required to calculate milk rate.")
+    if not flt(snf):
+        return _("SNF is required to calculate milk rate.")
+
+
+# ! Price many milk rows at once, grouped by rate card
+def price_milk_rows(rows):
+    """
+    Bulk pricing API.
+
+    `rows` is a list of (supplier, milk_type, fat, snf, lr, weight_kg[,
+    posting_date]) tuples or dicts with those keys. Each row is resolved to
+    the rate card in force on its posting date (the default profile when it
+    has none), rows are grouped by card, and every group is priced with array math when
+    NumPy is available (scalar price() otherwise). Results match
+    get_milk_rate_for_pr_item() exactly and come back in input order; rows
+    that cannot be priced get {"error": message} instead of aborting the run.
+    """
+    rows = [_normalise_pricing_row(row) for row in rows]
+    results = [None] * len(rows)
+    resolved = {}
+    groups = {}
+
+    for i, row in enumerate(rows):
+        error = get_pricing_input_error(row["supplier"], row["milk_type"], row["fat"], row["snf"], row["weight_kg"])
+        if error:
+            results[i] = {"error": error}
+            continue
+
+        key = (row["supplier"], row["milk_type"], row["posting_date"])
+        if key not in resolved:
+            try:
+                card = get_rate_card(*key)
+                validate_rate_card(card)
+                resolved[key] = card
+            except frappe.ValidationError as e:
+                resolved[key] = str(e)
+
+        card = resolved[key]
+        if isinstance(card, str):
+            results[i] = {"error": card}
+            continue
+
+        groups.setdefault(card, []).append(i)
+
+    for card, indexes in groups.items():
+        if np is None:
+            for i in indexes:
+                row = rows[i]
+                try:
+                    results[i] = card.price(row["fat"], row["snf"], row["lr"], row["weight_kg"])
+                except frappe.ValidationError as e:
+                    results[i] = {"error": str(e)}
+            continue
+
+        priced = card.price_many(
+            *([flt(rows[i][field]) for i in indexes] for field in ("fat", "snf", "lr", "weight_kg"))
+        )
+        columns = {key: values.tolist() for key, values in priced.items()}
+
+        for position, i in enumerate(indexes):
+            result = {key: values[position] for key, values in columns.items()}
+
+            if result["final_rate"] != result["final_rate"]:  # NaN: off the rate matrix
+                results[i] = {
+                    "error": _("FAT {0} / SNF {1} is outside Rate Matrix {2}").format(
+                        flt(rows[i]["fat"]), flt(rows[i]["snf"]), card.rate_matrix.name
+                    )
+                }
+                continue
+
+            result.setdefault("base_rate", card.base_rate)
+            result.update(
+                kg_per_litre=KG_PER_LITRE,
+                rate_type=card.base_rate_type,
+                payable_fat_kg=0,
+            )
+            results[i] = result
+
+    return results
+
+
+def _normalise_pricing_row(row):
+    if isinstance(row, dict):
+        return {
+            "supplier": row.get("supplier"),
+            "milk_type": row.get("milk_type") or row.get("custom_milk_type"),
+            "fat": row.get("fat") or row.get("custom_fat"),
+            "snf": row.get("snf") or row.get("custom_snf"),
+            "lr": row.get("lr") or row.get("custom_lr"),
+            "weight_kg": row.get("weight_kg"),
+            "posting_date": row.get("posting_date"),
+        }
+
+    supplier, milk_type, fat, snf, lr, weight_kg, *posting_date = row
+    return {
+        "supplier": supplier,
+        "milk_type": milk_type,
+        "fat": fat,
+        "snf": snf,
+        "lr": lr,
+        "weight_kg": weight_kg,
+        "posting_date": posting_date[0] if posting_date else None,
+    }
+
+
+# ! Whitelisted bulk pricing endpoint: one call for a whole day of receipts
+@frappe.whitelist()
+def get_milk_rates_bulk(rows):
+    if isinstance(rows, str):
+        rows = json.loads(rows)
+
+    rows = [_normalise_pricing_row(row) for row in rows]
+
+    # Rate cards are per supplier: same access rule as get_client_rate_card
+    for supplier in {row["supplier"] for row in rows if row["supplier"]}:
+        frappe.has_permission("Supplier", "read", supplier, throw=True)
+
+    return price_milk_rows(rows)
@@ -0,0 +1,327 @@
+from datetime import timedelta
+
+import frappe
+from erpnext.stock.utils import get_stock_balance
+from frappe import _
+from frappe.utils import add_days, add_to_date, flt, now_datetime, nowdate
+
+from sheetal_supply_chain.py.milk_blending import apply_quality_blend
+from sheetal_supply_chain.py.naming import allocate_series_names
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_repost.milk_quality_repost import (
+    queue_reposts_for_backdated_entries,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+    refresh_snapshots,
+    update_snapshots_for_entries,
+)
+
+MQLE_DOCTYPE = "Milk Quality Ledger Entry"
+MQLE_NAMING_SERIES = "MQLE-.YYYY.-.########"
+SETTINGS_DOCTYPE = "Milk Quality Settings"
+
+# Functions that post the Milk Quality Ledger of a submitted voucher, in order
+MQLE_POSTING_METHODS = {
+    "Purchase Receipt": (
+        "sheetal_supply_chain.py.purchase_receipt.create_mqle_on_pr_submit",
+    ),
+    "Stock Entry": (
+        "sheetal_supply_chain.py.stock_entry.create_mqle_on_se_submit",
+    ),
+}
+
+
+# ! Build an in-memory Milk Quality Ledger Entry row for a voucher (nothing is written to the database here)
+def make_mqle(**values):
+    """
+    Return a new, unsaved MQLE document populated with `values`.
+    Use post_mqle_entries() to write a voucher's rows in one batch.
+    """
+    mqle = frappe.new_doc(MQLE_DOCTYPE)
+    mqle.update(values)
+    return mqle
+
+
+# ! Insert all Milk Quality Ledger Entries of a voucher as submitted rows with one multi-row insert
+def post_mqle_entries(entries):
+    """
+    Write submitted MQLE rows in bulk.
+
+    Names are reserved from the MQLE naming series as one block and every
+    row is inserted with docstatus = 1, exactly like save() + submit() would
+    leave it, but without running the per-row document lifecycle. The Milk
+    Quality Snapshot of every touched key is updated in the same transaction.
+
+    Rows whose (voucher_type, voucher_no, voucher_detail_no) is already in the
+    ledger are skipped, so posting a voucher twice (a retried background job,
+    the reconciliation job) never duplicates entries.
+    Returns the names of the inserted rows, in the order of `entries`.
+    """
+    entries = skip_posted_entries(entries)
+    if not entries:
+        return []
+
+    # Stamp "quality after transaction" from the running tank composition
+    apply_quality_blend(entries)
+
+    names = allocate_series_names(MQLE_NAMING_SERIES, len(entries))
+    user = frappe.session.user
+    now = now_datetime()
+
+    fields = None
+    values = []
+
+    for i, (mqle, name) in enumerate(zip(entries, names, strict=True)):
+        # Keep creation strictly increasing so "latest entry" lookups ordered
+        # by creation still see the rows in the order they were built.
+        timestamp = now + timedelta(microseconds=i)
+
+        mqle.name = name
+        mqle.owner = user
+        mqle.modified_by = user
+        mqle.creation = timestamp
+        mqle.modified = timestamp
+        mqle.docstatus = 1
+
+        row = mqle.get_valid_dict(convert_dates_to_str=True)
+        if fields is None:
+            fields = list(row)
+
+        values.append(tuple(row.get(f) for f in fields))
+
+    frappe.db.bulk_insert(MQLE_DOCTYPE, fields, values)
+
+    # Keep the "current milk quality" snapshots in the same transaction
+    update_snapshots_for_entries(entries)
+
+    # Back-dated voucher: later entries of the same item and warehouse are
+    # recomputed by a background repost so the submit itself stays fast
+    queue_reposts_for_backdated_entries(entries)
+
+    return names
+
+
+# ! Cancel all submitted Milk Quality Ledger Entries of a voucher with one statement
+def cancel_mqle_entries(voucher_type, voucher_no):
+    """
+    Set-based replacement for loading and cancelling every MQLE of a voucher.
+
+    All submitted rows are flipped to docstatus = 2 / is_cancelled = 1 in one
+    UPDATE. A single Info comment on the voucher records which entries were
+    cancelled. Snapshots of the touched keys fall back to the previous entry
+    in the same transaction, and later entries are queued for repost.
+    Returns the names of the cancelled entries.
+    """
+    entries = frappe.get_all(
+        MQLE_DOCTYPE,
+        filters={"voucher_type": voucher_type, "voucher_no": voucher_no, "docstatus": 1},
+        fields=["name", "item_code", "warehouse", "batch_no", "posting_date", "posting_time", "voucher_type", "voucher_no"],
+    )
+
+    if not entries:
+        return []
+
+    frappe.db.sql(
+        """
+        UPDATE `tabMilk Quality Ledger Entry`
+        SET docstatus = 2, is_cancelled = 1, modified = %(now)s, modified_by = %(user)s
+        WHERE voucher_type = %(voucher_type)s
+          AND voucher_no = %(voucher_no)s
+          AND docstatus = 1
+        """,
+        {
+            "now": now_datetime(),
+            "user": frappe.session.user,
+            "voucher_type": voucher_type,
+            "voucher_no": voucher_no,
+        },
+    )
+
+    names = [entry.name for entry in entries]
+
+    frappe.get_doc(
+        {
+            "doctype": "Comment",
+            "comment_type": "Info",
+            "reference_doctype": voucher_type,
+            "reference_name": voucher_no,
+            "content": _("Cancelled {0} Milk Quality Ledger Entries: {1}").format(len(names), ", ".join(names)),
+        }
+    ).insert(ignore_permissions=True)
+
+    refresh_snapshots((entry.item_code, entry.warehouse, entry.batch_no) for entry in entries)
+    queue_reposts_for_backdated_entries(entries)
+
+    return names
+
+
+# ! Drop entries whose idempotency key (voucher_type, voucher_no, voucher_detail_no) is already posted
+def skip_posted_entries(entries):
+    posted = set()
+
+    for voucher_type, voucher_no in {(e.get("voucher_type"), e.get("voucher_no")) for e in entries}:
+        for voucher_detail_no in frappe.get_all(
+            MQLE_DOCTYPE,
+            filters={"voucher_type": voucher_type, "voucher_no": voucher_no, "docstatus": 1},
+            pluck="voucher_detail_no",
+        ):
+            posted.add((voucher_type, voucher_no, voucher_detail_no or ""))
+
+    if not posted:
+        return entries
+
+    return [
+        e for e in entries
+        if (e.get("voucher_type"), e.get("voucher_no"), e.get("voucher_detail_no") or "") not in posted
+    ]
+
+
+# ! Resolve the stock balance after a voucher for all its (item, warehouse) keys with one Stock Ledger query
+def get_qty_after_transaction_map(voucher_type, voucher_no, keys):
+    """
+    Batched replacement for calling get_stock_balance() once per row.
+
+    `keys` is an iterable of (item_code, warehouse, posting_date, posting_time).
+    The voucher's own Stock Ledger Entries are read once; the last entry per
+    (item_code, warehouse) holds the cumulative balance after the voucher, so
+    rows sharing a key reuse the same result. Keys the voucher did not post
+    to the stock ledger fall back to get_stock_balance() once per key.
+
+    Returns {(item_code, warehouse): qty_after_transaction}.
+    """
+    pending = {}
+    for item_code, warehouse, posting_date, posting_time in keys:
+        if item_code and warehouse:
+            pending.setdefault((item_code, warehouse), (posting_date, posting_time))
+
+    if not pending:
+        return {}
+
+    balances = {}
+
+    sles = frappe.db.sql(
+        """
+        SELECT item_code, warehouse, qty_after_transaction
+        FROM `tabStock Ledger Entry`
+        WHERE voucher_type = %s
+          AND voucher_no = %s
+          AND is_cancelled = 0
+        ORDER BY creation
+        """,
+        (voucher_type, voucher_no),
+        as_dict=True,
+    )
+
+    # Later entries overwrite earlier ones -> cumulative balance per key
+    for sle in sles:
+        key = (sle.item_code, sle.warehouse)
+        if key in pending:
+            balances[key] = flt(sle.qty_after_transaction)
+
+    for key, (posting_date, posting_time) in pending.items():
+        if key in balances:
+            continue
+
+        balances[key] = get_stock_balance(
+            item_code=key[0],
+            warehouse=key[1],
+            posting_date=posting_date,
+            posting_time=posting_time,
+            with_valuation_rate=False,
+            with_serial_no=False
+        )
+
+    return balances
+
+
+# ! on_submit hook: post the voucher's Milk Quality Ledger now, or after commit when posting is deferred
+def post_mqle_on_submit(doc, method=None):
+    if is_ledger_posting_deferred() and not doc.flags.post_mqle_now:
+        enqueue_mqle_posting(doc.doctype, doc.name)
+        return
+
+    run_mqle_posting(doc)
+
+
+def is_ledger_posting_deferred():
+    return bool(frappe.db.get_single_value(SETTINGS_DOCTYPE, "defer_ledger_posting", cache=True))
+
+
+def run_mqle_posting(doc):
+    for method in MQLE_POSTING_METHODS.get(doc.doctype, ()):
+        frappe.get_attr(method)(doc)
+
+
+# ! Queue ledger posting of a voucher on the short queue, once per voucher, after the submit commits
+def enqueue_mqle_posting(voucher_type, voucher_no):
+    frappe.enqueue(
+        post_deferred_mqle,
+        queue="short",
+        job_id=f"mqle_posting::{voucher_type}::{voucher_no}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        voucher_type=voucher_type,
+        voucher_no=voucher_no,
+    )
+
+
+# ! Background job: post the ledger of a submitted voucher (no-op if it was cancelled meanwhile)
+def post_deferred_mqle(voucher_type, voucher_no):
+    # Serialise with a concurrent cancel / reconciliation of the same voucher
+    docstatus = frappe.db.get_value(voucher_type, voucher_no, "docstatus", for_update=True)
+    if docstatus != 1:
+        return
+
+    doc = frappe.get_doc(voucher_type, voucher_no)
+    doc.flags.post_mqle_now = True
+    run_mqle_posting(doc)
+
+
+# ! Scheduled job: re-post vouchers of the reconciliation window whose milk ledger entries are missing
+def reconcile_missing_mqle():
+    """
+    Find submitted Purchase Receipts and Stock Entries with milk rows
+    (custom_maintain_fat_snf) and no Milk Quality Ledger Entry, and post them.
+    Vouchers touched in the last few minutes are left to their pending job.
+    """
+    days = frappe.db.get_single_value(SETTINGS_DOCTYPE, "reconciliation_days") or 7
+    values = {
+        "from_date": add_days(nowdate(), -days),
+        "settled_before": add_to_date(now_datetime(), minutes=-10),
+    }
+
+    missing = []
+
+    for voucher_type, child_doctype, condition in (
+        ("Purchase Receipt", "Purchase Receipt Item", ""),
+        ("Stock Entry", "Stock Entry Detail", "AND v.stock_entry_type IN ('Manufacture', 'Material Issue')"),
+    ):
+        vouchers = frappe.db.sql(
+            f"""
+            SELECT v.name
+            FROM `tab{voucher_type}` v
+            WHERE v.docstatus = 1
+              AND v.posting_date >= %(from_date)s
+              AND v.modified < %(settled_before)s
+              {condition}
+              AND EXISTS (
+                  SELECT 1 FROM `tab{child_doctype}` d
+                  WHERE d.parent = v.name AND d.custom_maintain_fat_snf = 1
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM `tabMilk Quality Ledger Entry` m
+                  WHERE m.voucher_type = %(voucher_type)s AND m.voucher_no = v.name
+              )
+            ORDER BY v.posting_date, v.posting_time
+            """,
+            {**values, "voucher_type": voucher_type},
+            pluck=True,
+        )
+        missing.extend((voucher_type, voucher_no) for voucher_no in vouchers)
+
+    for voucher_type, voucher_no in missing:
+        try:
+            post_deferred_mqle(voucher_type, voucher_no)
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(f"Milk Quality Ledger reconciliation failed for {voucher_type} {voucher_no}")
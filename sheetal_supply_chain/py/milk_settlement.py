@@ -0,0 +1,146 @@
+import frappe
+from frappe.utils import flt
+
+SETTLEMENT_CHUNK_SIZE = 2000
+
+# Running sums kept per (supplier, milk type)
+SETTLEMENT_SUM_FIELDS = (
+    "qty_in_liter",
+    "qty_in_kg",
+    "fat_kg",
+    "snf_kg",
+    "fat_addition_amount",
+    "fat_deduction_amount",
+    "snf_addition_amount",
+    "snf_deduction_amount",
+    "payable_amount",
+)
+
+
+# ! Stream priced milk rows of submitted Purchase Receipts of a period in keyset-paginated chunks
+def iter_settlement_rows(company, from_date, to_date, supplier=None, chunk_size=SETTLEMENT_CHUNK_SIZE):
+    """
+    Yield PR item rows carrying the milk pricing written by
+    set_milk_pricing_on_items(), ordered by (posting_date, parent, idx).
+
+    Each page resumes after the last key of the previous one, so the cost of
+    a page does not grow with the offset and only one page is held in memory.
+    """
+    conditions = ""
+    values = {"company": company, "from_date": from_date, "to_date": to_date}
+
+    if supplier:
+        conditions = "AND pr.supplier = %(supplier)s"
+        values["supplier"] = supplier
+
+    after = None
+
+    while True:
+        keyset = ""
+        if after:
+            keyset = "AND (pr.posting_date, pri.parent, pri.idx) > (%(after_date)s, %(after_parent)s, %(after_idx)s)"
+            values["after_date"], values["after_parent"], values["after_idx"] = after
+
+        rows = frappe.db.sql(
+            f"""
+            SELECT
+                pr.posting_date, pri.parent, pri.idx,
+                pr.supplier, pri.custom_milk_type AS milk_type,
+                pri.qty, pri.stock_qty, pri.custom_fat_kg, pri.custom_snf_kg,
+                pri.milk_final_rate, pri.milk_final_amount,
+                pri.milk_fat_addition, pri.milk_fat_deduction,
+                pri.milk_snf_addition, pri.milk_snf_deduction
+            FROM `tabPurchase Receipt` pr
+            INNER JOIN `tabPurchase Receipt Item` pri ON pri.parent = pr.name
+            WHERE pr.docstatus = 1
+              AND pr.company = %(company)s
+              AND pr.posting_date BETWEEN %(from_date)s AND %(to_date)s
+              AND IFNULL(pri.custom_milk_type, '') != ''
+              AND IFNULL(pri.milk_final_rate, 0) != 0
+              {conditions}
+              {keyset}
+            ORDER BY pr.posting_date, pri.parent, pri.idx
+            LIMIT {int(chunk_size)}
+            """,
+            values,
+            as_dict=True,
+        )
+
+        yield from rows
+
+        if len(rows) < chunk_size:
+            return
+
+        last = rows[-1]
+        after = (last.posting_date, last.parent, last.idx)
+
+
+# ! Fold one priced PR item row into the running sums of its (supplier, milk type)
+def add_settlement_row(totals, row):
+    key = (row.supplier, row.milk_type)
+
+    entry = totals.get(key)
+    if entry is None:
+        entry = totals[key] = frappe._dict(
+            supplier=row.supplier,
+            milk_type=row.milk_type,
+            receipt_count=0,
+            last_receipt=None,
+            **{field: 0.0 for field in SETTLEMENT_SUM_FIELDS},
+        )
+
+    # milk_final_amount = milk_final_rate * litres priced, so each rate
+    # component times those litres is its share of the payable amount
+    amount = flt(row.milk_final_amount)
+    priced_litres = amount / flt(row.milk_final_rate)
+
+    # Rows arrive ordered by parent, so a receipt is counted on its first row
+    if entry.last_receipt != row.parent:
+        entry.receipt_count += 1
+        entry.last_receipt = row.parent
+
+    entry.qty_in_liter += flt(row.qty)
+    entry.qty_in_kg += flt(row.stock_qty)
+    entry.fat_kg += flt(row.custom_fat_kg)
+    entry.snf_kg += flt(row.custom_snf_kg)
+    entry.fat_addition_amount += flt(row.milk_fat_addition) * priced_litres
+    entry.fat_deduction_amount += flt(row.milk_fat_deduction) * priced_litres
+    entry.snf_addition_amount += flt(row.milk_snf_addition) * priced_litres
+    entry.snf_deduction_amount += flt(row.milk_snf_deduction) * priced_litres
+    entry.payable_amount += amount
+
+
+# ! Aggregate a settlement period into payable summaries per supplier and milk type
+def get_settlement_summary(company, from_date, to_date, supplier=None):
+    """
+    Returns (summary, receipt_count). The summary is a list of dicts (one
+    per supplier and milk type, sorted) with quantities, FAT/SNF kg,
+    addition / deduction amounts and the payable amount. receipt_count is
+    the number of distinct receipts: a receipt with cow and buffalo rows is
+    in two summary rows but counted once. Memory is bounded by the number of
+    (supplier, milk type) pairs, not by the number of receipts.
+    """
+    totals = {}
+    receipt_count = 0
+    last_receipt = None
+
+    for row in iter_settlement_rows(company, from_date, to_date, supplier):
+        add_settlement_row(totals, row)
+
+        # Rows of a receipt are contiguous in the stream
+        if row.parent != last_receipt:
+            receipt_count += 1
+            last_receipt = row.parent
+
+    summary = []
+    for key in sorted(totals):
+        entry = totals[key]
+        entry.pop("last_receipt")
+
+        entry.avg_fat_per = entry.fat_kg / entry.qty_in_kg * 100 if entry.qty_in_kg else 0
+        entry.avg_snf_per = entry.snf_kg / entry.qty_in_kg * 100 if entry.qty_in_kg else 0
+        entry.average_rate = entry.payable_amount / entry.qty_in_liter if entry.qty_in_liter else 0
+
+        summary.append(entry)
+
+    return summary, receipt_count
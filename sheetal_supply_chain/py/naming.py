@@ -0,0 +1,36 @@
+import frappe
+from frappe.model.naming import NamingSeries
+
+
+# ! Reserve a contiguous block of names from a naming series with a single counter update
+def allocate_series_names(series, count):
+    """
+    Allocate `count` names from a naming series (e.g. MQLE-.YYYY.-.########)
+    in one go. Mirrors frappe.model.naming.getseries but bumps the counter
+    by the whole block instead of once per document.
+    """
+    if count <= 0:
+        return []
+
+    prefix = NamingSeries(series).get_prefix()
+    digits = series.count("#") or 5
+
+    current = frappe.db.sql(
+        "SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE",
+        (prefix,),
+    )
+
+    if current and current[0][0] is not None:
+        start = int(current[0][0])
+        frappe.db.sql(
+            "UPDATE `tabSeries` SET `current` = `current` + %s WHERE `name` = %s",
+            (count, prefix),
+        )
+    else:
+        start = 0
+        frappe.db.sql(
+            "INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)",
+            (prefix, count),
+        )
+
+    return [f"{prefix}{str(start + i).zfill(digits)}" for i in range(1, count + 1)]
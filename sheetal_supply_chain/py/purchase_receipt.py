@@ -1,7 +1,37 @@
 import frappe
 from frappe import _
-from erpnext.stock.utils import get_stock_balance
 from frappe.utils import nowdate, nowtime, flt
+from sheetal_supply_chain.py.doc_changes import get_changed_rows
+from sheetal_supply_chain.py.milk_quality_ledger import (
+    cancel_mqle_entries,
+    get_qty_after_transaction_map,
+    make_mqle,
+    post_mqle_entries,
+)
+from sheetal_supply_chain.py.milk_pricing import (
+    get_allowed_milk_types,
+    get_client_rate_card_payload,
+    get_price_index,
+    get_rate_card,
+    validate_rate_card,
+)
+from sheetal_supply_chain.py.uom_conversion import (
+    get_item_uom_conversions,
+    get_uom_conversion_factor,
+    preload_uom_conversions,
+)
+from sheetal_supply_chain.py.warehouse_validation import validate_one_item_warehouses
+from sheetal_supply_chain.sheetal_supply_chain.doctype.quality_inspection_fact.quality_inspection_fact import (
+    get_fact_readings,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.specification_alias.specification_alias import (
+    get_numeric_readings,
+)
+
+
+# Inputs of milk pricing: a row is re-priced only when one of these changed
+PRICING_PARENT_FIELDS = ("supplier", "posting_date", "custom_net_weight")
+PRICING_ROW_FIELDS = ("custom_milk_type", "custom_fat", "custom_snf", "custom_lr", "qty", "rate")
 
 
 # ! Fetch latest FAT, SNF and LR values from Quality Inspection and calculate FAT/SNF KG for real-time client-side updates
@@ -11,30 +41,22 @@ def update_fat_snf_js(qi, stock_qty=None):
     if not qi:
         return {"fat": 0, "snf": 0, "lr": 0, "fat_kg": 0, "snf_kg": 0}
 
-    # Always load fresh QI from database
-    qi_doc = frappe.get_doc("Quality Inspection", qi)
-
-    # Force load fresh child table rows
-    readings = frappe.get_all(
-        "Quality Inspection Reading",
-        filters={"parent": qi},
-        fields=["specification", "reading_1"],
-        order_by="idx asc",
-    )
-
-    fat = 0
-    snf = 0
-    lr = 0
+    # Submitted QI: readings already pivoted into Quality Inspection Fact
+    fact = get_fact_readings(qi, ("fat", "snf", "lr"))
+    if fact:
+        fat, snf, lr = flt(fact.fat), flt(fact.snf), flt(fact.lr)
+    else:
+        # Draft QI: load fresh child table rows
+        readings = frappe.get_all(
+            "Quality Inspection Reading",
+            filters={"parent": qi},
+            fields=["specification", "reading_1"],
+            order_by="idx asc",
+        )
 
-    # Fresh, newly created QI reading will be picked here
-    for r in readings:
-        spec = (r.specification or "").strip().upper()
-        if spec == "FAT":
-            fat = frappe.utils.flt(r.reading_1 or 0)
-        if spec in ("S.N.F.", "SNF", "S N F"):
-            snf = frappe.utils.flt(r.reading_1 or 0)
-        if spec in ("LR", "L.R.", "LACTOMETER READING"):
-            lr = frappe.utils.flt(r.reading_1 or 0)
+        # Fresh, newly created QI reading will be picked here
+        values = get_numeric_readings(readings)
+        fat, snf, lr = values.get("fat", 0), values.get("snf", 0), values.get("lr", 0)
 
     stock_qty = frappe.utils.flt(stock_qty or 0)
 
@@ -56,6 +78,22 @@ def create_mqle_on_pr_submit(doc, method=None):
     posting_date = doc.posting_date or nowdate()
     posting_time = doc.posting_time or nowtime()
 
+    entries = []
+
+    # Litre conversion factors for all items of this voucher in one query
+    preload_uom_conversions(row.item_code for row in doc.items)
+
+    # Balance AFTER transaction for every milk row, resolved in one query
+    balances = get_qty_after_transaction_map(
+        doc.doctype,
+        doc.name,
+        [
+            (row.item_code, row.warehouse, posting_date, posting_time)
+            for row in doc.items
+            if row.custom_maintain_fat_snf
+        ],
+    )
+
     for row in doc.items:
 
         # Only process milk items
@@ -65,14 +103,7 @@ def create_mqle_on_pr_submit(doc, method=None):
 
         # Get balance AFTER transaction
 
-        stock_qty_after = get_stock_balance(
-            item_code=row.item_code,
-            warehouse=row.warehouse,
-            posting_date=posting_date,
-            posting_time=posting_time,
-            with_valuation_rate=False,
-            with_serial_no=False
-        )
+        stock_qty_after = balances.get((row.item_code, row.warehouse), 0)
         
             
         #  UOM handling (same as QI)
@@ -80,11 +111,7 @@ def create_mqle_on_pr_submit(doc, method=None):
         stock_uom = frappe.get_cached_value("Item", row.item_code, "stock_uom") or "KG"
         included_uom = "Litre"
 
-        conversion_factor = frappe.db.get_value(
-            "UOM Conversion Detail",
-            {"parent": row.item_code, "uom": included_uom},
-            "conversion_factor"
-        ) or 1.0
+        conversion_factor = get_uom_conversion_factor(row.item_code, included_uom) or 1.0
 
         qty_after_litre = (
             stock_qty_after / conversion_factor
@@ -92,7 +119,7 @@ def create_mqle_on_pr_submit(doc, method=None):
             else stock_qty_after
         )
 
-        mqle = frappe.new_doc("Milk Quality Ledger Entry")
+        mqle = make_mqle()
 
         # Basic Details
         
@@ -105,6 +132,7 @@ def create_mqle_on_pr_submit(doc, method=None):
         mqle.voucher_type = doc.doctype     
         mqle.voucher_no = doc.name           
         mqle.voucher_detail_no = row.name    
+        mqle.entry_type = "Inward"
 
         mqle.posting_date = doc.posting_date
         mqle.posting_time = doc.posting_time
@@ -128,9 +156,10 @@ def create_mqle_on_pr_submit(doc, method=None):
         mqle.qty_after_transaction_in_kg = stock_qty_after
         
 
-        # Save + Submit
-        mqle.save(ignore_permissions=True)
-        mqle.submit()
+        entries.append(mqle)
+
+    # Save + Submit all milk rows of this PR in one batch
+    post_mqle_entries(entries)
 
 
 
@@ -142,24 +171,8 @@ def cancel_mqle_on_pr_cancel(doc, method=None):
     when PR is cancelled.
     """
     
-    # Find MQLE linked to this PR
-    mqle_list = frappe.get_all(
-        "Milk Quality Ledger Entry",
-        filters={
-            "voucher_type": doc.doctype,   
-            "voucher_no": doc.name         
-        },
-        fields=["name", "docstatus"]
-    )
-
-    if not mqle_list:
-        return  # No linked MQLE exists
-
-    for mqle in mqle_list:
-        if mqle.docstatus == 1: 
-            mqle_doc = frappe.get_doc("Milk Quality Ledger Entry", mqle.name)
-            mqle_doc.is_cancelled = 1
-            mqle_doc.cancel()
+    # Cancel every linked MQLE in one statement
+    cancel_mqle_entries(doc.doctype, doc.name)
 
 
 
@@ -168,22 +181,20 @@ def validate_milk_type_with_supplier_profile(doc, method=None):
     if not doc.supplier:
         return
 
+    # Only rows added or changed since the last save need checking
+    items = get_changed_rows(doc, "items", ("custom_milk_type", "custom_maintain_fat_snf"), ("supplier",))
+
     # Check if PR has any milk-type items (based on milk type, not checkbox)
     has_milk_items = any(
         getattr(item, "custom_milk_type", None)
-        for item in doc.items
+        for item in items
     )
     # If no milk items → no validation needed
     if not has_milk_items:
         return
 
-    # Fetch allowed milk types from Supplier → custom_supplier_milk_profile
-    supplier_milk_types = frappe.db.get_all(
-        "Supplier Milk Profile",
-        filters={"parent": doc.supplier},
-        fields=["milk_type"],
-        pluck="milk_type"
-    )
+    # Allowed milk types of the supplier (custom_supplier_milk_profile), shared with the pricing cache
+    supplier_milk_types = get_allowed_milk_types(doc.supplier)
 
     # Supplier has NO milk types but PR has milk items
     if not supplier_milk_types:
@@ -193,7 +204,7 @@ def validate_milk_type_with_supplier_profile(doc, method=None):
         )
 
     # Validate each milk item
-    for item in doc.items:
+    for item in items:
         if not getattr(item, "custom_maintain_fat_snf", 0):
             continue
 
@@ -207,7 +218,7 @@ def validate_milk_type_with_supplier_profile(doc, method=None):
         if milk_type not in supplier_milk_types:
             frappe.throw(
                 f"Milk Type <b>{milk_type}</b> in row {item.idx} is not allowed for Supplier <b>{doc.supplier}</b>.<br>"
-                f"Allowed Milk Types: <b>{', '.join(supplier_milk_types)}</b>"
+                f"Allowed Milk Types: <b>{', '.join(sorted(supplier_milk_types))}</b>"
             )
 
 
@@ -216,36 +227,12 @@ def validate_milk_type_with_supplier_profile(doc, method=None):
 
 # Cow-buffalo rate logic 
 
-# ! Fetch supplier-specific milk pricing profile for a given milk type including baseline FAT, SNF, and base rate
-def get_supplier_milk_profile(supplier: str, custom_milk_type: str):
-    if not supplier or not custom_milk_type:
-        return {}
-
-    profile = frappe.db.get_value(
-        "Supplier Milk Profile",
-        {
-            "parent": supplier,
-            "milk_type": custom_milk_type,
-            "is_default": 1,
-        },
-        ["baseline_fat", "baseline_snf", "baseline_lr", "base_rate"],
-        as_dict=True,
-    )
-    return profile or {}
-
 # ! Calculate SNF percentage based on FAT percentage and Lactometer Reading (LR)
 def calculate_snf(fat: float, lr: float) -> float:
     fat = flt(fat)
     lr = flt(lr)
     return (fat / 4.0) + (0.2 * lr) + 0.14
 
-# ! Fetch Milk Type configuration document (Cow, Buffalo, etc.) required for rate calculation
-def get_milk_type_config(milk_type: str):
-    """Fetch Milk Type doc (Cow / Buffalo etc.)."""
-    if not milk_type:
-        frappe.throw("Milk Type is required to calculate rate.")
-    return frappe.get_doc("Milk Type", milk_type)
-
 # ! Calculate milk purchase rate and amount for a Purchase Receipt item based on FAT, SNF,LR, milk type, and supplier rules
 @frappe.whitelist()
 def get_milk_rate_for_pr_item(
@@ -255,6 +242,7 @@ def get_milk_rate_for_pr_item(
     custom_snf: float,
     custom_lr: float,
     weight_kg: float,
+    posting_date: str | None = None,
 ):
     custom_fat = flt(custom_fat)
     custom_snf = flt(custom_snf)
@@ -272,166 +260,11 @@ def get_milk_rate_for_pr_item(
     if not custom_snf:
         frappe.throw("SNF is required to calculate milk rate.")
 
-    mt = get_milk_type_config(custom_milk_type)
-    profile = get_supplier_milk_profile(supplier, custom_milk_type)
-
-    kg_per_litre = 1.0339
-    qty_litre = weight_kg / kg_per_litre if kg_per_litre else 0
-
-    baseline_fat = flt(profile.get("baseline_fat") or 0)
-    baseline_snf = flt(profile.get("baseline_snf") or 0)
-    baseline_lr = flt(profile.get("baseline_lr") or 0)
-
-    base_rate = flt(profile.get("base_rate") or 0)
-    if not base_rate:
-        frappe.throw(f"Base Rate not defined for Supplier {supplier} & Milk Type {custom_milk_type}")
-
-    fat_addition = 0.0
-    fat_deduction = 0.0
-    snf_addition = 0.0
-    snf_deduction = 0.0
-    lr_addition = 0.0
-    lr_deduction = 0.0
-
-
-    snf_addition_rate = flt(getattr(mt, "snf_addition", 0))
-    snf_deduction_rate = flt(getattr(mt, "snf_deduction", 0))
-    fat_addition_rate = flt(getattr(mt, "fat_addition", 0))
-    fat_deduction_rate = flt(getattr(mt, "fat_deduction", 0))
-    lr_addition_rate = flt(getattr(mt, "lr_addition", 0))
-    lr_deduction_rate = flt(getattr(mt, "lr_deduction", 0))
-
-
-    if mt.base_rate_type == "Per Litre":
-        if baseline_fat:
-            fat_diff = custom_fat - baseline_fat
-                       
-            if getattr(mt, "fat_addition_enabled", 0) and fat_diff > 0:
-                fat_addition = fat_diff * fat_addition_rate
-
-            if getattr(mt, "fat_deduction_enabled", 0) and fat_diff < 0:
-                fat_deduction = abs(fat_diff) * fat_deduction_rate
-
-        if baseline_snf:
-            snf_diff = custom_snf - baseline_snf
-
-            if getattr(mt, "snf_addition_enabled", 0) and snf_diff > 0:
-                snf_addition = snf_diff * snf_addition_rate
-
-            if getattr(mt, "snf_deduction_enabled", 0) and snf_diff < 0:
-                snf_deduction = abs(snf_diff) * snf_deduction_rate
-
-        final_rate = base_rate + fat_addition + snf_addition - fat_deduction - snf_deduction
-        amount = final_rate * qty_litre
-
-        return {
-            "custom_snf": custom_snf,
-            "qty_litre": qty_litre,
-            "kg_per_litre": kg_per_litre,
-            "final_rate": final_rate,
-            "amount": amount,
-            "base_rate": base_rate,
-            "fat_addition": fat_addition,
-            "fat_deduction": fat_deduction,
-            "snf_addition": snf_addition,
-            "snf_deduction": snf_deduction,
-            "rate_type": "Per Litre",
-            "payable_fat_kg": 0,
-            "rate_per_litre_display": final_rate,
-        }
-
-    elif mt.base_rate_type == "Per KG Fat":
-
-        if baseline_snf:
-            snf_diff = custom_snf - baseline_snf
-
-            if getattr(mt, "snf_addition_enabled", 0) and snf_diff > 0:
-                snf_addition = snf_diff * snf_addition_rate
-                                
-            if getattr(mt, "snf_deduction_enabled", 0) and snf_diff < 0:
-                snf_deduction = abs(snf_diff) * snf_deduction_rate
-                
-        if baseline_fat:
-            fat_diff = custom_fat - baseline_fat
-                       
-            if getattr(mt, "fat_addition_enabled", 0) and fat_diff > 0:
-                fat_addition = fat_diff * fat_addition_rate
-
-            if getattr(mt, "fat_deduction_enabled", 0) and fat_diff < 0:
-                fat_deduction = abs(fat_diff) * fat_deduction_rate
-
-        final_rate_per_kg_fat = (base_rate * custom_fat) + snf_addition + fat_addition - snf_deduction - fat_deduction
-
-        amount =  final_rate_per_kg_fat * qty_litre
-
-        rate_per_litre_display = amount / qty_litre if qty_litre else 0
-
-        return {
-            "custom_snf": custom_snf,
-            "qty_litre": qty_litre,
-            "kg_per_litre": kg_per_litre,
-            "final_rate": final_rate_per_kg_fat,
-            "amount": amount,
-            "base_rate": base_rate,
-            "fat_addition": fat_addition,
-            "fat_deduction": fat_deduction,
-            "snf_addition": snf_addition,
-            "snf_deduction": snf_deduction,
-            "rate_type": "Per KG Fat",
-            "payable_fat_kg": 0,
-            "rate_per_litre_display": rate_per_litre_display,
-        }
-    
-    elif mt.base_rate_type == "Per LR":
-        if baseline_fat:
-            fat_diff = custom_fat - baseline_fat
-
-            if getattr(mt, "fat_addition_enabled", 0) and fat_diff > 0:
-                fat_addition = fat_diff * fat_addition_rate
-                
-            if getattr(mt, "fat_deduction_enabled", 0) and fat_diff < 0:
-                fat_deduction = abs(fat_diff) * fat_deduction_rate
+    # Rate card in force on the posting date, from the supplier's cached price index
+    card = get_rate_card(supplier, custom_milk_type, posting_date)
+    validate_rate_card(card)
 
-
-        if baseline_snf:
-            snf_diff = custom_snf - baseline_snf
-
-            if getattr(mt, "snf_addition_enabled", 0) and snf_diff > 0:
-                snf_addition = snf_diff * snf_addition_rate
-
-            if getattr(mt, "snf_deduction_enabled", 0) and snf_diff < 0:
-                snf_deduction = abs(snf_diff) * snf_deduction_rate
-        
-        if baseline_lr:
-            lr_diff = custom_lr - baseline_lr
-
-            if getattr(mt, "lr_addition_enabled", 0) and lr_diff > 0:
-                lr_addition = lr_diff * lr_addition_rate
-
-            if getattr(mt, "lr_deduction_enabled", 0) and lr_diff < 0:
-                lr_deduction = abs(lr_diff) * lr_deduction_rate
-
-        final_rate = base_rate + fat_addition + snf_addition + lr_addition - fat_deduction - snf_deduction - lr_deduction
-        amount = final_rate * qty_litre
-
-        return {
-            "custom_snf": custom_snf,
-            "qty_litre": qty_litre,
-            "kg_per_litre": kg_per_litre,
-            "final_rate": final_rate,
-            "amount": amount,
-            "base_rate": base_rate,
-            "fat_addition": fat_addition,
-            "fat_deduction": fat_deduction,
-            "snf_addition": snf_addition,
-            "snf_deduction": snf_deduction,
-            "rate_type": "Per LR",
-            "payable_fat_kg": 0,
-            "rate_per_litre_display": final_rate,
-        }
-
-    else:
-        frappe.throw(f"Unsupported Base Rate Type {mt.base_rate_type} for Milk Type {custom_milk_type}")
+    return card.price(custom_fat, custom_snf, custom_lr, weight_kg)
 
 # ! Set milk pricing fields, rates, and amounts on Purchase Receipt items based on calculated milk rate logic
 def set_milk_pricing_on_items(doc, method=None):
@@ -440,7 +273,17 @@ def set_milk_pricing_on_items(doc, method=None):
     if not getattr(doc, "supplier", None):
         return
 
-    for item in doc.items:
+    # Draft saves re-price only rows whose quality inputs changed; submit re-prices all
+    items = get_changed_rows(doc, "items", PRICING_ROW_FIELDS, PRICING_PARENT_FIELDS)
+    doc.flags.milk_rows_repriced = 0
+
+    if not items:
+        return
+
+    # Whole price history of the supplier in one cache read
+    get_price_index(doc.supplier)
+
+    for item in items:
         if not getattr(item, "custom_milk_type", None):
             continue
         
@@ -461,6 +304,7 @@ def set_milk_pricing_on_items(doc, method=None):
             custom_snf=item.custom_snf,
             custom_lr=item.custom_lr,
             weight_kg=weight_kg,
+            posting_date=doc.posting_date,
         )
 
         kg_per_litre = flt(res.get("kg_per_litre") or 1.0339)
@@ -486,6 +330,35 @@ def set_milk_pricing_on_items(doc, method=None):
         #     item.rate = item.milk_final_rate
         #     item.amount = item.milk_final_amount
 
+        doc.flags.milk_rows_repriced += 1
+
+    frappe.logger("sheetal_supply_chain").debug(
+        f"{doc.doctype} {doc.name}: re-priced {doc.flags.milk_rows_repriced} of {len(doc.items)} rows"
+    )
+
+    if doc.flags.milk_rows_repriced:
+        warn_if_client_rate_card_is_stale(doc)
+
+
+# ! Publish the supplier's client rate card with the form so FAT/SNF/LR edits are priced in the browser
+def set_milk_rate_card_onload(doc, method=None):
+    if doc.get("supplier"):
+        doc.set_onload("milk_rate_card", get_client_rate_card_payload(doc.supplier))
+
+
+# ! Tell the user when the form previewed prices with an outdated rate card (the server prices are authoritative)
+def warn_if_client_rate_card_is_stale(doc):
+    client_checksum = doc.get("__milk_rate_card_checksum")
+    if not client_checksum:
+        return
+
+    if client_checksum != get_client_rate_card_payload(doc.supplier)["checksum"]:
+        frappe.msgprint(
+            _("Milk rates of Supplier {0} changed after this form was opened. Rates were recalculated with the current rate card.").format(doc.supplier),
+            indicator="orange",
+            alert=True,
+        )
+
 
 
 #! Return only the stock UOM and item-specific conversion UOMs for use in UOM link field dropdowns.
@@ -550,26 +423,14 @@ def validate_item_uom(item_code, uom):
     if item.stock_uom == uom:
         return {'valid': True}
     
-    # Check if UOM exists in conversion table
-    uom_exists = frappe.db.exists('UOM Conversion Detail', {
-        'parent': item_code,
-        'parenttype': 'Item',
-        'uom': uom,
-        'docstatus': ['<', 2]
-    })
-    
-    if uom_exists:
+    # Check if UOM exists in conversion table (cached per item)
+    conversions = get_item_uom_conversions(item_code)
+
+    if uom in conversions:
         return {'valid': True}
     
     # Get list of allowed UOMs for error message
-    allowed_uoms = frappe.db.sql_list("""
-        SELECT DISTINCT uom
-        FROM `tabUOM Conversion Detail`
-        WHERE parent = %s
-        AND parenttype = 'Item'
-        AND docstatus < 2
-        ORDER BY uom
-    """, item_code)
+    allowed_uoms = sorted(conversions)
     
     # Add stock UOM to the list
     if item.stock_uom not in allowed_uoms:
@@ -589,31 +450,8 @@ def validate_item_uom(item_code, uom):
 # ! Prevent saving Purchase Receipt if a different item already has stock in a warehouse restricted to one item.
 
 def validate_only_one_item_warehouse(doc, method=None):
-    for row in doc.items:
-        if not row.warehouse or not row.item_code:
-            continue
-
-        # Check warehouse flag
-        if not frappe.db.get_value("Warehouse", row.warehouse, "custom_only_one_item"):
-            continue
+    # Nothing to re-check when no row changed item or warehouse since the last save
+    if not get_changed_rows(doc, "items", ("item_code", "warehouse")):
+        return
 
-        # Check for any other item with stock > 0
-        conflict = frappe.db.sql("""
-            SELECT item_code, actual_qty
-            FROM `tabBin`
-            WHERE warehouse = %s
-              AND actual_qty > 0
-              AND item_code != %s
-            LIMIT 1
-        """, (row.warehouse, row.item_code), as_dict=True)
-
-        if conflict:
-            frappe.throw(_(
-                "Warehouse <b>{0}</b> allows only one item at a time.<br>"
-                "Item <b>{1}</b> already exists with quantity <b>{2}</b> (Stock UOM).<br>"
-                "Please reduce its stock to zero before adding another item."
-            ).format(
-                row.warehouse,
-                conflict[0].item_code,
-                conflict[0].actual_qty
-            ))
+    validate_one_item_warehouses(doc.items, "warehouse")
@@ -1,5 +1,17 @@
 import frappe
 from erpnext.stock.utils import get_stock_balance, get_combine_datetime, get_default_stock_uom
+from sheetal_supply_chain.py.milk_quality_ledger import (
+    cancel_mqle_entries,
+    make_mqle,
+    post_mqle_entries,
+)
+from sheetal_supply_chain.py.uom_conversion import get_uom_conversion_factor
+from sheetal_supply_chain.sheetal_supply_chain.doctype.quality_inspection_fact.quality_inspection_fact import (
+    sync_quality_inspection_facts,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.specification_alias.specification_alias import (
+    get_numeric_readings,
+)
 
 
 # ! Set reading_value based on Accepted/Rejected status for non-numeric Quality Inspection readings
@@ -20,21 +32,12 @@ def create_mqle_on_qi_submit(doc, method=None):
     if doc.inspection_type != "Internal":
         return
 
-    # Initialize FAT and SNF percentages
-    fat_per = snf_per = 0.0
-    for reading in getattr(doc, "readings", []):
-        value = reading.reading_1 or 0
-        try:
-            value = float(value)
-        except (ValueError, TypeError):
-            value = 0.0
-
-        if reading.specification.upper() == "FAT":
-            fat_per = value
-        elif reading.specification.upper() in ("S.N.F.", "SNF"):
-            snf_per = value
-
-    # Get latest balance from Stock Ledger
+    # FAT and SNF percentages, whatever spelling the inspection template uses
+    readings = get_numeric_readings(getattr(doc, "readings", []))
+    fat_per = readings.get("fat", 0.0)
+    snf_per = readings.get("snf", 0.0)
+
+    # Get latest balance from Stock Ledger (an inspection posts no Stock Ledger Entries of its own)
     posting_date = doc.report_date or frappe.utils.nowdate()
     posting_time = frappe.utils.nowtime()
 
@@ -52,11 +55,7 @@ def create_mqle_on_qi_submit(doc, method=None):
     included_uom = "Litre"
 
     # Get conversion factor from stock UOM -> included UOM
-    conversion_factor = frappe.db.get_value(
-        "UOM Conversion Detail",
-        {"parent": doc.item_code, "uom": included_uom},
-        "conversion_factor"
-    ) or 1.0
+    conversion_factor = get_uom_conversion_factor(doc.item_code, included_uom) or 1.0
 
     # Convert qty to included UOM
     qty_in_litre = stock_qty / conversion_factor if stock_uom != included_uom else stock_qty
@@ -66,7 +65,7 @@ def create_mqle_on_qi_submit(doc, method=None):
     snf = (snf_per/100) * stock_qty
 
     # Create MQLE document
-    mqle = frappe.new_doc("Milk Quality Ledger Entry")
+    mqle = make_mqle()
     mqle.item_code = doc.item_code
     mqle.item_name = doc.item_name
     mqle.warehouse = doc.custom_warehouse
@@ -74,6 +73,7 @@ def create_mqle_on_qi_submit(doc, method=None):
     mqle.voucher_type = "Quality Inspection"
     mqle.voucher_no = doc.name
     mqle.voucher_detail_no = None
+    mqle.entry_type = "Inspection"
 
     mqle.posting_date = posting_date
     mqle.posting_time = posting_time
@@ -93,8 +93,7 @@ def create_mqle_on_qi_submit(doc, method=None):
     mqle.qty_after_transaction_in_liter = qty_in_litre
     mqle.qty_after_transaction_in_kg = stock_qty
 
-    mqle.save(ignore_permissions=True)
-    mqle.submit()
+    post_mqle_entries([mqle])
 
 
 # ! Cancel all submitted Milk Quality Ledger Entries linked to an Internal Quality Inspection when the inspection is cancelled
@@ -107,24 +106,71 @@ def cancel_mqle_on_qi_cancel(doc, method=None):
     if doc.inspection_type != "Internal":
         return
 
-    # Find MQLE linked to this Quality Inspection
-    mqle_list = frappe.get_all(
-        "Milk Quality Ledger Entry",
-        filters={
-            "voucher_type": "Quality Inspection",
-            "voucher_no": doc.name
-        },
-        fields=["name", "docstatus"]
-    )
+    # Cancel every linked MQLE in one statement
+    cancel_mqle_entries(doc.doctype, doc.name)
+
+# ! Write (on submit) or drop (on cancel) the pre-pivoted Quality Inspection Fact of an inspection
+def sync_qi_fact(doc, method=None):
+    sync_quality_inspection_facts([doc.name])
+
+
+# ! Whitelisted: FAT/SNF/LR of all Quality Inspections of a form in one call, skipping those the form already has
+@frappe.whitelist()
+def get_qi_readings_bulk(quality_inspections, known=None):
+    """
+    `quality_inspections` is a list of QI names and `known` maps a QI name to
+    the `modified` value the form last received for it (an ETag).
+
+    Returns {qi: {"modified", "fat", "snf", "lr"}}. Inspections whose
+    `modified` still matches come back as {"modified", "unchanged": 1} and
+    their readings are not read. One query for the versions and at most
+    one for the readings, whatever the number of rows on the form.
+    """
+    names = list({name for name in (frappe.parse_json(quality_inspections) or []) if name})
+    known = frappe.parse_json(known) or {}
+
+    if not names:
+        return {}
+
+    frappe.has_permission("Quality Inspection", "read", throw=True)
+
+    result = {}
+    changed = []
+
+    for name, modified in frappe.db.sql(
+        "SELECT name, modified FROM `tabQuality Inspection` WHERE name IN %(names)s",
+        {"names": names},
+    ):
+        modified = str(modified)
+        if known.get(name) == modified:
+            result[name] = {"modified": modified, "unchanged": 1}
+        else:
+            result[name] = {"modified": modified, "fat": 0, "snf": 0, "lr": 0}
+            changed.append(name)
+
+    if not changed:
+        return result
+
+    readings = {}
+    for reading in frappe.db.sql(
+        """
+        SELECT parent, specification, reading_1
+        FROM `tabQuality Inspection Reading`
+        WHERE parenttype = 'Quality Inspection' AND parent IN %(parents)s
+        ORDER BY parent, idx
+        """,
+        {"parents": changed},
+        as_dict=True,
+    ):
+        readings.setdefault(reading.parent, []).append(reading)
+
+    # Canonical FAT / SNF / LR through the Specification Alias registry
+    for name, rows in readings.items():
+        values = get_numeric_readings(rows)
+        result[name].update({parameter: values.get(parameter, 0) for parameter in ("fat", "snf", "lr")})
 
-    if not mqle_list:
-        return  # No MQLE found → nothing to cancel
+    return result
 
-    for mqle in mqle_list:
-        if mqle.docstatus == 1:   # Submitted
-            mqle_doc = frappe.get_doc("Milk Quality Ledger Entry", mqle.name)
-            mqle_doc.is_cancelled = 1
-            mqle_doc.cancel()
 
 # ! Return list of item codes having available stock in a selected warehouse for link field filtering
 @frappe.whitelist()
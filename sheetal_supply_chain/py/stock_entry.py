@@ -1,7 +1,25 @@
 import frappe
 from frappe import _
-from erpnext.stock.utils import get_stock_balance
 from frappe.utils import nowdate, nowtime, flt
+from sheetal_supply_chain.py.milk_quality_ledger import (
+    cancel_mqle_entries,
+    get_qty_after_transaction_map,
+    make_mqle,
+    post_mqle_entries,
+)
+from sheetal_supply_chain.py.milk_blending import apply_quality_blend, get_blended_quality
+from sheetal_supply_chain.py.doc_changes import get_changed_rows
+from sheetal_supply_chain.py.uom_conversion import get_uom_conversion_factor, preload_uom_conversions
+from sheetal_supply_chain.py.warehouse_validation import validate_one_item_warehouses
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+    get_last_milk_quality_map,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.quality_inspection_fact.quality_inspection_fact import (
+    get_fact_readings,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.specification_alias.specification_alias import (
+    get_numeric_readings,
+)
 from datetime import datetime
 
  
@@ -11,24 +29,21 @@ def update_fat_snf_js(qi, qty=None):
     """Always return fresh FAT/SNF from latest QI, even if previous QI was cancelled."""
     if not qi:
         return {"fat": 0, "snf": 0, "fat_kg": 0, "snf_kg": 0}
-    # Always load fresh QI from database (NO CACHE)
-    qi_doc = frappe.get_doc("Quality Inspection", qi)
-    # Force load fresh child table rows
-    readings = frappe.get_all(
-        "Quality Inspection Reading",
-        filters={"parent": qi},
-        fields=["specification", "reading_1"],
-        order_by="idx asc",
-    )
-    fat = 0
-    snf = 0
-    # Fresh, newly created QI reading will be picked here
-    for r in readings:
-        spec = (r.specification or "").strip().upper()
-        if spec == "FAT":
-            fat = frappe.utils.flt(r.reading_1 or 0)
-        if spec in ("S.N.F.", "SNF", "S N F"):
-            snf = frappe.utils.flt(r.reading_1 or 0)
+    # Submitted QI: readings already pivoted into Quality Inspection Fact
+    fact = get_fact_readings(qi, ("fat", "snf"))
+    if fact:
+        fat, snf = flt(fact.fat), flt(fact.snf)
+    else:
+        # Draft QI: load fresh child table rows
+        readings = frappe.get_all(
+            "Quality Inspection Reading",
+            filters={"parent": qi},
+            fields=["specification", "reading_1"],
+            order_by="idx asc",
+        )
+        # Fresh, newly created QI reading will be picked here
+        values = get_numeric_readings(readings)
+        fat, snf = values.get("fat", 0), values.get("snf", 0)
     qty = frappe.utils.flt(qty or 0)
     return {
         "fat": fat,
@@ -39,220 +54,79 @@ def update_fat_snf_js(qi, qty=None):
  
  
 
-# ! Create Milk Quality Ledger Entries (MQLE) for FINISHED milk items when Stock Entry of type Manufacture is submitted
+# ! Create all Milk Quality Ledger Entries (MQLE) of a Manufacture / Material Issue Stock Entry in one pass over its rows
 def create_mqle_on_se_submit(doc, method=None):
     """
-    Create Milk Quality Ledger Entry (MQLE) on Stock Entry Submit
+    Stock Entry ledger pipeline.
+
+    Rows are classified once:
+        - Manufacture, finished milk rows -> Inward, FAT/SNF from the row
+        - Manufacture, raw-material milk rows -> Outward, blended warehouse FAT/SNF
+        - Material Issue, all milk rows -> Outward, blended warehouse FAT/SNF
+    Batches, stock UOMs, Litre conversions, balances and last quality are
+    prefetched for the whole voucher, so the number of queries does not grow
+    with the number of rows. Finished goods are emitted before raw materials.
     """
-        # ------------------------------------
-    if doc.stock_entry_type != "Manufacture":
+    if doc.stock_entry_type not in ("Manufacture", "Material Issue"):
         return
-    
-    posting_date = doc.posting_date or nowdate()
-    posting_time = doc.posting_time or nowtime()
+
+    finished_rows = []
+    outward_rows = []
 
     for row in doc.items:
 
         # Only Milk items
-        if not (row.is_finished_item and row.custom_maintain_fat_snf):
+        if not row.custom_maintain_fat_snf:
             continue
 
-        # -------------------------------
-        # Get balance AFTER transaction
-        # -------------------------------
-        stock_qty_after = get_stock_balance(
-            item_code=row.item_code,
-            warehouse=row.t_warehouse or row.s_warehouse,
-            posting_date=posting_date,
-            posting_time=posting_time,
-            with_valuation_rate=False,
-            with_serial_no=False
-        )
-        
-        
-        # -------------------------------
-        # Fetch Batch No
-        # -------------------------------
-        batch_no = None
-
-        if row.batch_no:
-            batch_no = row.batch_no
-        elif row.serial_and_batch_bundle:
-            bundle = frappe.get_doc("Serial and Batch Bundle", row.serial_and_batch_bundle)
-            for e in bundle.entries:
-                if e.batch_no:
-                    batch_no = e.batch_no
-                    break
-                
-        
-        # -------------------------------
-        #  UOM handling (same as QI)
-        # -------------------------------
-        stock_uom = frappe.get_cached_value("Item", row.item_code, "stock_uom") or "KG"
-        included_uom = "Litre"
-
-        conversion_factor = frappe.db.get_value(
-            "UOM Conversion Detail",
-            {"parent": row.item_code, "uom": included_uom},
-            "conversion_factor"
-        ) or 1.0
-
-        qty_after_litre = (
-            stock_qty_after / conversion_factor
-            if stock_uom != included_uom
-            else stock_qty_after
-        )
-
-        # -------------------------------
-        # Incoming qty (THIS transaction)
-        # -------------------------------
-        in_qty_in_kg = flt(row.qty)
-        in_qty_in_liter = (
-            flt(row.qty) / conversion_factor
-            if stock_uom != included_uom
-            else flt(row.qty)
-        )
-
-        # -------------------------------
-        # Create MQLE
-        # -------------------------------
-        mqle = frappe.new_doc("Milk Quality Ledger Entry")
-
-        # Basic
-        mqle.item_code = row.item_code
-        mqle.item_name = row.item_name
-        mqle.warehouse = row.t_warehouse or row.s_warehouse
-
-        mqle.voucher_type = doc.doctype
-        mqle.voucher_no = doc.name
-        mqle.voucher_detail_no = row.name
-        mqle.batch_no = batch_no
-        mqle.posting_date = posting_date
-        mqle.posting_time = posting_time
-
-        # UOM
-        mqle.stock_uom = stock_uom
-        mqle.uom = included_uom
-
-        # Milk params
-        mqle.fat_per = row.custom_fat
-        mqle.snf_per = row.custom_snf
-        mqle.fat = row.custom_fat_kg
-        mqle.snf = row.custom_snf_kg
-
-        # -------------------------------
-        #  REQUIRED FIELD MAPPING 
-        # -------------------------------
-        mqle.qty_in_liter = in_qty_in_liter
-        mqle.qty_in_kg = in_qty_in_kg
-
-        mqle.qty_after_transaction_in_liter = qty_after_litre
-        mqle.qty_after_transaction_in_kg = stock_qty_after
+        if doc.stock_entry_type == "Manufacture" and row.is_finished_item:
+            finished_rows.append(row)
+        else:
+            outward_rows.append(row)
 
-        # Save & Submit
-        mqle.save(ignore_permissions=True)
-        mqle.submit()
-
-
-
-# ! Create MQLE entries for raw-materialmilk items during Manufacture Stock Entry using last recorded milk quality
-def create_mqle_for_raw_materials(doc, method=None):
-    """
-    Create MQLE for raw material milk items on Stock Entry Submit
-    (is_finished_item = 0 AND custom_maintain_fat_snf = 1)
-    """
-        # ------------------------------------
-    if doc.stock_entry_type != "Manufacture":
+    if not (finished_rows or outward_rows):
         return
-    
+
     posting_date = doc.posting_date or nowdate()
     posting_time = doc.posting_time or nowtime()
 
-    for row in doc.items:
+    milk_rows = finished_rows + outward_rows
+    item_codes = {row.item_code for row in milk_rows}
+
+    # -------------------------------
+    #  Prefetch everything the rows need
+    # -------------------------------
+    preload_uom_conversions(item_codes)
+    stock_uoms = get_stock_uom_map(item_codes)
+    bundle_batches = get_bundle_batch_map(row.serial_and_batch_bundle for row in milk_rows)
+
+    # Balance AFTER transaction for every milk row, resolved in one query
+    balances = get_qty_after_transaction_map(
+        doc.doctype,
+        doc.name,
+        [
+            (row.item_code, row.t_warehouse or row.s_warehouse, posting_date, posting_time)
+            for row in milk_rows
+        ],
+    )
 
-        # Only RAW MATERIAL milk items
-        if not (not row.is_finished_item and row.custom_maintain_fat_snf):
-            continue
+    # Latest FAT/SNF per (item, warehouse) from the Milk Quality Snapshot
+    last_quality = get_last_milk_quality_map(
+        (row.item_code, row.t_warehouse or row.s_warehouse)
+        for row in outward_rows
+    ) if outward_rows else {}
 
+    def build_mqle(row, entry_type):
         warehouse = row.t_warehouse or row.s_warehouse
 
-        # -------------------------------
-        #  Get balance AFTER transaction
-        # -------------------------------
-        stock_qty_after = get_stock_balance(
-            item_code=row.item_code,
-            warehouse=warehouse,
-            posting_date=posting_date,
-            posting_time=posting_time,
-            with_valuation_rate=False,
-            with_serial_no=False
-        )
-
-        # -------------------------------
-        #  Get latest MQLE for FAT/SNF
-        # -------------------------------
-        last_mqle = frappe.db.get_value(
-            "Milk Quality Ledger Entry",
-            filters={"item_code": row.item_code, "warehouse": warehouse,"docstatus": 1},
-            fieldname=["fat_per", "snf_per", "fat", "snf"],
-            order_by="creation desc",
-            as_dict=True,
-        )
-
-        fat_per = last_mqle.fat_per if last_mqle else 0
-        snf_per = last_mqle.snf_per if last_mqle else 0
-
-        # -------------------------------
-        #  UOM handling
-        # -------------------------------
-        stock_uom = frappe.get_cached_value("Item", row.item_code, "stock_uom") or "KG"
+        # UOM handling (same as QI)
+        stock_uom = stock_uoms.get(row.item_code) or "KG"
         included_uom = "Litre"
+        conversion_factor = get_uom_conversion_factor(row.item_code, included_uom) or 1.0
 
-        conversion_factor = frappe.db.get_value(
-            "UOM Conversion Detail",
-            {"parent": row.item_code, "uom": included_uom},
-            "conversion_factor"
-        ) or 1.0
+        stock_qty_after = balances.get((row.item_code, warehouse), 0)
 
-        qty_after_litre = (
-            stock_qty_after / conversion_factor
-            if stock_uom != included_uom
-            else stock_qty_after
-        )
-
-        # -------------------------------
-        #  OUTGOING QTY (RAW MATERIAL)
-        # -------------------------------
-        out_qty_in_kg = flt(row.qty)
-        out_qty_in_liter = (
-            flt(row.qty) / conversion_factor
-            if stock_uom != included_uom
-            else flt(row.qty)
-        )
-        
-        # -------------------------------
-        #  Fetch Batch No
-        # -------------------------------
-        
-        
-        batch_no = None
-
-        # 1) If batch directly selected in Stock Entry Row
-        if row.batch_no:
-            batch_no = row.batch_no
-
-        # 2) If Serial and Batch Bundle is used
-        elif row.serial_and_batch_bundle:
-            bundle = frappe.get_doc("Serial and Batch Bundle", row.serial_and_batch_bundle)
-            for e in bundle.entries:
-                if e.batch_no:
-                    batch_no = e.batch_no
-                    break
-
-        # -------------------------------
-        #  Create MQLE
-        # -------------------------------
-        mqle = frappe.new_doc("Milk Quality Ledger Entry")
+        mqle = make_mqle()
 
         mqle.item_code = row.item_code
         mqle.item_name = row.item_name
@@ -261,163 +135,106 @@ def create_mqle_for_raw_materials(doc, method=None):
         mqle.voucher_type = doc.doctype
         mqle.voucher_no = doc.name
         mqle.voucher_detail_no = row.name
+        mqle.entry_type = entry_type
 
         mqle.posting_date = posting_date
         mqle.posting_time = posting_time
-        mqle.batch_no = batch_no
+        mqle.batch_no = row.batch_no or bundle_batches.get(row.serial_and_batch_bundle)
         mqle.stock_uom = stock_uom
         mqle.uom = included_uom
 
-        # Milk params from LAST MQLE
-        mqle.fat_per = fat_per
-        mqle.snf_per = snf_per
-        mqle.fat = (fat_per * out_qty_in_kg/100)
-        mqle.snf = (snf_per * out_qty_in_kg/100)
-
-        # OUTGOING QTY instead of incoming qty
-        mqle.qty_in_liter = out_qty_in_liter
-        mqle.qty_in_kg = out_qty_in_kg
+        # Qty of THIS transaction (incoming or outgoing)
+        mqle.qty_in_kg = flt(row.qty)
+        mqle.qty_in_liter = (
+            flt(row.qty) / conversion_factor
+            if stock_uom != included_uom
+            else flt(row.qty)
+        )
 
-        mqle.qty_after_transaction_in_liter = qty_after_litre
+        mqle.qty_after_transaction_in_liter = (
+            stock_qty_after / conversion_factor
+            if stock_uom != included_uom
+            else stock_qty_after
+        )
         mqle.qty_after_transaction_in_kg = stock_qty_after
 
-        mqle.save(ignore_permissions=True)
-        mqle.submit()
-
-
-# ! Create MQLE entries for milk items during Material Issue Stock Entry using last recorded milk quality
-def create_mqle_for_raw_materials_issue(doc, method=None):
-    """
-    Create MQLE for milk items on Stock Entry Submit
-    Conditions:
-        - Stock Entry Type = Material Issue
-        - custom_maintain_fat_snf = 1
-    """
+        return mqle
 
-    # Run ONLY for Material Issue
-    if doc.stock_entry_type != "Material Issue":
-        return
+    # -------------------------------
+    #  Finished goods: FAT/SNF from the row
+    # -------------------------------
+    finished_entries = []
+    for row in finished_rows:
+        mqle = build_mqle(row, "Inward")
 
-    posting_date = doc.posting_date or nowdate()
-    posting_time = doc.posting_time or nowtime()
+        mqle.fat_per = row.custom_fat
+        mqle.snf_per = row.custom_snf
+        mqle.fat = row.custom_fat_kg
+        mqle.snf = row.custom_snf_kg
 
-    for row in doc.items:
+        finished_entries.append(mqle)
 
-        # Only milk items (remove is_finished_item condition)
-        if row.custom_maintain_fat_snf != 1:
-            continue
+    # A raw material drawn from a warehouse this voucher also produces into
+    # sees the quality after the finished goods, as they are posted first
+    produced = {(mqle.item_code, mqle.warehouse): mqle for mqle in finished_entries}
+    if any((row.item_code, row.t_warehouse or row.s_warehouse) in produced for row in outward_rows):
+        apply_quality_blend(finished_entries)
+        last_quality.update(produced)
 
-        warehouse = row.t_warehouse or row.s_warehouse
+    # -------------------------------
+    #  Raw materials / issues: blended FAT/SNF of the milk in the warehouse
+    # -------------------------------
+    outward_entries = []
+    for row in outward_rows:
+        mqle = build_mqle(row, "Outward")
 
-        # -------------------------------
-        #  Get balance AFTER transaction
-        # -------------------------------
-        stock_qty_after = get_stock_balance(
-            item_code=row.item_code,
-            warehouse=warehouse,
-            posting_date=posting_date,
-            posting_time=posting_time,
-            with_valuation_rate=False,
-            with_serial_no=False
-        )
+        last_mqle = last_quality.get((row.item_code, mqle.warehouse))
+        fat_per, snf_per = get_blended_quality(last_mqle)
 
-        # -------------------------------
-        #  Latest MQLE for FAT/SNF
-        # -------------------------------
-        last_mqle = frappe.db.get_value(
-            "Milk Quality Ledger Entry",
-            filters={"item_code": row.item_code, "warehouse": warehouse,"docstatus": 1},
-            fieldname=["fat_per", "snf_per", "fat", "snf"],
-            order_by="creation desc",
-            as_dict=True,
-        )
+        mqle.fat_per = fat_per
+        mqle.snf_per = snf_per
+        mqle.fat = (fat_per * mqle.qty_in_kg/100)
+        mqle.snf = (snf_per * mqle.qty_in_kg/100)
 
-        fat_per = last_mqle.fat_per if last_mqle else 0
-        snf_per = last_mqle.snf_per if last_mqle else 0
-     
+        outward_entries.append(mqle)
 
-        # -------------------------------
-        #  UOM handling
-        # -------------------------------
-        stock_uom = frappe.get_cached_value("Item", row.item_code, "stock_uom") or "KG"
-        included_uom = "Litre"
+    # Save & Submit every milk row of the voucher in one batch
+    post_mqle_entries(finished_entries + outward_entries)
 
-        conversion_factor = frappe.db.get_value(
-            "UOM Conversion Detail",
-            {"parent": row.item_code, "uom": included_uom},
-            "conversion_factor"
-        ) or 1.0
 
-        qty_after_litre = (
-            stock_qty_after / conversion_factor
-            if stock_uom != included_uom
-            else stock_qty_after
-        )
+# ! Return {item_code: stock_uom} for the given items with one query
+def get_stock_uom_map(item_codes):
+    item_codes = [item_code for item_code in set(item_codes) if item_code]
+    if not item_codes:
+        return {}
 
-        # -------------------------------
-        #  OUTGOING QTY (Material Issue)
-        # -------------------------------
-        out_qty_in_kg = flt(row.qty)
-        out_qty_in_liter = (
-            flt(row.qty) / conversion_factor
-            if stock_uom != included_uom
-            else flt(row.qty)
+    return dict(
+        frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes]},
+            fields=["name", "stock_uom"],
+            as_list=True,
         )
+    )
 
-        # -------------------------------
-        #  Fetch Batch No
-        # -------------------------------
-        
-        
-        batch_no = None
-
-        # If batch directly selected in Stock Entry Row
-        if row.batch_no:
-            batch_no = row.batch_no
-
-        # If Serial and Batch Bundle is used
-        elif row.serial_and_batch_bundle:
-            bundle = frappe.get_doc("Serial and Batch Bundle", row.serial_and_batch_bundle)
-            for e in bundle.entries:
-                if e.batch_no:
-                    batch_no = e.batch_no
-                    break
-
-        # -------------------------------
-        #  Create MQLE
-        # -------------------------------
-        mqle = frappe.new_doc("Milk Quality Ledger Entry")
-
-        mqle.item_code = row.item_code
-        mqle.item_name = row.item_name
-        mqle.warehouse = warehouse
-
-        mqle.voucher_type = doc.doctype
-        mqle.voucher_no = doc.name
-        mqle.voucher_detail_no = row.name
-
-        mqle.posting_date = posting_date
-        mqle.posting_time = posting_time
-        mqle.batch_no = batch_no 
-        mqle.stock_uom = stock_uom
-        mqle.uom = included_uom
-
-        # Milk params from LAST MQLE
-        mqle.fat_per = fat_per
-        mqle.snf_per = snf_per
-        mqle.fat = (fat_per * out_qty_in_kg/100)
-        mqle.snf = (snf_per * out_qty_in_kg/100)
 
-        # OUTGOING QTY
-        mqle.qty_in_liter = out_qty_in_liter
-        mqle.qty_in_kg = out_qty_in_kg
+# ! Return {serial_and_batch_bundle: first batch_no in the bundle} with one query
+def get_bundle_batch_map(bundles):
+    bundles = [bundle for bundle in set(bundles) if bundle]
+    if not bundles:
+        return {}
 
-        mqle.qty_after_transaction_in_liter = qty_after_litre
-        mqle.qty_after_transaction_in_kg = stock_qty_after
-
-        mqle.save(ignore_permissions=True)
-        mqle.submit()
+    batches = {}
+    for bundle, batch_no in frappe.get_all(
+        "Serial and Batch Entry",
+        filters={"parent": ["in", bundles], "batch_no": ["is", "set"]},
+        fields=["parent", "batch_no"],
+        order_by="parent asc, idx asc",
+        as_list=True,
+    ):
+        batches.setdefault(bundle, batch_no)
 
+    return batches
 
 
 # ! Cancel all Milk Quality Ledger Entries linked to a Stock Entry when that Stock Entry is cancelled
@@ -427,24 +244,8 @@ def cancel_mqle_on_se_cancel(doc, method=None):
     when Stock Entry is cancelled.
     """
 
-    # Find MQLE linked to this Stock Entry
-    mqle_list = frappe.get_all(
-        "Milk Quality Ledger Entry",
-        filters={
-            "voucher_type": doc.doctype,
-            "voucher_no": doc.name
-        },
-        fields=["name", "docstatus"]
-    )
-
-    if not mqle_list:
-        return  # No linked MQLE exists
-
-    for mqle in mqle_list:
-        if mqle.docstatus == 1: 
-            mqle_doc = frappe.get_doc("Milk Quality Ledger Entry", mqle.name)
-            mqle_doc.is_cancelled = 1
-            mqle_doc.cancel()
+    # Cancel every linked MQLE in one statement
+    cancel_mqle_entries(doc.doctype, doc.name)
 
 
 # ! # Fetch FAT & SNF percentages from BOM items and calculate corresponding FAT/SNF kg values for Stock Entry required items based on required quantity
@@ -624,7 +425,7 @@ def generate_production_order(doc, method=None):
 
 
 
-#! Fetch FAT/SNF from the latest MQLE for each material issue item which has Maintain FAT-SNF enabled and calculate FAT/SNF (kg) before saving Stock Entry
+#! Fetch blended FAT/SNF of the source warehouse for each material issue item which has Maintain FAT-SNF enabled and calculate FAT/SNF (kg) before saving Stock Entry
 
 def set_fat_snf_from_last_mqle_for_mi(doc, method=None):
 
@@ -632,6 +433,13 @@ def set_fat_snf_from_last_mqle_for_mi(doc, method=None):
     if doc.stock_entry_type != "Material Issue":
         return
 
+    # Latest FAT/SNF per (item, source warehouse) from the Milk Quality Snapshot
+    last_quality = get_last_milk_quality_map(
+        (row.item_code, row.s_warehouse)
+        for row in doc.items
+        if row.custom_maintain_fat_snf and row.s_warehouse
+    )
+
     for row in doc.items:
 
         if not row.custom_maintain_fat_snf:
@@ -643,21 +451,10 @@ def set_fat_snf_from_last_mqle_for_mi(doc, method=None):
 
         qty = flt(row.qty)
 
-        # ---- Fetch last MQLE ----
-        last_mqle = frappe.db.get_value(
-            "Milk Quality Ledger Entry",
-            {
-                "item_code": row.item_code,
-                "warehouse": warehouse,
-                "docstatus": 1
-            },
-            ["fat_per", "snf_per"],
-            order_by="creation desc",
-            as_dict=True
-        )
+        # ---- Blended quality of the source warehouse ----
+        last_mqle = last_quality.get((row.item_code, warehouse))
 
-        fat_per = flt(last_mqle.fat_per) if last_mqle else 0
-        snf_per = flt(last_mqle.snf_per) if last_mqle else 0
+        fat_per, snf_per = get_blended_quality(last_mqle)
 
         # ---- Calculate ----
         row.custom_fat = fat_per
@@ -665,3 +462,12 @@ def set_fat_snf_from_last_mqle_for_mi(doc, method=None):
 
         row.custom_fat_kg = qty * fat_per / 100
         row.custom_snf_kg = qty * snf_per / 100
+
+
+
+# ! Prevent a Stock Entry from moving a second item into a warehouse restricted to one item (same check as Purchase Receipt)
+def validate_only_one_item_warehouse(doc, method=None):
+    if not get_changed_rows(doc, "items", ("item_code", "t_warehouse")):
+        return
+
+    validate_one_item_warehouses(doc.items, "t_warehouse")
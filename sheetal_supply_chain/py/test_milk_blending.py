@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import now_datetime
+
+from sheetal_supply_chain.py.milk_blending import (
+    BLEND_FIELDS,
+    apply_quality_blend,
+    backfill_quality_blend,
+    get_running_balances,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+    update_snapshots_for_entries,
+)
+
+ITEM_CODE = "_Test Blend Milk"
+WAREHOUSE = "_Test Blend Tank"
+
+MQLE_FIELDS = (
+    "name", "creation", "modified", "owner", "modified_by", "docstatus", "is_cancelled",
+    "item_code", "warehouse", "voucher_type", "voucher_no", "entry_type", "posting_date", "posting_time",
+    "qty_in_kg", "qty_after_transaction_in_kg", "fat_per", "snf_per", "fat", "snf",
+)
+
+
+def make_entry(**values):
+    entry = frappe._dict(
+        item_code=ITEM_CODE,
+        warehouse=WAREHOUSE,
+        voucher_type="Purchase Receipt",
+        voucher_no="_Test Blend PR",
+        posting_date="2026-03-02",
+        posting_time="10:00:00",
+        entry_type="Inward",
+    )
+    entry.update(values)
+    return entry
+
+
+class TestMilkBlending(IntegrationTestCase):
+    def setUp(self):
+        # 100 kg at 3% FAT / 8% SNF already in the tank
+        update_snapshots_for_entries([
+            make_entry(
+                name="_Test Blend Opening",
+                voucher_no="_Test Blend Opening PR",
+                posting_date="2026-03-01",
+                qty_in_kg=100,
+                qty_after_transaction_in_kg=100,
+                fat_per_after_transaction=3,
+                snf_per_after_transaction=8,
+                fat_after_transaction=3,
+                snf_after_transaction=8,
+            )
+        ])
+
+    def test_running_balances_of_a_voucher(self):
+        entries = [
+            make_entry(qty_in_kg=100, qty_after_transaction_in_kg=300),
+            make_entry(qty_in_kg=100, qty_after_transaction_in_kg=300),
+            make_entry(entry_type="Inspection", qty_in_kg=300, qty_after_transaction_in_kg=300),
+        ]
+
+        balances = get_running_balances(entries, lambda entry: entry.voucher_no)
+
+        self.assertEqual(balances, [200, 300, 300])
+
+    def test_two_inward_rows_of_one_key_blend_in_turn(self):
+        first = make_entry(qty_in_kg=100, fat_per=4, snf_per=8, qty_after_transaction_in_kg=300)
+        second = make_entry(qty_in_kg=100, fat_per=6, snf_per=9, qty_after_transaction_in_kg=300)
+
+        apply_quality_blend([first, second])
+
+        # 100 kg @ 3% + 100 kg @ 4% -> 200 kg @ 3.5%
+        self.assertAlmostEqual(first.fat_per_after_transaction, 3.5)
+        self.assertAlmostEqual(first.fat_after_transaction, 7)
+        self.assertAlmostEqual(first.snf_per_after_transaction, 8)
+
+        # 200 kg @ 3.5% + 100 kg @ 6% -> 300 kg @ 4.333%
+        self.assertAlmostEqual(second.fat_per_after_transaction, 13 / 3)
+        self.assertAlmostEqual(second.fat_after_transaction, 13)
+        self.assertAlmostEqual(second.snf_per_after_transaction, 25 / 3)
+
+    def test_backfill_matches_live_blending(self):
+        opening = make_entry(
+            name="_Test-Blend-1", voucher_no="_Test Blend Opening PR", posting_date="2026-03-01",
+            qty_in_kg=100, fat_per=3, snf_per=8, qty_after_transaction_in_kg=100,
+        )
+        voucher = [
+            make_entry(name="_Test-Blend-2", qty_in_kg=100, fat_per=4, snf_per=8, qty_after_transaction_in_kg=300),
+            make_entry(name="_Test-Blend-3", qty_in_kg=100, fat_per=6, snf_per=9, qty_after_transaction_in_kg=300),
+        ]
+
+        now = now_datetime()
+        frappe.db.bulk_insert(
+            "Milk Quality Ledger Entry",
+            MQLE_FIELDS,
+            [
+                (
+                    entry.name, now + timedelta(seconds=idx), now, "Administrator", "Administrator", 1, 0,
+                    entry.item_code, entry.warehouse, entry.voucher_type, entry.voucher_no, entry.entry_type,
+                    entry.posting_date, entry.posting_time, entry.qty_in_kg, entry.qty_after_transaction_in_kg,
+                    entry.fat_per, entry.snf_per, 0, 0,
+                )
+                for idx, entry in enumerate([opening, *voucher])
+            ],
+        )
+
+        # Live posting first: the backfill rebuilds the snapshot it is seeded from
+        apply_quality_blend(voucher)
+
+        # A page of one row would end inside the voucher
+        backfill_quality_blend(item_code=ITEM_CODE, warehouse=WAREHOUSE, chunk_size=1)
+
+        for entry in voucher:
+            backfilled = frappe.db.get_value("Milk Quality Ledger Entry", entry.name, BLEND_FIELDS, as_dict=True)
+            for field in BLEND_FIELDS:
+                with self.subTest(entry=entry.name, field=field):
+                    self.assertAlmostEqual(backfilled[field], entry[field])
@@ -0,0 +1,170 @@
+import unittest
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import getdate
+
+from sheetal_supply_chain.py.milk_pricing import (
+    CompiledRateMatrix,
+    MilkPriceIndex,
+    get_rate_card,
+    make_rate_card,
+    np,
+    price_milk_rows,
+)
+from sheetal_supply_chain.py.purchase_receipt import get_milk_rate_for_pr_item
+
+SUPPLIER = "_Test Milk Supplier"
+
+FLAT_RATE_MILK_TYPE = frappe._dict(
+    name="Cow",
+    base_rate_type="Per Litre",
+    fat_addition_enabled=1,
+    fat_addition=2.5,
+    fat_deduction_enabled=1,
+    fat_deduction=3,
+    snf_addition_enabled=1,
+    snf_addition=1.5,
+    snf_deduction_enabled=1,
+    snf_deduction=2,
+)
+
+
+RATE_MATRIX = CompiledRateMatrix(
+    name="_Test Milk Rate Matrix",
+    fat_breaks=(3.0, 4.0, 5.0),
+    snf_breaks=(8.0, 8.5),
+    rates=((38.0, 39.5), (41.0, None), (44.0, 45.25)),
+)
+
+MATRIX_MILK_TYPE = frappe._dict(name="Buffalo", base_rate_type="Rate Matrix", rate_matrix=RATE_MATRIX.name)
+
+# FAT, SNF and LR readings below, at and above the baselines and around the slab edges
+READINGS = [
+    (3.0, 8.0, 26), (3.4, 8.2, 27), (3.99, 8.49, 28), (4.0, 8.5, 28), (4.0, 8.51, 29),
+    (4.3, 8.9, 30), (5.0, 8.0, 31), (6.2, 9.1, 32), (2.9, 8.6, 25), (4.5, 8.6, 29),
+]
+
+
+def make_profile(base_rate, effective_from=None):
+    return frappe._dict(
+        base_rate=base_rate,
+        baseline_fat=4,
+        baseline_snf=8.5,
+        effective_from=getdate(effective_from) if effective_from else None,
+    )
+
+
+def make_price_index(default_card, dated_cards):
+    return MilkPriceIndex(
+        effective_dates=tuple(card.effective_from for card in dated_cards),
+        cards=tuple(dated_cards),
+        default_card=default_card,
+    )
+
+
+class TestMilkPriceIndex(IntegrationTestCase):
+    def test_posting_date_before_first_effective_date(self):
+        default = make_rate_card(SUPPLIER, FLAT_RATE_MILK_TYPE, make_profile(40, "2026-02-01"))
+        revised = make_rate_card(SUPPLIER, FLAT_RATE_MILK_TYPE, make_profile(42, "2026-03-01"))
+        index = make_price_index(default, [default, revised])
+
+        # The dated default was not in force yet
+        self.assertIsNone(index.card_for("2026-01-15"))
+        self.assertEqual(index.card_for("2026-02-15"), default)
+        self.assertEqual(index.card_for("2026-03-01"), revised)
+        self.assertEqual(index.card_for(None), default)
+
+        with patch("sheetal_supply_chain.py.milk_pricing.get_price_index", return_value={"Cow": index}):
+            self.assertRaises(frappe.ValidationError, get_rate_card, SUPPLIER, "Cow", "2026-01-15")
+
+    def test_undated_default_applies_before_first_effective_date(self):
+        default = make_rate_card(SUPPLIER, FLAT_RATE_MILK_TYPE, make_profile(40))
+        revised = make_rate_card(SUPPLIER, FLAT_RATE_MILK_TYPE, make_profile(42, "2026-03-01"))
+        index = make_price_index(default, [revised])
+
+        self.assertEqual(index.card_for("2026-01-15"), default)
+        self.assertEqual(index.card_for("2026-03-15"), revised)
+
+    def test_no_default_profile(self):
+        revised = make_rate_card(SUPPLIER, FLAT_RATE_MILK_TYPE, make_profile(42, "2026-03-01"))
+        index = make_price_index(None, [revised])
+
+        self.assertIsNone(index.card_for(None))
+        with patch("sheetal_supply_chain.py.milk_pricing.get_price_index", return_value={"Cow": index}):
+            self.assertRaises(frappe.ValidationError, get_rate_card, SUPPLIER, "Cow")
+
+    def test_supplier_without_profile(self):
+        with patch("sheetal_supply_chain.py.milk_pricing.get_price_index", return_value={}):
+            self.assertRaises(frappe.ValidationError, get_rate_card, SUPPLIER, "Cow", "2026-03-15")
+
+
+def get_parity_cards():
+    """Rate cards of every base rate type, keyed by milk type."""
+    profile = frappe._dict(base_rate=40, baseline_fat=4, baseline_snf=8.5, baseline_lr=28)
+
+    return {
+        "Cow": make_rate_card(SUPPLIER, FLAT_RATE_MILK_TYPE, profile),
+        "Cow Per KG Fat": make_rate_card(
+            SUPPLIER, {**FLAT_RATE_MILK_TYPE, "name": "Cow Per KG Fat", "base_rate_type": "Per KG Fat"}, profile
+        ),
+        "Cow Per LR": make_rate_card(
+            SUPPLIER,
+            {
+                **FLAT_RATE_MILK_TYPE,
+                "name": "Cow Per LR",
+                "base_rate_type": "Per LR",
+                "lr_addition_enabled": 1,
+                "lr_addition": 0.4,
+                "lr_deduction_enabled": 1,
+                "lr_deduction": 0.6,
+            },
+            profile,
+        ),
+        "Buffalo": make_rate_card(SUPPLIER, MATRIX_MILK_TYPE, {}, {RATE_MATRIX.name: RATE_MATRIX}),
+    }
+
+
+class TestBulkMilkPricingParity(IntegrationTestCase):
+    """price_milk_rows() must return exactly what get_milk_rate_for_pr_item() returns, row by row."""
+
+    def setUp(self):
+        cards = get_parity_cards()
+        index = {
+            milk_type: MilkPriceIndex(effective_dates=(), cards=(), default_card=card)
+            for milk_type, card in cards.items()
+        }
+
+        patcher = patch("sheetal_supply_chain.py.milk_pricing.get_price_index", return_value=index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.rows = [
+            (SUPPLIER, milk_type, fat, snf, lr, weight)
+            for milk_type in cards
+            for fat, snf, lr in READINGS
+            for weight in (1034, 517.25)
+        ]
+
+    def assert_matches_scalar_pricing(self):
+        results = price_milk_rows(self.rows)
+
+        for row, result in zip(self.rows, results, strict=True):
+            with self.subTest(row=row):
+                try:
+                    expected = get_milk_rate_for_pr_item(*row)
+                except frappe.ValidationError:
+                    # Off the rate matrix: reported on the row instead of raised
+                    self.assertIn("error", result)
+                    continue
+
+                self.assertEqual(result, expected)
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_vectorised_pricing_matches_scalar_pricing(self):
+        self.assert_matches_scalar_pricing()
+
+    def test_scalar_fallback_matches_scalar_pricing(self):
+        with patch("sheetal_supply_chain.py.milk_pricing.np", None):
+            self.assert_matches_scalar_pricing()
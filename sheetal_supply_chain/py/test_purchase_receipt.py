@@ -0,0 +1,110 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from sheetal_supply_chain.py.doc_changes import get_changed_rows
+from sheetal_supply_chain.py.purchase_receipt import (
+    PRICING_PARENT_FIELDS,
+    PRICING_ROW_FIELDS,
+    set_milk_pricing_on_items,
+)
+
+PRICED = {"rate_type": "Per Litre", "base_rate": 40, "final_rate": 41.5, "amount": 41500, "kg_per_litre": 1.0339}
+
+
+def make_receipt():
+    """A saved draft receipt with two milk rows, and the stored version it was loaded from."""
+    doc = frappe.get_doc(
+        {
+            "doctype": "Purchase Receipt",
+            "name": "_Test PR Pricing",
+            "supplier": "_Test Milk Supplier",
+            "posting_date": "2026-06-01",
+            "custom_net_weight": 1000,
+            "docstatus": 0,
+            "items": [
+                {
+                    "name": f"_Test-PRI-{idx}",
+                    "idx": idx,
+                    "item_code": "_Test Milk",
+                    "custom_milk_type": "Cow",
+                    "custom_fat": 4.2,
+                    "custom_snf": 8.5,
+                    "custom_lr": 28,
+                    "qty": 1000,
+                    "rate": 41.5,
+                }
+                for idx in (1, 2)
+            ],
+        }
+    )
+    doc._doc_before_save = frappe.get_doc(doc.as_dict())
+    return doc
+
+
+class TestMilkRowRepricing(IntegrationTestCase):
+    def setUp(self):
+        for target, kwargs in (
+            ("get_milk_rate_for_pr_item", {"return_value": PRICED}),
+            ("get_price_index", {"return_value": {}}),
+            ("warn_if_client_rate_card_is_stale", {}),
+        ):
+            patcher = patch(f"sheetal_supply_chain.py.purchase_receipt.{target}", **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_changed(self, doc):
+        return [row.name for row in get_changed_rows(doc, "items", PRICING_ROW_FIELDS, PRICING_PARENT_FIELDS)]
+
+    def test_new_receipt_prices_every_row(self):
+        doc = make_receipt()
+        doc._doc_before_save = None
+        doc.set("__islocal", 1)
+
+        self.assertEqual(self.get_changed(doc), ["_Test-PRI-1", "_Test-PRI-2"])
+
+        set_milk_pricing_on_items(doc)
+        self.assertEqual(doc.flags.milk_rows_repriced, 2)
+
+    def test_unchanged_rows_are_skipped(self):
+        doc = make_receipt()
+
+        # Same values in another type, as the form posts them back
+        doc.items[0].custom_fat = "4.20"
+        doc.items[1].qty = "1000"
+
+        self.assertEqual(self.get_changed(doc), [])
+
+        set_milk_pricing_on_items(doc)
+        self.assertEqual(doc.flags.milk_rows_repriced, 0)
+
+    def test_edited_row_is_repriced_alone(self):
+        doc = make_receipt()
+        doc.items[1].custom_snf = 8.7
+
+        self.assertEqual(self.get_changed(doc), ["_Test-PRI-2"])
+
+        set_milk_pricing_on_items(doc)
+        self.assertEqual(doc.flags.milk_rows_repriced, 1)
+
+    def test_added_row_is_priced(self):
+        doc = make_receipt()
+        doc.append("items", {"name": "_Test-PRI-3", "custom_milk_type": "Cow", "custom_fat": 4, "custom_snf": 8.4, "qty": 500})
+
+        self.assertEqual(self.get_changed(doc), ["_Test-PRI-3"])
+
+    def test_parent_field_change_reprices_every_row(self):
+        for field, value in (
+            ("supplier", "_Test Other Milk Supplier"),
+            ("posting_date", "2026-06-02"),
+            ("custom_net_weight", 1200),
+        ):
+            with self.subTest(field=field):
+                doc = make_receipt()
+                doc.set(field, value)
+
+                self.assertEqual(self.get_changed(doc), ["_Test-PRI-1", "_Test-PRI-2"])
+
+                set_milk_pricing_on_items(doc)
+                self.assertEqual(doc.flags.milk_rows_repriced, 2)
@@ -0,0 +1,62 @@
+import frappe
+
+UOM_CONVERSION_CACHE_KEY = "sheetal_item_uom_conversions"
+
+
+# ! Load UOM conversion factors of the given items into the cache with one query
+def preload_uom_conversions(item_codes):
+    """
+    Warm the (item, uom) -> conversion_factor cache for all items of a voucher.
+    Items already cached are skipped; the rest are read in a single query.
+    """
+    item_codes = {item_code for item_code in item_codes if item_code}
+    missing = [
+        item_code for item_code in item_codes
+        if frappe.cache.hget(UOM_CONVERSION_CACHE_KEY, item_code) is None
+    ]
+
+    if not missing:
+        return
+
+    conversions = {item_code: {} for item_code in missing}
+
+    rows = frappe.db.sql(
+        """
+        SELECT parent, uom, conversion_factor
+        FROM `tabUOM Conversion Detail`
+        WHERE parenttype = 'Item'
+          AND parent IN %(items)s
+          AND docstatus < 2
+        """,
+        {"items": missing},
+        as_dict=True,
+    )
+
+    for row in rows:
+        conversions[row.parent][row.uom] = row.conversion_factor
+
+    for item_code, uoms in conversions.items():
+        frappe.cache.hset(UOM_CONVERSION_CACHE_KEY, item_code, uoms)
+
+
+# ! Return all UOM conversion factors defined on an Item as {uom: conversion_factor}
+def get_item_uom_conversions(item_code):
+    if not item_code:
+        return {}
+
+    uoms = frappe.cache.hget(UOM_CONVERSION_CACHE_KEY, item_code)
+    if uoms is None:
+        preload_uom_conversions([item_code])
+        uoms = frappe.cache.hget(UOM_CONVERSION_CACHE_KEY, item_code)
+
+    return uoms or {}
+
+
+# ! Return the conversion factor of a UOM for an Item (None when the UOM is not configured)
+def get_uom_conversion_factor(item_code, uom):
+    return get_item_uom_conversions(item_code).get(uom)
+
+
+# ! Drop cached UOM conversions of an Item when it is saved or deleted
+def clear_uom_conversion_cache(doc, method=None):
+    frappe.cache.hdel(UOM_CONVERSION_CACHE_KEY, doc.name)
@@ -0,0 +1,68 @@
+import frappe
+from frappe import _
+
+
+# ! Allow a single item at a time in warehouses flagged "Only One Item", with one Warehouse and one Bin query
+def validate_one_item_warehouses(rows, warehouse_field="warehouse"):
+    """
+    Shared by Purchase Receipt (`warehouse`) and Stock Entry (`t_warehouse`).
+
+    The flag of all distinct target warehouses is fetched at once. Rows of
+    the same document must not put two different items into one restricted
+    warehouse, and the restricted warehouses must not already hold stock of
+    any other item (one Bin query for all of them).
+    """
+    incoming = {}
+    for row in rows:
+        warehouse = row.get(warehouse_field)
+        if warehouse and row.get("item_code"):
+            incoming.setdefault(warehouse, []).append(row)
+
+    if not incoming:
+        return
+
+    restricted = frappe.get_all(
+        "Warehouse",
+        filters={"name": ["in", list(incoming)], "custom_only_one_item": 1},
+        pluck="name",
+    )
+    if not restricted:
+        return
+
+    # Rows of this document against each other
+    for warehouse in restricted:
+        first = incoming[warehouse][0]
+        for row in incoming[warehouse][1:]:
+            if row.item_code != first.item_code:
+                frappe.throw(_(
+                    "Warehouse <b>{0}</b> allows only one item at a time.<br>"
+                    "Row {1} (<b>{2}</b>) and row {3} (<b>{4}</b>) cannot both go into it."
+                ).format(warehouse, first.idx, first.item_code, row.idx, row.item_code))
+
+    # Stock of any other item already in the restricted warehouses
+    conflicts = frappe.db.sql(
+        """
+        SELECT warehouse, item_code, actual_qty
+        FROM `tabBin`
+        WHERE warehouse IN %(warehouses)s
+          AND actual_qty > 0
+          AND (warehouse, item_code) NOT IN %(incoming)s
+        ORDER BY warehouse, item_code
+        """,
+        {
+            "warehouses": restricted,
+            "incoming": tuple((warehouse, incoming[warehouse][0].item_code) for warehouse in restricted),
+        },
+        as_dict=True,
+    )
+
+    if conflicts:
+        frappe.throw(_(
+            "Warehouse <b>{0}</b> allows only one item at a time.<br>"
+            "Item <b>{1}</b> already exists with quantity <b>{2}</b> (Stock UOM).<br>"
+            "Please reduce its stock to zero before adding another item."
+        ).format(
+            conflicts[0].warehouse,
+            conflicts[0].item_code,
+            conflicts[0].actual_qty
+        ))
@@ -0,0 +1,15 @@
+// Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Milk Payment Settlement", {
+	refresh(frm) {
+		if (frm.doc.docstatus === 0 && !frm.is_new()) {
+			frm.add_custom_button(__("Get Payable Summary"), () => {
+				frm.call({ doc: frm.doc, method: "calculate", freeze: true }).then(() => {
+					frm.dirty();
+					frm.save();
+				});
+			});
+		}
+	},
+});
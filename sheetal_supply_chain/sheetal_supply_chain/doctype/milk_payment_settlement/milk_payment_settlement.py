@@ -0,0 +1,56 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt, getdate
+
+from sheetal_supply_chain.py.milk_settlement import get_settlement_summary
+
+
+class MilkPaymentSettlement(Document):
+	def validate(self):
+		if getdate(self.from_date) > getdate(self.to_date):
+			frappe.throw(_("From Date cannot be after To Date."))
+
+		self.validate_overlapping_settlement()
+
+	def before_submit(self):
+		# Settle on the receipts as they are at submit time
+		self.calculate()
+
+	def validate_overlapping_settlement(self):
+		"""A receipt must not be paid by two submitted settlements."""
+		filters = {
+			"company": self.company,
+			"docstatus": 1,
+			"name": ["!=", self.name],
+			"from_date": ["<=", self.to_date],
+			"to_date": [">=", self.from_date],
+		}
+
+		for settlement in frappe.get_all("Milk Payment Settlement", filters=filters, fields=["name", "supplier"]):
+			if not settlement.supplier or not self.supplier or settlement.supplier == self.supplier:
+				frappe.throw(
+					_("Period overlaps with submitted Milk Payment Settlement {0}.").format(
+						frappe.get_desk_link("Milk Payment Settlement", settlement.name)
+					)
+				)
+
+	@frappe.whitelist()
+	def calculate(self):
+		"""Rebuild the payable summary from the submitted Purchase Receipts of the period."""
+		self.set("items", [])
+
+		summary, receipt_count = get_settlement_summary(self.company, self.from_date, self.to_date, self.supplier)
+		for entry in summary:
+			self.append("items", entry)
+
+		# Distinct receipts: one with two milk types is in two rows
+		self.receipt_count = receipt_count
+		self.total_qty_in_liter = sum(flt(row.qty_in_liter) for row in self.items)
+		self.total_qty_in_kg = sum(flt(row.qty_in_kg) for row in self.items)
+		self.total_fat_kg = sum(flt(row.fat_kg) for row in self.items)
+		self.total_snf_kg = sum(flt(row.snf_kg) for row in self.items)
+		self.total_payable_amount = sum(flt(row.payable_amount) for row in self.items)
@@ -0,0 +1,60 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from sheetal_supply_chain.py.milk_settlement import get_settlement_summary
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+def make_row(parent, idx, milk_type, qty=100, rate=50):
+	return frappe._dict(
+		posting_date="2026-04-01",
+		parent=parent,
+		idx=idx,
+		supplier="_Test Milk Supplier",
+		milk_type=milk_type,
+		qty=qty,
+		stock_qty=qty * 1.03,
+		custom_fat_kg=qty * 0.04,
+		custom_snf_kg=qty * 0.085,
+		milk_final_rate=rate,
+		milk_final_amount=qty * rate,
+		milk_fat_addition=0,
+		milk_fat_deduction=0,
+		milk_snf_addition=0,
+		milk_snf_deduction=0,
+	)
+
+
+class IntegrationTestMilkPaymentSettlement(IntegrationTestCase):
+	"""
+	Integration tests for MilkPaymentSettlement.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def test_receipt_with_two_milk_types_is_counted_once(self):
+		rows = [
+			make_row("_Test PR 1", 1, "Cow"),
+			make_row("_Test PR 1", 2, "Buffalo", rate=60),
+			make_row("_Test PR 1", 3, "Cow"),
+			make_row("_Test PR 2", 1, "Cow"),
+		]
+
+		with patch("sheetal_supply_chain.py.milk_settlement.iter_settlement_rows", return_value=iter(rows)):
+			summary, receipt_count = get_settlement_summary("_Test Company", "2026-04-01", "2026-04-30")
+
+		self.assertEqual(receipt_count, 2)
+		self.assertEqual(
+			{entry.milk_type: entry.receipt_count for entry in summary},
+			{"Buffalo": 1, "Cow": 2},
+		)
+		self.assertEqual(sum(entry.payable_amount for entry in summary), 3 * 100 * 50 + 100 * 60)
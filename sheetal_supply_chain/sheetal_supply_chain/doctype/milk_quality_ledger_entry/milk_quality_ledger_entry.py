@@ -1,9 +1,42 @@
 # Copyright (c) 2025, Sanskar Technolab Pvt Ltd and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from sheetal_supply_chain.py.milk_blending import apply_quality_blend
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_repost.milk_quality_repost import (
+	queue_reposts_for_backdated_entries,
+)
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+	refresh_snapshots,
+	update_snapshots_for_entries,
+)
+
+# Composite indexes for the hot ledger queries: {index name: columns}
+MQLE_INDEXES = {
+	# Entries of an (item, warehouse) in posting order: blending, repost, snapshots
+	"item_warehouse_posting_index": ["item_code", "warehouse", "docstatus", "posting_date", "posting_time", "creation"],
+	# Entries of a voucher: idempotent posting and bulk cancel
+	"voucher_index": ["voucher_type", "voucher_no"],
+	# Milk Quality Ledger report
+	"company_posting_index": ["company", "is_cancelled", "posting_date"],
+}
+
 
 class MilkQualityLedgerEntry(Document):
-	pass
+	def before_submit(self):
+		apply_quality_blend([self])
+
+	def on_submit(self):
+		update_snapshots_for_entries([self])
+		queue_reposts_for_backdated_entries([self])
+
+	def on_cancel(self):
+		refresh_snapshots([(self.item_code, self.warehouse, self.batch_no)])
+		queue_reposts_for_backdated_entries([self])
+
+
+def on_doctype_update():
+	for index_name, columns in MQLE_INDEXES.items():
+		frappe.db.add_index("Milk Quality Ledger Entry", columns, index_name)
@@ -1,9 +1,90 @@
 # Copyright (c) 2025, Sanskar Technolab Pvt Ltd and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, getdate, now_datetime
+
+TEST_COMPANY = "_Test MQLE Index Company"
+
+# Hot ledger queries that must be served by an index: (label, query, values)
+HOT_QUERIES = (
+	(
+		"entries of an item and warehouse in posting order",
+		"""
+		SELECT name, qty_after_transaction_in_kg
+		FROM `tabMilk Quality Ledger Entry`
+		WHERE docstatus = 1 AND item_code = %(item_code)s AND warehouse = %(warehouse)s
+		ORDER BY posting_date, posting_time, creation
+		""",
+		{"item_code": "_Test MQLE Item 7", "warehouse": "_Test MQLE Warehouse 3"},
+	),
+	(
+		"entries of a voucher",
+		"""
+		SELECT voucher_detail_no
+		FROM `tabMilk Quality Ledger Entry`
+		WHERE voucher_type = %(voucher_type)s AND voucher_no = %(voucher_no)s AND docstatus = 1
+		""",
+		{"voucher_type": "Stock Entry", "voucher_no": "_Test MQLE SE 42"},
+	),
+	(
+		"milk quality ledger report",
+		"""
+		SELECT name, posting_date, posting_time
+		FROM `tabMilk Quality Ledger Entry`
+		WHERE company = %(company)s AND is_cancelled = 0
+			AND posting_date >= %(from_date)s AND posting_date <= %(to_date)s
+		ORDER BY posting_date, posting_time, creation
+		""",
+		{"company": TEST_COMPANY, "from_date": "2026-01-10", "to_date": "2026-01-12"},
+	),
+)
 
 
 class TestMilkQualityLedgerEntry(FrappeTestCase):
-	pass
+	# The indexes come from on_doctype_update() at migrate; calling it here would run
+	# DDL, which commits implicitly and leaks the seeded rows into the site
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		seed_ledger_entries()
+
+	@classmethod
+	def tearDownClass(cls):
+		frappe.db.delete("Milk Quality Ledger Entry", {"company": TEST_COMPANY})
+		super().tearDownClass()
+
+	def test_hot_queries_use_an_index(self):
+		for label, query, values in HOT_QUERIES:
+			with self.subTest(query=label):
+				plan = frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True)
+
+				for step in plan:
+					self.assertNotEqual(step.get("type"), "ALL", f"Full scan for {label}: {plan}")
+					self.assertTrue(step.get("key"), f"No index used for {label}: {plan}")
+
+
+def seed_ledger_entries(count=5000):
+	"""Spread `count` submitted entries over 50 items, 10 warehouses and 500 vouchers."""
+	now = now_datetime()
+	start = getdate("2026-01-01")
+
+	fields = [
+		"name", "creation", "modified", "owner", "modified_by", "docstatus",
+		"company", "item_code", "warehouse", "voucher_type", "voucher_no", "voucher_detail_no",
+		"posting_date", "posting_time", "is_cancelled", "qty_in_kg", "qty_after_transaction_in_kg",
+	]
+
+	values = []
+	for i in range(count):
+		values.append(
+			(
+				f"_Test-MQLE-{i:06d}", now, now, "Administrator", "Administrator", 1,
+				TEST_COMPANY, f"_Test MQLE Item {i % 50}", f"_Test MQLE Warehouse {i % 10}",
+				"Stock Entry", f"_Test MQLE SE {i // 10}", f"_Test-SED-{i:06d}",
+				add_days(start, i % 60), "10:00:00", 0, 10, i,
+			)
+		)
+
+	frappe.db.bulk_insert("Milk Quality Ledger Entry", fields, values)
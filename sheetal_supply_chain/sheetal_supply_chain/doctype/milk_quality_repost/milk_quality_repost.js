@@ -0,0 +1,29 @@
+// Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Milk Quality Repost", {
+	refresh(frm) {
+		if (["Failed", "Skipped"].includes(frm.doc.status)) {
+			frm.add_custom_button(__("Restart"), () => {
+				frappe
+					.call({
+						method: "sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_repost.milk_quality_repost.restart_repost",
+						args: { name: frm.doc.name },
+					})
+					.then((r) => {
+						if (r.message) {
+							frappe.set_route("Form", "Milk Quality Repost", r.message);
+						}
+					});
+			});
+		}
+
+		if (frm.doc.status === "In Progress" && frm.doc.total_entries) {
+			frm.dashboard.show_progress(
+				__("Reposting"),
+				(frm.doc.entries_reposted / frm.doc.total_entries) * 100,
+				__("{0} of {1} entries reposted", [frm.doc.entries_reposted, frm.doc.total_entries])
+			);
+		}
+	},
+});
@@ -0,0 +1,357 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt, get_datetime
+
+from sheetal_supply_chain.py.milk_blending import (
+	BLEND_FIELDS,
+	blend_entries,
+	get_blend_state,
+	get_posting_datetime,
+	get_previous_entry,
+	iter_entry_pages,
+)
+from sheetal_supply_chain.py.uom_conversion import get_uom_conversion_factor
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_snapshot.milk_quality_snapshot import (
+	refresh_snapshots,
+)
+
+REPOST_DOCTYPE = "Milk Quality Repost"
+REPOST_JOB_ID = "milk_quality_repost"
+
+# Entries recomputed (and committed) per page of the streaming pass
+REPOST_CHUNK_SIZE = 500
+
+
+class MilkQualityRepost(Document):
+	def run(self):
+		"""Recompute the ledger from this job's posting datetime, recording the outcome on the job."""
+		self.merge_queued_reposts()
+
+		self.db_set({"status": "In Progress", "error_log": None}, update_modified=False)
+		frappe.db.commit()
+
+		try:
+			self.repost()
+			self.db_set("status", "Completed")
+		except Exception:
+			frappe.db.rollback()
+			self.db_set({"status": "Failed", "error_log": frappe.get_traceback()})
+			self.log_error(_("Milk Quality Repost failed"))
+
+		frappe.db.commit()
+
+	def merge_queued_reposts(self):
+		"""Fold other queued jobs of the same item and warehouse into this one."""
+		queued = frappe.get_all(
+			REPOST_DOCTYPE,
+			filters={
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"status": "Queued",
+				"name": ["!=", self.name],
+			},
+			fields=["name", "posting_date", "posting_time"],
+		)
+
+		for job in queued:
+			if get_posting_datetime(job.posting_date, job.posting_time) < self.get_from_datetime():
+				self.posting_date, self.posting_time = job.posting_date, job.posting_time
+
+			frappe.db.set_value(REPOST_DOCTYPE, job.name, {"status": "Skipped", "merged_into": self.name})
+
+		if queued:
+			self.db_set({"posting_date": self.posting_date, "posting_time": self.posting_time})
+
+	def get_from_datetime(self):
+		return get_posting_datetime(self.posting_date, self.posting_time)
+
+	def repost(self):
+		"""
+		Recompute qty after transaction and the blended FAT/SNF of every entry
+		posted at or after the job's datetime in one ordered pass.
+
+		Entries and stock movements are both streamed in posting order, so
+		memory stays flat however long the ledger is. A page never splits the
+		rows of one posting datetime, as they share a closing balance (see
+		iter_entry_pages()). Each page is written
+		with one bulk update and committed together with the progress counter.
+
+		Pages are not rolled back together: when a page fails, the pages
+		before it stay recomputed and the later ones stay stale. The job is
+		not resumed from its last page; running it again (or the next repost
+		of the key) redoes the whole pass from posting_date, which is safe
+		because every page is a plain recomputation from the previous entry.
+		"""
+		from_datetime = self.get_from_datetime()
+
+		state = get_blend_state(get_previous_entry(self.item_code, self.warehouse, from_datetime))
+		balance = get_opening_balance(self.item_code, self.warehouse, from_datetime)
+
+		movements = iter_stock_movements(self.item_code, self.warehouse, from_datetime)
+		movement = next(movements, None)
+
+		stock_uom = frappe.get_cached_value("Item", self.item_code, "stock_uom") or "KG"
+		included_uom = "Litre"
+		conversion_factor = get_uom_conversion_factor(self.item_code, included_uom) or 1.0
+
+		self.db_set(
+			{
+				"total_entries": count_entries_from(self.item_code, self.warehouse, from_datetime),
+				"entries_reposted": 0,
+			},
+			update_modified=False,
+		)
+
+		batches = set()
+		reposted = 0
+
+		for entries in iter_entry_pages(
+			self.item_code, self.warehouse, from_datetime=from_datetime, page_length=REPOST_CHUNK_SIZE
+		):
+			for entry in entries:
+				# Stock balance as get_stock_balance() sees it at the entry's posting datetime
+				while movement and movement.posting_datetime <= entry.posting_datetime:
+					balance += flt(movement.actual_qty)
+					movement = next(movements, None)
+
+				entry.qty_after_transaction_in_kg = balance
+				entry.qty_after_transaction_in_liter = (
+					balance / conversion_factor if stock_uom != included_uom else balance
+				)
+
+			state = blend_entries(state, entries)
+
+			updates = {}
+			for entry in entries:
+				updates[entry.name] = {
+					"entry_type": entry.entry_type,
+					"qty_after_transaction_in_kg": entry.qty_after_transaction_in_kg,
+					"qty_after_transaction_in_liter": entry.qty_after_transaction_in_liter,
+					**{field: entry.get(field) for field in BLEND_FIELDS},
+				}
+
+				if entry.batch_no:
+					batches.add(entry.batch_no)
+
+			frappe.db.bulk_update("Milk Quality Ledger Entry", updates, update_modified=False)
+
+			reposted += len(entries)
+			self.db_set("entries_reposted", reposted, update_modified=False)
+			frappe.db.commit()
+
+		refresh_snapshots(
+			[(self.item_code, self.warehouse, None)]
+			+ [(self.item_code, self.warehouse, batch_no) for batch_no in batches]
+		)
+
+
+def get_opening_balance(item_code, warehouse, from_datetime):
+	"""Stock of the item in the warehouse just before `from_datetime`."""
+	balance = frappe.db.sql(
+		"""
+		SELECT SUM(actual_qty)
+		FROM `tabStock Ledger Entry`
+		WHERE item_code = %(item_code)s
+			AND warehouse = %(warehouse)s
+			AND is_cancelled = 0
+			AND posting_datetime < %(from_datetime)s
+		""",
+		{"item_code": item_code, "warehouse": warehouse, "from_datetime": from_datetime},
+	)
+
+	return flt(balance[0][0]) if balance else 0.0
+
+
+def iter_stock_movements(item_code, warehouse, from_datetime, page_length=REPOST_CHUNK_SIZE):
+	"""Yield net stock movement per posting datetime from `from_datetime` onwards, in order."""
+	condition = "posting_datetime >= %(from_datetime)s"
+	values = {"item_code": item_code, "warehouse": warehouse, "from_datetime": from_datetime}
+
+	while True:
+		movements = frappe.db.sql(
+			f"""
+			SELECT posting_datetime, SUM(actual_qty) AS actual_qty
+			FROM `tabStock Ledger Entry`
+			WHERE item_code = %(item_code)s
+				AND warehouse = %(warehouse)s
+				AND is_cancelled = 0
+				AND {condition}
+			GROUP BY posting_datetime
+			ORDER BY posting_datetime
+			LIMIT {int(page_length)}
+			""",
+			values,
+			as_dict=True,
+		)
+
+		yield from movements
+
+		if len(movements) < page_length:
+			return
+
+		condition = "posting_datetime > %(from_datetime)s"
+		values["from_datetime"] = movements[-1].posting_datetime
+
+
+def count_entries_from(item_code, warehouse, from_datetime):
+	return frappe.db.sql(
+		"""
+		SELECT COUNT(*)
+		FROM `tabMilk Quality Ledger Entry`
+		WHERE docstatus = 1
+			AND item_code = %(item_code)s
+			AND warehouse = %(warehouse)s
+			AND TIMESTAMP(posting_date, posting_time) >= %(from_datetime)s
+		""",
+		{"item_code": item_code, "warehouse": warehouse, "from_datetime": from_datetime},
+	)[0][0]
+
+
+def queue_reposts_for_backdated_entries(entries):
+	"""
+	Queue a repost for every (item, warehouse) of `entries` that already has
+	submitted entries posted after them. Used when a back-dated voucher is
+	submitted or when an entry is cancelled.
+	"""
+	earliest = {}
+	for entry in entries:
+		key = (entry.get("item_code"), entry.get("warehouse"))
+		if not all(key):
+			continue
+
+		posting_datetime = get_posting_datetime(entry.get("posting_date"), entry.get("posting_time"))
+		if key not in earliest or posting_datetime < earliest[key][0]:
+			earliest[key] = (posting_datetime, entry)
+
+	if not earliest:
+		return
+
+	last_posted = frappe.db.sql(
+		"""
+		SELECT item_code, warehouse, MAX(TIMESTAMP(posting_date, posting_time)) AS posting_datetime
+		FROM `tabMilk Quality Ledger Entry`
+		WHERE docstatus = 1
+			AND item_code IN %(items)s
+			AND warehouse IN %(warehouses)s
+		GROUP BY item_code, warehouse
+		""",
+		{
+			"items": list({key[0] for key in earliest}),
+			"warehouses": list({key[1] for key in earliest}),
+		},
+		as_dict=True,
+	)
+
+	for row in last_posted:
+		key = (row.item_code, row.warehouse)
+		if key not in earliest:
+			continue
+
+		posting_datetime, entry = earliest[key]
+		if get_datetime(row.posting_datetime) > posting_datetime:
+			enqueue_milk_quality_repost(
+				row.item_code,
+				row.warehouse,
+				entry.get("posting_date"),
+				entry.get("posting_time"),
+				voucher_type=entry.get("voucher_type"),
+				voucher_no=entry.get("voucher_no"),
+			)
+
+
+def enqueue_milk_quality_repost(item_code, warehouse, posting_date, posting_time, voucher_type=None, voucher_no=None):
+	"""
+	Queue a repost of (item_code, warehouse) from the given posting datetime.
+
+	A job already queued for the same item and warehouse is reused and moved
+	back to the earlier datetime, so overlapping back-dated postings collapse
+	into a single pass. Returns the name of the job.
+	"""
+	existing = frappe.db.get_value(
+		REPOST_DOCTYPE,
+		{"item_code": item_code, "warehouse": warehouse, "status": "Queued"},
+		["name", "posting_date", "posting_time"],
+		as_dict=True,
+	)
+
+	if existing:
+		name = existing.name
+		if get_posting_datetime(posting_date, posting_time) < get_posting_datetime(
+			existing.posting_date, existing.posting_time
+		):
+			frappe.db.set_value(
+				REPOST_DOCTYPE,
+				name,
+				{
+					"posting_date": posting_date,
+					"posting_time": posting_time,
+					"voucher_type": voucher_type,
+					"voucher_no": voucher_no,
+				},
+			)
+	else:
+		repost = frappe.get_doc(
+			{
+				"doctype": REPOST_DOCTYPE,
+				"item_code": item_code,
+				"warehouse": warehouse,
+				"posting_date": posting_date,
+				"posting_time": posting_time,
+				"voucher_type": voucher_type,
+				"voucher_no": voucher_no,
+				"status": "Queued",
+			}
+		)
+		repost.insert(ignore_permissions=True)
+		name = repost.name
+
+	frappe.enqueue(
+		process_milk_quality_reposts,
+		queue="long",
+		job_id=REPOST_JOB_ID,
+		deduplicate=True,
+		enqueue_after_commit=True,
+	)
+
+	return name
+
+
+def process_milk_quality_reposts():
+	"""Run all queued reposts, earliest posting first. Also scheduled hourly as a safety net."""
+	queued = frappe.get_all(
+		REPOST_DOCTYPE,
+		filters={"status": "Queued"},
+		order_by="posting_date asc, posting_time asc, creation asc",
+		pluck="name",
+	)
+
+	for name in queued:
+		repost = frappe.get_doc(REPOST_DOCTYPE, name)
+
+		# Merged into an earlier job of the same key in this run
+		if repost.status != "Queued":
+			continue
+
+		repost.run()
+
+
+@frappe.whitelist()
+def restart_repost(name):
+	repost = frappe.get_doc(REPOST_DOCTYPE, name)
+	repost.check_permission("write")
+
+	if repost.status not in ("Failed", "Skipped"):
+		frappe.throw(_("Only failed or skipped reposts can be restarted."))
+
+	return enqueue_milk_quality_repost(
+		repost.item_code,
+		repost.warehouse,
+		repost.posting_date,
+		repost.posting_time,
+		voucher_type=repost.voucher_type,
+		voucher_no=repost.voucher_no,
+	)
@@ -0,0 +1,165 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import get_datetime, now_datetime
+
+from sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_repost.milk_quality_repost import (
+	REPOST_DOCTYPE,
+)
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+MODULE = "sheetal_supply_chain.sheetal_supply_chain.doctype.milk_quality_repost.milk_quality_repost"
+
+ITEM_CODE = "_Test Repost Milk"
+WAREHOUSE = "_Test Repost Tank"
+
+MQLE_FIELDS = [
+	"name", "creation", "modified", "owner", "modified_by", "docstatus", "is_cancelled",
+	"item_code", "warehouse", "voucher_type", "voucher_no", "voucher_detail_no", "entry_type",
+	"posting_date", "posting_time", "qty_in_kg", "qty_after_transaction_in_kg",
+	"fat_per", "snf_per", "fat", "snf",
+	"fat_per_after_transaction", "snf_per_after_transaction", "fat_after_transaction", "snf_after_transaction",
+]
+
+SLE_FIELDS = [
+	"name", "creation", "modified", "owner", "modified_by", "docstatus", "is_cancelled",
+	"item_code", "warehouse", "voucher_type", "voucher_no",
+	"posting_date", "posting_time", "posting_datetime", "actual_qty",
+]
+
+
+class IntegrationTestMilkQualityRepost(IntegrationTestCase):
+	"""
+	Integration tests for MilkQualityRepost.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def tearDown(self):
+		frappe.db.delete("Milk Quality Ledger Entry", {"item_code": ITEM_CODE})
+		frappe.db.delete("Stock Ledger Entry", {"item_code": ITEM_CODE})
+		frappe.db.delete(REPOST_DOCTYPE, {"item_code": ITEM_CODE})
+
+	def test_repost_after_back_dated_inward(self):
+		# Day 1: 100 kg @ 4% / 8% in; day 3: 50 kg out, blended before day 2 existed
+		insert_entry("_Test-MQR-1", "Inward", "2026-05-01", 100, 100, 4, 8, blend=(4, 8, 4, 8))
+		insert_entry("_Test-MQR-3", "Outward", "2026-05-03", 50, 50, 4, 8, blend=(4, 8, 2, 4))
+
+		# Day 2, posted late: 100 kg @ 6% / 9% in, its stock and its own blend already right
+		insert_entry("_Test-MQR-2", "Inward", "2026-05-02", 100, 200, 6, 9, blend=(5, 8.5, 10, 17))
+
+		insert_stock_ledger([("2026-05-01", 100), ("2026-05-02", 100), ("2026-05-03", -50)])
+
+		repost = frappe.new_doc(REPOST_DOCTYPE)
+		repost.update(
+			{"item_code": ITEM_CODE, "warehouse": WAREHOUSE, "posting_date": "2026-05-02", "posting_time": "10:00:00"}
+		)
+		repost.flags.ignore_links = True
+		repost.insert(ignore_permissions=True)
+
+		# Pages commit as they go; keep the test transaction open
+		with patch.object(frappe.db, "commit"):
+			repost.repost()
+
+		later = frappe.db.get_value(
+			"Milk Quality Ledger Entry",
+			"_Test-MQR-3",
+			[
+				"qty_after_transaction_in_kg",
+				"fat_per_after_transaction",
+				"snf_per_after_transaction",
+				"fat_after_transaction",
+				"snf_after_transaction",
+			],
+			as_dict=True,
+		)
+
+		# 200 kg @ 5% / 8.5% after day 2, 50 kg out on day 3
+		self.assertAlmostEqual(later.qty_after_transaction_in_kg, 150)
+		self.assertAlmostEqual(later.fat_per_after_transaction, 5)
+		self.assertAlmostEqual(later.snf_per_after_transaction, 8.5)
+		self.assertAlmostEqual(later.fat_after_transaction, 7.5)
+		self.assertAlmostEqual(later.snf_after_transaction, 12.75)
+
+		# The entry the repost started from is left as it was
+		self.assertAlmostEqual(
+			frappe.db.get_value("Milk Quality Ledger Entry", "_Test-MQR-1", "fat_after_transaction"), 4
+		)
+
+	def test_page_does_not_split_rows_posted_together(self):
+		insert_entry("_Test-MQR-1", "Inward", "2026-05-01", 100, 100, 4, 8, blend=(4, 8, 4, 8))
+
+		# Two rows of one voucher, both blended against its closing 300 kg
+		insert_entry("_Test-MQR-2A", "Inward", "2026-05-02", 100, 300, 6, 9, blend=(0, 0, 0, 0))
+		insert_entry("_Test-MQR-2B", "Inward", "2026-05-02", 100, 300, 8, 10, blend=(0, 0, 0, 0))
+
+		insert_stock_ledger([("2026-05-01", 100), ("2026-05-02", 200)])
+
+		repost = frappe.new_doc(REPOST_DOCTYPE)
+		repost.update(
+			{"item_code": ITEM_CODE, "warehouse": WAREHOUSE, "posting_date": "2026-05-02", "posting_time": "10:00:00"}
+		)
+		repost.flags.ignore_links = True
+		repost.insert(ignore_permissions=True)
+
+		# A page of one entry would end between the two rows
+		with (
+			patch.object(frappe.db, "commit"),
+			patch(f"{MODULE}.REPOST_CHUNK_SIZE", 1),
+		):
+			repost.repost()
+
+		fields = ["fat_per_after_transaction", "snf_per_after_transaction", "fat_after_transaction"]
+		first = frappe.db.get_value("Milk Quality Ledger Entry", "_Test-MQR-2A", fields, as_dict=True)
+		second = frappe.db.get_value("Milk Quality Ledger Entry", "_Test-MQR-2B", fields, as_dict=True)
+
+		# 100 kg @ 4% + 100 kg @ 6% -> 200 kg @ 5% / 8.5%
+		self.assertAlmostEqual(first.fat_per_after_transaction, 5)
+		self.assertAlmostEqual(first.snf_per_after_transaction, 8.5)
+		self.assertAlmostEqual(first.fat_after_transaction, 10)
+
+		# 200 kg @ 5% + 100 kg @ 8% -> 300 kg @ 6% / 9%
+		self.assertAlmostEqual(second.fat_per_after_transaction, 6)
+		self.assertAlmostEqual(second.snf_per_after_transaction, 9)
+		self.assertAlmostEqual(second.fat_after_transaction, 18)
+
+
+def insert_entry(name, entry_type, posting_date, qty_in, qty_after, fat_per, snf_per, blend):
+	now = now_datetime()
+	frappe.db.bulk_insert(
+		"Milk Quality Ledger Entry",
+		MQLE_FIELDS,
+		[
+			(
+				name, now, now, "Administrator", "Administrator", 1, 0,
+				ITEM_CODE, WAREHOUSE, "Stock Entry", name, name, entry_type,
+				posting_date, "10:00:00", qty_in, qty_after,
+				fat_per, snf_per, qty_in * fat_per / 100, qty_in * snf_per / 100,
+				*blend,
+			)
+		],
+	)
+
+
+def insert_stock_ledger(movements):
+	now = now_datetime()
+	frappe.db.bulk_insert(
+		"Stock Ledger Entry",
+		SLE_FIELDS,
+		[
+			(
+				f"_Test-MQR-SLE-{i}", now, now, "Administrator", "Administrator", 1, 0,
+				ITEM_CODE, WAREHOUSE, "Stock Entry", f"_Test-MQR-SLE-{i}",
+				posting_date, "10:00:00", get_datetime(f"{posting_date} 10:00:00"), actual_qty,
+			)
+			for i, (posting_date, actual_qty) in enumerate(movements)
+		],
+	)
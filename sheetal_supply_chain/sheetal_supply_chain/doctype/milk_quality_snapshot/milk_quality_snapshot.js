@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Milk Quality Snapshot", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,246 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+
+SNAPSHOT_DOCTYPE = "Milk Quality Snapshot"
+
+# Values copied from the Milk Quality Ledger Entry into its snapshot rows
+SNAPSHOT_VALUE_FIELDS = (
+	"posting_date",
+	"posting_time",
+	"fat_per",
+	"snf_per",
+	"fat",
+	"snf",
+	"qty_in_kg",
+	"qty_in_liter",
+	"qty_after_transaction_in_kg",
+	"qty_after_transaction_in_liter",
+	# Weighted-average (blended) composition of the item in the warehouse
+	"fat_per_after_transaction",
+	"snf_per_after_transaction",
+	"fat_after_transaction",
+	"snf_after_transaction",
+)
+
+
+class MilkQualitySnapshot(Document):
+	pass
+
+
+def get_snapshot_name(item_code, warehouse, batch_no=None):
+	"""Deterministic primary key for an (item_code, warehouse, batch_no) snapshot.
+
+	The row with an empty batch_no holds the latest quality of the item in the
+	warehouse across all batches.
+	"""
+	key = "\x1f".join((item_code or "", warehouse or "", batch_no or ""))
+	return hashlib.md5(key.encode()).hexdigest()
+
+
+def get_last_milk_quality(item_code, warehouse, batch_no=None):
+	"""Latest submitted quality for the key as a primary-key read, or None."""
+	return frappe.db.get_value(
+		SNAPSHOT_DOCTYPE,
+		get_snapshot_name(item_code, warehouse, batch_no),
+		["last_entry", *SNAPSHOT_VALUE_FIELDS],
+		as_dict=True,
+	)
+
+
+def get_last_milk_quality_map(keys):
+	"""Bulk variant of get_last_milk_quality().
+
+	`keys` is an iterable of (item_code, warehouse) or (item_code, warehouse, batch_no).
+	Returns {key: snapshot} for keys that have a snapshot.
+	"""
+	names = {}
+	for key in keys:
+		names[get_snapshot_name(*key)] = key
+
+	if not names:
+		return {}
+
+	rows = frappe.get_all(
+		SNAPSHOT_DOCTYPE,
+		filters={"name": ["in", list(names)]},
+		fields=["name", "last_entry", *SNAPSHOT_VALUE_FIELDS],
+	)
+
+	return {names[row.pop("name")]: row for row in rows}
+
+
+def update_snapshots_for_entries(entries):
+	"""Point the snapshots of the given submitted ledger entries at them.
+
+	Entries are applied in order, so the last entry of a key wins. Both the
+	batch-level row and the warehouse-level row are written with one upsert.
+	A stored snapshot only moves forward: a back-dated entry does not replace
+	one posted later, matching the posting order of refresh_snapshots().
+	"""
+	rows = {}
+
+	for entry in entries:
+		values = {field: entry.get(field) for field in SNAPSHOT_VALUE_FIELDS}
+		values["last_entry"] = entry.get("name")
+
+		batch_keys = [""]
+		if entry.get("batch_no"):
+			batch_keys.append(entry.get("batch_no"))
+
+		for batch_no in batch_keys:
+			name = get_snapshot_name(entry.get("item_code"), entry.get("warehouse"), batch_no)
+			rows[name] = {
+				"item_code": entry.get("item_code"),
+				"warehouse": entry.get("warehouse"),
+				"batch_no": batch_no,
+				**values,
+			}
+
+	_upsert_snapshots(rows, forward_only=True)
+
+
+def refresh_snapshots(keys):
+	"""Recompute snapshots of (item_code, warehouse, batch_no) keys from the ledger.
+
+	Used when entries are cancelled or reposted and the snapshot has to follow
+	the last submitted entry in posting order. Keys without any submitted
+	entry are removed. Runs a fixed number of queries for any number of keys.
+	"""
+	keys = set(keys)
+
+	wanted = set()
+	for item_code, warehouse, batch_no in keys:
+		wanted.add(get_snapshot_name(item_code, warehouse, ""))
+		if batch_no:
+			wanted.add(get_snapshot_name(item_code, warehouse, batch_no))
+
+	if not wanted:
+		return
+
+	values = {
+		"items": list({key[0] for key in keys}),
+		"warehouses": list({key[1] for key in keys}),
+	}
+	batches = list({key[2] for key in keys if key[2]})
+
+	rows = _get_latest_entry_rows(
+		"AND item_code IN %(items)s AND warehouse IN %(warehouses)s",
+		{**values, "batches": batches},
+		with_batches=bool(batches),
+		batch_condition="AND batch_no IN %(batches)s",
+	)
+	rows = {name: row for name, row in rows.items() if name in wanted}
+
+	stale = wanted - set(rows)
+	if stale:
+		frappe.db.delete(SNAPSHOT_DOCTYPE, {"name": ["in", list(stale)]})
+
+	_upsert_snapshots(rows)
+
+
+def rebuild_milk_quality_snapshots():
+	"""Regenerate the whole snapshot table from the Milk Quality Ledger."""
+	frappe.db.delete(SNAPSHOT_DOCTYPE)
+	_upsert_snapshots(_get_latest_entry_rows())
+
+
+def _get_latest_entry_rows(condition="", values=None, with_batches=True, batch_condition=""):
+	"""Snapshot rows built from the last submitted entry (in posting order) of
+	every (item, warehouse) and, optionally, every (item, warehouse, batch)."""
+	fields = ", ".join(f"`{field}`" for field in ("name", "item_code", "warehouse", "batch_no", *SNAPSHOT_VALUE_FIELDS))
+
+	partitions = [("item_code, warehouse", condition)]
+	if with_batches:
+		partitions.append(("item_code, warehouse, batch_no", f"{condition} {batch_condition} AND IFNULL(batch_no, '') != ''"))
+
+	rows = {}
+	for partition, partition_condition in partitions:
+		entries = frappe.db.sql(
+			f"""
+			SELECT {fields}
+			FROM (
+				SELECT {fields},
+					ROW_NUMBER() OVER (
+						PARTITION BY {partition}
+						ORDER BY posting_date DESC, posting_time DESC, creation DESC
+					) AS rn
+				FROM `tabMilk Quality Ledger Entry`
+				WHERE docstatus = 1 {partition_condition}
+			) latest
+			WHERE rn = 1
+			""",
+			values or {},
+			as_dict=True,
+		)
+
+		is_batch_partition = "batch_no" in partition
+		for entry in entries:
+			batch_no = entry.batch_no if is_batch_partition else ""
+
+			rows[get_snapshot_name(entry.item_code, entry.warehouse, batch_no)] = {
+				"item_code": entry.item_code,
+				"warehouse": entry.warehouse,
+				"batch_no": batch_no,
+				"last_entry": entry.name,
+				**{field: entry.get(field) for field in SNAPSHOT_VALUE_FIELDS},
+			}
+
+	return rows
+
+
+def _upsert_snapshots(rows, forward_only=False):
+	"""Insert or overwrite snapshot rows; with `forward_only`, existing rows are only
+	overwritten by rows posted at or after them."""
+	if not rows:
+		return
+
+	now = now_datetime()
+	user = frappe.session.user
+
+	columns = ["name", "creation", "modified", "owner", "modified_by", "item_code", "warehouse", "batch_no", "last_entry", *SNAPSHOT_VALUE_FIELDS]
+	# Assignments are evaluated left to right and later conditions see the updated
+	# columns: posting_time, then posting_date, go last so the forward_only test of
+	# every column still compares against the stored posting datetime
+	update_columns = [c for c in columns if c not in ("name", "creation", "owner", "posting_date", "posting_time")]
+	update_columns += ["posting_time", "posting_date"]
+
+	values = []
+	for name, row in rows.items():
+		values.append(
+			[name, now, now, user, user]
+			+ [row.get(c) for c in columns[5:]]
+		)
+
+	placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+	for start in range(0, len(values), 1000):
+		chunk = values[start : start + 1000]
+		frappe.db.sql(
+			"""
+			INSERT INTO `tabMilk Quality Snapshot` ({columns})
+			VALUES {placeholders}
+			ON DUPLICATE KEY UPDATE {updates}
+			""".format(
+				columns=", ".join(f"`{c}`" for c in columns),
+				placeholders=", ".join([placeholders] * len(chunk)),
+				updates=", ".join(_get_update_expression(c, forward_only) for c in update_columns),
+			),
+			[value for row in chunk for value in row],
+		)
+
+
+def _get_update_expression(column, forward_only):
+	if not forward_only:
+		return f"`{column}` = VALUES(`{column}`)"
+
+	return (
+		f"`{column}` = IF("
+		"TIMESTAMP(VALUES(`posting_date`), VALUES(`posting_time`)) >= TIMESTAMP(`posting_date`, `posting_time`), "
+		f"VALUES(`{column}`), `{column}`)"
+	)
@@ -0,0 +1,20 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+# For license information, please see license.txt
+
+import json
+
+from frappe.model.document import Document
+
+from sheetal_supply_chain.py.milk_pricing import clear_rate_cards, compile_rate_matrix
+
+
+class MilkRateMatrix(Document):
+	def validate(self):
+		# Sorted FAT / SNF breakpoints + rate grid, so pricing never walks the slab rows
+		self.compiled_matrix = json.dumps(compile_rate_matrix(self.slabs))
+
+	def on_update(self):
+		clear_rate_cards()
+
+	def on_trash(self):
+		clear_rate_cards()
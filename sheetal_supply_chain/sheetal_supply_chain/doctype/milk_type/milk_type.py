@@ -4,6 +4,12 @@
 # import frappe
 from frappe.model.document import Document
 
+from sheetal_supply_chain.py.milk_pricing import clear_rate_cards
+
 
 class MilkType(Document):
-	pass
+	def on_update(self):
+		clear_rate_cards()
+
+	def on_trash(self):
+		clear_rate_cards()
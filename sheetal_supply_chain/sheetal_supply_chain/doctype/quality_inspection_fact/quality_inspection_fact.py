@@ -0,0 +1,191 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+
+from sheetal_supply_chain.sheetal_supply_chain.doctype.specification_alias.specification_alias import (
+	get_specification_aliases,
+	normalise_specification,
+)
+
+FACT_DOCTYPE = "Quality Inspection Fact"
+
+# Facts written per INSERT ... ON DUPLICATE KEY UPDATE / inspections per rebuild page
+FACT_CHUNK_SIZE = 1000
+
+# Measurements stored as numbers (reading_1, else reading_value)
+NUMERIC_PARAMETERS = ("temp", "fat", "snf", "lr", "acidity", "br", "rm", "wash_rm")
+
+# Tests and timings stored as recorded (reading_1, else reading_value: Ok / Not Ok, 4:30, ...)
+TEST_PARAMETERS = (
+	"alcohol", "ammonia", "mbrt", "sucrose", "starch", "neutralizer", "detergent", "urea", "maltose", "channa",
+)
+
+FACT_HEADER_FIELDS = (
+	"quality_inspection",
+	"inspection_type",
+	"report_date",
+	"item_code",
+	"reference_type",
+	"reference_name",
+	"supplier",
+	"warehouse",
+)
+
+FACT_INDEXES = {
+	"supplier_report_date_index": ["supplier", "report_date"],
+	"item_report_date_index": ["item_code", "report_date"],
+}
+
+
+class QualityInspectionFact(Document):
+	pass
+
+
+def on_doctype_update():
+	for index_name, columns in FACT_INDEXES.items():
+		frappe.db.add_index(FACT_DOCTYPE, columns, index_name)
+
+
+def get_fact_readings(quality_inspection, columns=("fat", "snf", "lr")):
+	"""Typed readings of a submitted inspection as a primary-key read, or None (draft / cancelled)."""
+	return frappe.db.get_value(FACT_DOCTYPE, quality_inspection, list(columns), as_dict=True)
+
+
+def build_fact_rows(quality_inspections):
+	"""Pivot the readings of submitted inspections into {qi name: fact row} with two queries."""
+	if not quality_inspections:
+		return {}
+
+	headers = frappe.db.sql(
+		"""
+		SELECT
+			qi.name AS quality_inspection, qi.inspection_type, qi.report_date, qi.item_code,
+			qi.reference_type, qi.reference_name, pr.supplier, qi.custom_warehouse AS warehouse
+		FROM `tabQuality Inspection` qi
+		LEFT JOIN `tabPurchase Receipt` pr
+			ON qi.reference_type = 'Purchase Receipt' AND pr.name = qi.reference_name
+		WHERE qi.docstatus = 1 AND qi.name IN %(names)s
+		""",
+		{"names": list(quality_inspections)},
+		as_dict=True,
+	)
+
+	rows = {}
+	for header in headers:
+		row = dict.fromkeys(NUMERIC_PARAMETERS)
+		row.update(dict.fromkeys(TEST_PARAMETERS, ""))
+		row.update(header)
+		rows[header.quality_inspection] = row
+
+	if not rows:
+		return {}
+
+	aliases = get_specification_aliases()
+
+	# Later rows of the same specification win, as on the Purchase Receipt form
+	for reading in frappe.db.sql(
+		"""
+		SELECT parent, specification, reading_1, reading_value
+		FROM `tabQuality Inspection Reading`
+		WHERE parenttype = 'Quality Inspection' AND parent IN %(parents)s
+		ORDER BY parent, idx
+		""",
+		{"parents": list(rows)},
+		as_dict=True,
+	):
+		column = aliases.get(normalise_specification(reading.specification))
+		if not column:
+			continue
+
+		value = reading.reading_1 or reading.reading_value or ""
+		rows[reading.parent][column] = parse_numeric_reading(value) if column in NUMERIC_PARAMETERS else value
+
+	return rows
+
+
+def parse_numeric_reading(value):
+	"""Float of a recorded reading ("3.50" -> 3.5); None when blank or not a number."""
+	try:
+		return float(str(value).strip())
+	except ValueError:
+		return None
+
+
+def sync_quality_inspection_facts(quality_inspections):
+	"""Write the facts of submitted inspections and drop those of the others (cancelled / deleted)."""
+	quality_inspections = list(set(quality_inspections))
+	rows = build_fact_rows(quality_inspections)
+
+	stale = [name for name in quality_inspections if name not in rows]
+	if stale:
+		delete_quality_inspection_facts(stale)
+
+	_upsert_facts(rows)
+
+
+def delete_quality_inspection_facts(quality_inspections):
+	frappe.db.delete(FACT_DOCTYPE, {"name": ["in", list(quality_inspections)]})
+
+
+def rebuild_quality_inspection_facts(chunk_size=FACT_CHUNK_SIZE):
+	"""Backfill: regenerate the fact of every submitted inspection, a page of inspections at a time."""
+	frappe.db.sql(
+		"""
+		DELETE fact FROM `tabQuality Inspection Fact` fact
+		LEFT JOIN `tabQuality Inspection` qi ON qi.name = fact.name AND qi.docstatus = 1
+		WHERE qi.name IS NULL
+		"""
+	)
+
+	after = ""
+	while True:
+		names = frappe.db.sql(
+			f"""
+			SELECT name FROM `tabQuality Inspection`
+			WHERE docstatus = 1 AND name > %(after)s
+			ORDER BY name
+			LIMIT {int(chunk_size)}
+			""",
+			{"after": after},
+			pluck=True,
+		)
+		if not names:
+			return
+
+		_upsert_facts(build_fact_rows(names))
+		after = names[-1]
+
+
+def _upsert_facts(rows):
+	if not rows:
+		return
+
+	now = now_datetime()
+	user = frappe.session.user
+
+	columns = ["name", "creation", "modified", "owner", "modified_by", *FACT_HEADER_FIELDS, *NUMERIC_PARAMETERS, *TEST_PARAMETERS]
+	update_columns = [c for c in columns if c not in ("name", "creation", "owner")]
+
+	values = []
+	for name, row in rows.items():
+		values.append([name, now, now, user, user] + [row.get(c) for c in columns[5:]])
+
+	placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+	for start in range(0, len(values), FACT_CHUNK_SIZE):
+		chunk = values[start : start + FACT_CHUNK_SIZE]
+		frappe.db.sql(
+			"""
+			INSERT INTO `tabQuality Inspection Fact` ({columns})
+			VALUES {placeholders}
+			ON DUPLICATE KEY UPDATE {updates}
+			""".format(
+				columns=", ".join(f"`{c}`" for c in columns),
+				placeholders=", ".join([placeholders] * len(chunk)),
+				updates=", ".join(f"`{c}` = VALUES(`{c}`)" for c in update_columns),
+			),
+			[value for row in chunk for value in row],
+		)
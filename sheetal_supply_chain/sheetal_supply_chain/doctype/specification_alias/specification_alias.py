@@ -0,0 +1,113 @@
+# Copyright (c) 2026, Sanskar Technolab Pvt Ltd and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import flt
+
+ALIAS_DOCTYPE = "Specification Alias"
+SPECIFICATION_ALIAS_CACHE_KEY = "sheetal_specification_aliases"
+
+# Spellings recognised without a registry entry: normalised specification -> Parameter
+BUILTIN_ALIASES = {
+	"TEMP": "Temp",
+	"TEMPERATURE": "Temp",
+	"FAT": "Fat",
+	"SNF": "SNF",
+	"S.N.F.": "SNF",
+	"S N F": "SNF",
+	"LR": "LR",
+	"L.R.": "LR",
+	"LACTOMETER READING": "LR",
+	"ALCOHOL": "Alcohol",
+	"ACIDITY": "Acidity",
+	"AMMONIA": "Ammonia",
+	"MBRT": "MBRT",
+	"SUCROSE": "Sucrose",
+	"STARCH": "Starch",
+	"NEUTRALIZER": "Neutralizer",
+	"DETERGENT": "Detergent",
+	"UREA": "Urea",
+	"MALTOSE": "Maltose",
+	"BR": "BR",
+	"RM": "RM",
+	"WASH RM": "Wash RM",
+	"CHANNA": "Channa",
+}
+
+
+class SpecificationAlias(Document):
+	def validate(self):
+		self.specification = " ".join((self.specification or "").split())
+
+		duplicate = next(
+			(
+				name
+				for name in frappe.get_all(ALIAS_DOCTYPE, filters={"name": ["!=", self.name]}, pluck="name")
+				if normalise_specification(name) == normalise_specification(self.specification)
+			),
+			None,
+		)
+		if duplicate:
+			frappe.throw(_("Specification {0} is already mapped by alias {1}").format(self.specification, duplicate))
+
+	def on_update(self):
+		clear_specification_aliases()
+
+	def on_trash(self):
+		clear_specification_aliases()
+
+
+def normalise_specification(specification):
+	"""Upper case with surrounding and repeated spaces removed: " s.n.f. " -> "S.N.F."."""
+	return " ".join((specification or "").upper().split())
+
+
+def get_specification_aliases():
+	"""
+	Compiled {normalised specification: parameter column} lookup, e.g.
+	{"S.N.F.": "snf"}. Built-in spellings are merged with the registry
+	(registry entries win), cached in Redis and kept for the rest of the
+	request; cleared whenever an alias is saved or deleted.
+	"""
+	return frappe.cache.get_value(SPECIFICATION_ALIAS_CACHE_KEY, _compile_specification_aliases)
+
+
+def _compile_specification_aliases():
+	aliases = dict(BUILTIN_ALIASES)
+	for alias in frappe.get_all(ALIAS_DOCTYPE, fields=["specification", "parameter"]):
+		aliases[normalise_specification(alias.specification)] = alias.parameter
+
+	return {specification: frappe.scrub(parameter) for specification, parameter in aliases.items()}
+
+
+def get_parameter_column(specification):
+	"""Parameter column (fat, snf, lr, ...) of a Quality Inspection specification, or None."""
+	return get_specification_aliases().get(normalise_specification(specification))
+
+
+def get_numeric_readings(readings):
+	"""{parameter column: flt(reading_1)} of Quality Inspection Reading rows; later rows win."""
+	aliases = get_specification_aliases()
+	values = {}
+
+	for reading in readings:
+		column = aliases.get(normalise_specification(reading.get("specification")))
+		if column:
+			values[column] = flt(reading.get("reading_1"))
+
+	return values
+
+
+def clear_specification_aliases():
+	frappe.cache.delete_value(SPECIFICATION_ALIAS_CACHE_KEY)
+
+	# Facts were pivoted with the old spellings
+	frappe.enqueue(
+		"sheetal_supply_chain.sheetal_supply_chain.doctype.quality_inspection_fact.quality_inspection_fact.rebuild_quality_inspection_facts",
+		queue="long",
+		job_id="rebuild_quality_inspection_facts",
+		deduplicate=True,
+		enqueue_after_commit=True,
+	)
@@ -171,6 +171,36 @@ frappe.query_reports["Milk Quality Ledger"] = {
 		},
 		
 	],
+	onload(report) {
+		// Large ranges: stream the ledger into a CSV / Excel file in the background
+		report.page.add_inner_button(__("Export in Background"), () => {
+			frappe.prompt(
+				{
+					fieldname: "file_format",
+					label: __("File Format"),
+					fieldtype: "Select",
+					options: ["CSV", "Excel"],
+					default: "CSV",
+					reqd: 1
+				},
+				(values) => {
+					frappe.call({
+						method: "sheetal_supply_chain.sheetal_supply_chain.report.milk_quality_ledger.milk_quality_ledger.export_milk_quality_ledger",
+						args: {
+							filters: report.get_values(),
+							file_format: values.file_format
+						}
+					}).then(r => {
+						if (r.message) {
+							frappe.show_alert({ message: r.message, indicator: "blue" });
+						}
+					});
+				},
+				__("Export Milk Quality Ledger"),
+				__("Export")
+			);
+		});
+	},
 	formatter(value, row, column, data, default_formatter) {
 		// Apply custom formatting
 		value = default_formatter(value, row, column, data);
@@ -2,11 +2,19 @@
 # License: MIT
 
 import frappe
+import csv
+import hashlib
+import os
 from frappe import _
 from frappe.utils import flt, get_datetime, cint
-from frappe.query_builder import DocType
+from frappe.query_builder import CustomFunction, DocType
 from frappe.query_builder.functions import Coalesce
 
+REPORT_NAME = "Milk Quality Ledger"
+EXPORT_FORMATS = ("CSV", "Excel")
+
+Timestamp = CustomFunction("TIMESTAMP", ["date", "time"])
+
 
 def execute(filters=None):
     """Main entry point for the report"""
@@ -16,8 +24,7 @@ def execute(filters=None):
     validate_filters(filters)
     
     columns = get_columns()
-    entries = get_entries(filters)
-    data = [build_row(e, filters) for e in entries]
+    data = list(iter_rows(filters))
     
     return columns, data
 
@@ -193,72 +200,89 @@ def get_columns():
     ]
 
 
-def get_entries(filters):
-    """Fetch ledger entries based on filters with proper error handling"""
-    try:
-        MQLE = DocType("Milk Quality Ledger Entry")
-        Item = DocType("Item")
-        
-        # Build base query with LEFT JOIN to handle items without names
-        query = (
-            frappe.qb.from_(MQLE)
-            .left_join(Item).on(Item.name == MQLE.item_code)
-            .select(
-                MQLE.posting_date,
-                Coalesce(MQLE.posting_time, "00:00:00").as_("posting_time"),
-                MQLE.item_code,
-                Coalesce(Item.item_name, MQLE.item_code).as_("item_name"),
-                MQLE.warehouse,
-                MQLE.batch_no,
-                MQLE.voucher_type,
-                MQLE.voucher_no,
-                Coalesce(MQLE.uom, "").as_("uom"),
-                Coalesce(MQLE.qty_in_liter, 0).as_("qty_in_liter"),
-                Coalesce(MQLE.qty_after_transaction_in_liter, 0).as_("qty_after_transaction_in_liter"),
-                Coalesce(MQLE.qty_in_kg, 0).as_("qty_in_kg"),
-                Coalesce(MQLE.qty_after_transaction_in_kg, 0).as_("qty_after_transaction_in_kg"),
-                Coalesce(MQLE.fat_per, 0).as_("fat_per"),
-                Coalesce(MQLE.fat, 0).as_("fat"),
-                Coalesce(MQLE.snf_per, 0).as_("snf_per"),
-                Coalesce(MQLE.snf, 0).as_("snf"),
-                Coalesce(Item.stock_uom, "").as_("stock_uom"),
-            )
-            .where(
-                (MQLE.company == filters.company)
-                & (MQLE.is_cancelled == 0)
-                & (MQLE.posting_date >= filters.from_date)
-                & (MQLE.posting_date <= filters.to_date)
-            )
-            .orderby(MQLE.posting_date)
-            .orderby(MQLE.posting_time)
-            .orderby(MQLE.creation)
+def get_entries_query(filters):
+    """Ledger entry query for the filters, in posting order"""
+    MQLE = DocType("Milk Quality Ledger Entry")
+    Item = DocType("Item")
+    
+    # Build base query with LEFT JOIN to handle items without names
+    query = (
+        frappe.qb.from_(MQLE)
+        .left_join(Item).on(Item.name == MQLE.item_code)
+        .select(
+            # Posting datetime is built by the database, not parsed per row
+            Timestamp(MQLE.posting_date, Coalesce(MQLE.posting_time, "00:00:00")).as_("date"),
+            MQLE.item_code,
+            Coalesce(Item.item_name, MQLE.item_code).as_("item_name"),
+            MQLE.warehouse,
+            MQLE.batch_no,
+            MQLE.voucher_type,
+            MQLE.voucher_no,
+            Coalesce(MQLE.uom, "").as_("uom"),
+            Coalesce(MQLE.qty_in_liter, 0).as_("qty_in_liter"),
+            Coalesce(MQLE.qty_after_transaction_in_liter, 0).as_("qty_after_transaction_in_liter"),
+            Coalesce(MQLE.qty_in_kg, 0).as_("qty_in_kg"),
+            Coalesce(MQLE.qty_after_transaction_in_kg, 0).as_("qty_after_transaction_in_kg"),
+            Coalesce(MQLE.fat_per, 0).as_("fat_per"),
+            Coalesce(MQLE.fat, 0).as_("fat"),
+            Coalesce(MQLE.snf_per, 0).as_("snf_per"),
+            Coalesce(MQLE.snf, 0).as_("snf"),
+            Coalesce(Item.stock_uom, "").as_("stock_uom"),
         )
-        
-        # Apply optional filters
-        if filters.get("item_code"):
-            item_codes = filters.item_code if isinstance(filters.item_code, list) else [filters.item_code]
-            query = query.where(MQLE.item_code.isin(item_codes))
-        
-        if filters.get("warehouse"):
-            warehouses = filters.warehouse if isinstance(filters.warehouse, list) else [filters.warehouse]
-            query = query.where(MQLE.warehouse.isin(warehouses))
-        
-        if filters.get("item_group"):
-            query = query.where(Item.item_group == filters.item_group)
-        
-        if filters.get("brand"):
-            query = query.where(Item.brand == filters.brand)
-        
-        if filters.get("voucher_type"):
-            query = query.where(MQLE.voucher_type == filters.voucher_type)
-        
-        if filters.get("voucher_no"):
-            query = query.where(MQLE.voucher_no == filters.voucher_no)
-        
-        if filters.get("batch_no"):
-            query = query.where(MQLE.batch_no == filters.batch_no)
-        
-        return query.run(as_dict=True)
+        .where(
+            (MQLE.company == filters.company)
+            & (MQLE.is_cancelled == 0)
+            & (MQLE.posting_date >= filters.from_date)
+            & (MQLE.posting_date <= filters.to_date)
+        )
+        .orderby(MQLE.posting_date)
+        .orderby(MQLE.posting_time)
+        .orderby(MQLE.creation)
+    )
+    
+    # Apply optional filters
+    if filters.get("item_code"):
+        item_codes = filters.item_code if isinstance(filters.item_code, list) else [filters.item_code]
+        query = query.where(MQLE.item_code.isin(item_codes))
+    
+    if filters.get("warehouse"):
+        warehouses = filters.warehouse if isinstance(filters.warehouse, list) else [filters.warehouse]
+        query = query.where(MQLE.warehouse.isin(warehouses))
+    
+    if filters.get("item_group"):
+        query = query.where(Item.item_group == filters.item_group)
+    
+    if filters.get("brand"):
+        query = query.where(Item.brand == filters.brand)
+    
+    if filters.get("voucher_type"):
+        query = query.where(MQLE.voucher_type == filters.voucher_type)
+    
+    if filters.get("voucher_no"):
+        query = query.where(MQLE.voucher_no == filters.voucher_no)
+    
+    if filters.get("batch_no"):
+        query = query.where(MQLE.batch_no == filters.batch_no)
+    
+    return query
+
+
+def iter_rows(filters):
+    """
+    Stream report rows through a server-side (unbuffered) cursor.
+
+    Entries are fetched from the database as they are consumed and turned
+    into report rows one at a time, so neither the raw result set nor a
+    second list of rows is built here. No other query may run on the
+    connection until the iterator is exhausted.
+    """
+    query = get_entries_query(filters)
+    use_stock_uom = cint(filters.get("include_uom"))
+
+    try:
+        with frappe.db.unbuffered_cursor():
+            for entry in query.run(as_dict=True, as_iterator=True):
+                yield build_row(entry, use_stock_uom)
     
     except Exception as e:
         frappe.log_error(
@@ -268,72 +292,116 @@ def get_entries(filters):
         frappe.throw(_("Error fetching ledger entries: {0}").format(str(e)))
 
 
-def build_row(e, filters):
+def build_row(e, use_stock_uom=False):
     """Build a single row with proper null handling and formatting"""
-    try:
-        # Handle posting time with fallback
-        posting_time = e.get("posting_time") or "00:00:00"
-        posting_date = e.get("posting_date")
-        
-        # Safely construct datetime
-        if posting_date:
-            try:
-                date = get_datetime(f"{posting_date} {posting_time}")
-            except Exception:
-                date = get_datetime(posting_date)
-        else:
-            date = None
-        
-        # Determine UOM to display
-        include_uom = cint(filters.get("include_uom"))
-        if include_uom and e.get("stock_uom"):
-            uom = e.get("stock_uom")
-        else:
-            uom = e.get("uom") or ""
-        
-        return {
-            "date": date,
-            "item_code": e.get("item_code") or "",
-            "item_name": e.get("item_name") or "",
-            "warehouse": e.get("warehouse") or "",
-            "batch_no": e.get("batch_no") or "",
-            "voucher_type": e.get("voucher_type") or "",
-            "voucher_no": e.get("voucher_no") or "",
-            "uom": uom,
-            "qty_in_liter": flt(e.get("qty_in_liter", 0), 3),
-            "qty_after_transaction_in_liter": flt(e.get("qty_after_transaction_in_liter", 0), 3),
-            "qty_in_kg": flt(e.get("qty_in_kg", 0), 3),
-            "qty_after_transaction_in_kg": flt(e.get("qty_after_transaction_in_kg", 0), 3),
-            "fat_per": flt(e.get("fat_per", 0), 3),
-            "fat": flt(e.get("fat", 0), 3),
-            "snf_per": flt(e.get("snf_per", 0), 3),
-            "snf": flt(e.get("snf", 0), 3),
-        }
+    # Determine UOM to display
+    if use_stock_uom and e.stock_uom:
+        uom = e.stock_uom
+    else:
+        uom = e.uom or ""
     
-    except Exception as ex:
-        frappe.log_error(
-            message=f"Error building row: {frappe.get_traceback()}",
-            title="Milk Quality Ledger Row Build Error"
-        )
-        # Return a row with safe defaults
-        return {
-            "date": None,
-            "item_code": e.get("item_code", ""),
-            "item_name": e.get("item_name", ""),
-            "warehouse": "",
-            "batch_no": "",
-            "voucher_type": "",
-            "voucher_no": "",
-            "uom": "",
-            "qty_in_liter": 0.0,
-            "qty_after_transaction_in_liter": 0.0,
-            "qty_in_kg": 0.0,
-            "qty_after_transaction_in_kg": 0.0,
-            "fat_per": 0.0,
-            "fat": 0.0,
-            "snf_per": 0.0,
-            "snf": 0.0,
+    return {
+        "date": e.date,
+        "item_code": e.item_code or "",
+        "item_name": e.item_name or "",
+        "warehouse": e.warehouse or "",
+        "batch_no": e.batch_no or "",
+        "voucher_type": e.voucher_type or "",
+        "voucher_no": e.voucher_no or "",
+        "uom": uom,
+        "qty_in_liter": flt(e.qty_in_liter, 3),
+        "qty_after_transaction_in_liter": flt(e.qty_after_transaction_in_liter, 3),
+        "qty_in_kg": flt(e.qty_in_kg, 3),
+        "qty_after_transaction_in_kg": flt(e.qty_after_transaction_in_kg, 3),
+        "fat_per": flt(e.fat_per, 3),
+        "fat": flt(e.fat, 3),
+        "snf_per": flt(e.snf_per, 3),
+        "snf": flt(e.snf, 3),
+    }
+
+
+#? Export the whole ledger for the filters as CSV / Excel in a background job (for ranges too large for the grid).
+
+@frappe.whitelist()
+def export_milk_quality_ledger(filters, file_format="CSV"):
+    if not frappe.get_cached_doc("Report", REPORT_NAME).is_permitted():
+        frappe.throw(_("Not permitted to export {0}").format(REPORT_NAME), frappe.PermissionError)
+
+    if file_format not in EXPORT_FORMATS:
+        frappe.throw(_("File Format must be one of {0}").format(", ".join(EXPORT_FORMATS)))
+
+    filters = frappe._dict(frappe.parse_json(filters) or {})
+    validate_filters(filters)
+
+    frappe.enqueue(
+        write_ledger_export,
+        queue="long",
+        timeout=3600,
+        filters=filters,
+        file_format=file_format,
+    )
+
+    return _("The export has been queued. You will be notified with a download link when it is ready.")
+
+
+def write_ledger_export(filters, file_format="CSV"):
+    """Stream the report rows into a private file and attach it as a File document"""
+    filters = frappe._dict(filters)
+    columns = get_columns()
+    fieldnames = [column["fieldname"] for column in columns]
+    header = [column["label"] for column in columns]
+
+    extension = "csv" if file_format == "CSV" else "xlsx"
+    file_name = f"milk_quality_ledger_{frappe.generate_hash(length=10)}.{extension}"
+    path = frappe.get_site_path("private", "files", file_name)
+
+    rows = ([row[fieldname] for fieldname in fieldnames] for row in iter_rows(filters))
+
+    if file_format == "CSV":
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+    else:
+        from openpyxl import Workbook
+
+        # Write-only workbooks flush rows to disk instead of keeping the sheet in memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(REPORT_NAME)
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+
+    file_doc = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": 1,
+            "file_size": os.path.getsize(path),
+            # Hashed in blocks; File would otherwise read the whole export into memory
+            "content_hash": get_file_hash(path),
         }
+    ).insert(ignore_permissions=True)
+
+    frappe.publish_realtime(
+        "msgprint",
+        _("Milk Quality Ledger export is ready: {0}").format(
+            f'<a href="{file_doc.file_url}" target="_blank">{file_doc.file_name}</a>'
+        ),
+        user=frappe.session.user,
+    )
+
+    return file_doc.name
+
+
+def get_file_hash(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
         
         
 #? Return unique item codes present in Milk Quality Ledger Entry.
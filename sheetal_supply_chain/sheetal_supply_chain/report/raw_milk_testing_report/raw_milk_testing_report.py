@@ -4,6 +4,11 @@
 
 import frappe
 
+from sheetal_supply_chain.sheetal_supply_chain.doctype.specification_alias.specification_alias import (
+    get_parameter_column,
+)
+
+
 def execute(filters=None):
     columns = get_columns()
     data = get_data(filters)
@@ -49,123 +54,111 @@ def get_columns():
 
 
 def get_data(filters):
-    # Base filter: Only submitted QI
-    qi_filters = {
-        "docstatus": 1,  # submitted
-        "report_date": ["between", [filters.from_date, filters.to_date]]
-    }
+    # Until the build_quality_inspection_facts patch has run, read the inspections themselves
+    if not frappe.db.sql("SELECT 1 FROM `tabQuality Inspection Fact` LIMIT 1"):
+        return get_data_from_inspections(filters)
+
+    conditions = ["f.report_date BETWEEN %(from_date)s AND %(to_date)s"]
 
     # Additional Filters
     if filters.get("quality_inspection"):
-        qi_filters["name"] = filters.quality_inspection
+        conditions.append("f.name = %(quality_inspection)s")
 
     if filters.get("purchase_receipt"):
-        qi_filters["reference_name"] = filters.purchase_receipt
-
-    # Supplier filter will apply after PR fetch
-
-    qi_list = frappe.get_all(
-        "Quality Inspection",
-        filters=qi_filters,
-        fields=[
-            "name",
-            "reference_name",
-            "custom_in_time",
-            "custom_out_time",
-            "custom_mbrt_start_time",
-            "custom_mbrt_end_time",
-            "custom_total_mbrt_time",
-            "remarks"
-        ]
+        conditions.append("f.reference_name = %(purchase_receipt)s")
+
+    # Supplier of the Purchase Receipt as it is now (the fact keeps the one at QI submit)
+    if filters.get("supplier"):
+        conditions.append("pr.supplier = %(supplier)s")
+
+    # Submitted inspections with readings already pivoted (Quality Inspection Fact)
+    # plus their Quality Inspection and Purchase Receipt details, in one query
+    return frappe.db.sql(
+        f"""
+        SELECT
+            f.name AS qi_id,
+            {", ".join(QI_FIELDS)},
+            {", ".join(f"f.{column}" for column in PARAMETER_COLUMNS)}
+        FROM `tabQuality Inspection Fact` f
+        INNER JOIN `tabQuality Inspection` qi ON qi.name = f.name
+        LEFT JOIN `tabPurchase Receipt` pr ON pr.name = f.reference_name
+        WHERE {" AND ".join(conditions)}
+        ORDER BY qi.modified DESC
+        """,
+        filters,
+        as_dict=True,
     )
 
 
-    data = []
+# ! Report rows straight from Quality Inspection and its readings (fact table not built yet)
+def get_data_from_inspections(filters):
+    conditions = ["qi.docstatus = 1", "qi.report_date BETWEEN %(from_date)s AND %(to_date)s"]
 
-    for qi in qi_list:
-        row = {
-            "qi_id": qi.name,
-            "in_time": qi.custom_in_time,
-            "out_time": qi.custom_out_time,
-            "mbrt_start_time": qi.custom_mbrt_start_time,
-            "mbrt_end_time": qi.custom_mbrt_end_time,
-            "mbrt_total_time": qi.custom_total_mbrt_time,
-            "remarks": qi.remarks
-        }
-
-
-        # Purchase Receipt details
-        pr = None
-        if qi.reference_name:
-            pr = frappe.db.get_value(
-                    "Purchase Receipt",
-                    qi.reference_name,
-                    [
-                        "name",
-                        "custom_tanker_no",
-                        "supplier",
-                        "custom_supplier_code", 
-                        "custom_net_weight"
-                    ],
-                    as_dict=True
-                )
-
-
-        # If supplier filter applied, skip mismatch
-        if filters.get("supplier") and (not pr or pr.supplier != filters.supplier):
-            continue
-
-        if pr:
-            row.update({
-                "pr_id": pr.name,
-                "tanker_no": pr.custom_tanker_no,
-                "supplier": pr.supplier,
-                "supplier_code": pr.custom_supplier_code,  
-                "net_weight": pr.custom_net_weight
-            })
-
-        # QI Readings
-        readings = frappe.get_all(
-            "Quality Inspection Reading",
-            filters={"parent": qi.name},
-            fields=["specification", "reading_1", "reading_value"]
-        )
-
-        row.update(extract_parameters(readings))
-        data.append(row)
-
-    return data
-
-
-def extract_parameters(readings):
-    param_map = {
-        "Temp": "temp",
-        "Fat": "fat",
-        "LR": "lr",
-        "SNF": "snf",
-        "Alcohol": "alcohol",
-        "Acidity": "acidity",
-        "Ammonia": "ammonia",
-        "MBRT": "mbrt",
-        "Sucrose": "sucrose",
-        "Starch": "starch",
-        "Neutralizer": "neutralizer",
-        "Detergent": "detergent",
-        "Urea": "urea",
-        "Maltose": "maltose",
-        "BR": "br",
-        "RM": "rm",
-        "Wash RM": "wash_rm",
-        "Channa": "channa",
-    }
-
-    result = {v: "" for v in param_map.values()}
-
-    for r in readings:
-        if r.specification in param_map:
-            col = param_map[r.specification]
-            value = r.reading_1 or r.reading_value or ""
-            result[col] = value
-
-    return result
+    if filters.get("quality_inspection"):
+        conditions.append("qi.name = %(quality_inspection)s")
 
+    if filters.get("purchase_receipt"):
+        conditions.append("qi.reference_name = %(purchase_receipt)s")
+
+    if filters.get("supplier"):
+        conditions.append("pr.supplier = %(supplier)s")
+
+    qi_list = frappe.db.sql(
+        f"""
+        SELECT
+            qi.name AS qi_id,
+            {", ".join(QI_FIELDS)}
+        FROM `tabQuality Inspection` qi
+        LEFT JOIN `tabPurchase Receipt` pr ON pr.name = qi.reference_name
+        WHERE {" AND ".join(conditions)}
+        ORDER BY qi.modified DESC
+        """,
+        filters,
+        as_dict=True,
+    )
+
+    if not qi_list:
+        return []
+
+    # QI Readings of all inspections in one query, pivoted into parameter columns
+    data = {qi.qi_id: qi for qi in qi_list}
+    for qi in qi_list:
+        qi.update(dict.fromkeys(PARAMETER_COLUMNS, ""))
+
+    for r in frappe.db.sql(
+        """
+        SELECT parent, specification, reading_1, reading_value
+        FROM `tabQuality Inspection Reading`
+        WHERE parenttype = 'Quality Inspection' AND parent IN %(parents)s
+        ORDER BY parent, idx
+        """,
+        {"parents": list(data)},
+        as_dict=True,
+    ):
+        column = get_parameter_column(r.specification)
+        if column in PARAMETER_COLUMNS:
+            data[r.parent][column] = r.reading_1 or r.reading_value or ""
+
+    return qi_list
+
+
+# Quality Inspection and Purchase Receipt columns of the report
+QI_FIELDS = (
+    "qi.custom_in_time AS in_time",
+    "qi.custom_out_time AS out_time",
+    "qi.custom_mbrt_start_time AS mbrt_start_time",
+    "qi.custom_mbrt_end_time AS mbrt_end_time",
+    "qi.custom_total_mbrt_time AS mbrt_total_time",
+    "qi.remarks",
+    "pr.name AS pr_id",
+    "pr.custom_tanker_no AS tanker_no",
+    "pr.supplier",
+    "pr.custom_supplier_code AS supplier_code",
+    "pr.custom_net_weight AS net_weight",
+)
+
+# Parameter columns of the report, as stored on Quality Inspection Fact
+PARAMETER_COLUMNS = (
+    "temp", "fat", "lr", "snf", "alcohol", "acidity", "ammonia", "mbrt", "sucrose",
+    "starch", "neutralizer", "detergent", "urea", "maltose", "br", "rm", "wash_rm", "channa",
+)